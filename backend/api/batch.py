@@ -0,0 +1,200 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+
+from .metrics import ROUTE_LEGS, timed
+from .osrm import OSRMError
+
+# Defaults for batch planning
+DEFAULT_TABLE_MAX_SIZE = 100  # Coordinates per OSRM table request (public server limit)
+DEFAULT_PROCESS_WORKERS = os.cpu_count() or 2
+DEFAULT_PROCESS_MIN_ITEMS = 8  # Smaller batches are planned inline
+
+_process_pool = None
+_process_pool_lock = threading.Lock()
+
+
+def _init_worker(settings_module):
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', settings_module)
+    import django
+    django.setup()
+
+
+def _plan_item(args):
+    """Build stops and ELD logs for one batch item inside a worker process"""
+    data, waypoints, legs = args
+    from .views import RouteCalculator
+    try:
+        return {'status': 'ok', 'result': RouteCalculator().build_result(data, waypoints, legs)}
+    except Exception as exc:
+        return {'status': 'error', 'errors': {'detail': str(exc)}}
+
+
+def get_process_pool():
+    """Return the shared process pool for CPU-bound stop and log generation"""
+    global _process_pool
+    if _process_pool is None:
+        with _process_pool_lock:
+            if _process_pool is None:
+                _process_pool = ProcessPoolExecutor(
+                    max_workers=getattr(settings, 'BATCH_PROCESS_WORKERS', DEFAULT_PROCESS_WORKERS),
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=_init_worker,
+                    initargs=(os.environ.get('DJANGO_SETTINGS_MODULE', 'api.settings'),),
+                )
+    return _process_pool
+
+
+def _chunks(items, size):
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+class BatchPlanner:
+    """Plan many trips at once, sharing legs and using OSRM table calls"""
+
+    def __init__(self, calculator):
+        self.calculator = calculator
+        self.table_max_size = getattr(settings, 'OSRM_TABLE_MAX_SIZE', DEFAULT_TABLE_MAX_SIZE)
+        self.process_min_items = getattr(settings, 'BATCH_PROCESS_MIN_ITEMS', DEFAULT_PROCESS_MIN_ITEMS)
+        self.process_workers = getattr(settings, 'BATCH_PROCESS_WORKERS', DEFAULT_PROCESS_WORKERS)
+        self.stats = {'unique_legs': 0, 'cached_legs': 0, 'table_requests': 0, 'fallback_legs': 0}
+
+    def plan(self, items):
+        """Plan validated trip payloads; returns one result per item, in input order"""
+        return list(self.iter_plan(items))
+
+    def iter_plan(self, items):
+        """Plan validated trip payloads, yielding each result in input order once it is ready"""
+        waypoints = [self.calculator.get_waypoints(data) for data in items]
+
+        # Deduplicate legs across the whole batch using the route cache key
+        cache = self.calculator.route_cache
+        unique = {}
+        item_keys = []
+        for points in waypoints:
+            keys = []
+            for origin, destination in zip(points, points[1:]):
+                key = cache.make_key(origin, destination)
+                unique.setdefault(key, (origin, destination))
+                keys.append(key)
+            item_keys.append(keys)
+        self.stats['unique_legs'] = len(unique)
+
+        with timed('batch_routing'):
+            legs = self.fetch_legs(unique)
+        jobs = [
+            (data, points, [legs[key] for key in keys])
+            for data, points, keys in zip(items, waypoints, item_keys)
+        ]
+
+        with timed('batch_schedule'):
+            if len(jobs) < self.process_min_items:
+                yield from map(_plan_item, jobs)
+                return
+            chunksize = max(1, len(jobs) // (4 * self.process_workers))
+            yield from get_process_pool().map(_plan_item, jobs, chunksize=chunksize)
+
+    def fetch_legs(self, unique):
+        """Resolve unique legs from the route cache, then OSRM table blocks, then the fallback"""
+        if self.calculator.routing_backend == 'local':
+            return {key: self.calculator.get_route(*pair) for key, pair in unique.items()}
+
+        cache = self.calculator.route_cache
+        legs = {}
+        missing = {}
+        for key, (origin, destination) in unique.items():
+            cached = cache.get(key)
+            if cached is not None:
+                legs[key] = cached
+            else:
+                missing[key] = (origin, destination)
+        self.stats['cached_legs'] = len(legs)
+        ROUTE_LEGS.inc(len(legs), source='cache')
+
+        if missing:
+            from .views import get_leg_executor
+            blocks = self.table_blocks(missing)
+            self.stats['table_requests'] = len(blocks)
+            futures = [get_leg_executor().submit(self.fetch_block, block) for block in blocks]
+            for future in futures:
+                block_legs = future.result()
+                ROUTE_LEGS.inc(len(block_legs), source='table')
+                legs.update(block_legs)
+
+        unresolved = [key for key in missing if key not in legs]
+        if unresolved:
+            self.stats['fallback_legs'] = len(unresolved)
+            fallbacks = self.calculator.fallback_routes([missing[key] for key in unresolved])
+            legs.update(zip(unresolved, fallbacks))
+        return legs
+
+    def table_blocks(self, missing):
+        """Group missing legs into source x destination blocks within the table size limit"""
+        cache = self.calculator.route_cache
+        sources = {}
+        destinations = {}
+        for origin, destination in missing.values():
+            sources.setdefault(cache.snap(origin), origin)
+            destinations.setdefault(cache.snap(destination), destination)
+
+        half = max(1, self.table_max_size // 2)
+        source_chunks = _chunks(list(sources), half)
+        destination_chunks = _chunks(list(destinations), half)
+        source_chunk_of = {point: i for i, chunk in enumerate(source_chunks) for point in chunk}
+        destination_chunk_of = {point: i for i, chunk in enumerate(destination_chunks) for point in chunk}
+
+        # Only request blocks that actually contain a needed leg
+        needed = {}
+        for key, (origin, destination) in missing.items():
+            block = (source_chunk_of[cache.snap(origin)], destination_chunk_of[cache.snap(destination)])
+            needed.setdefault(block, []).append((key, cache.snap(origin), cache.snap(destination)))
+
+        blocks = []
+        for block_legs in needed.values():
+            block_sources = list(dict.fromkeys(origin for _, origin, _ in block_legs))
+            block_destinations = list(dict.fromkeys(destination for _, _, destination in block_legs))
+            blocks.append({
+                'sources': [sources[point] for point in block_sources],
+                'destinations': [destinations[point] for point in block_destinations],
+                'source_index': {point: n for n, point in enumerate(block_sources)},
+                'destination_index': {point: n for n, point in enumerate(block_destinations)},
+                'legs': block_legs,
+            })
+        return blocks
+
+    def fetch_block(self, block):
+        """Fetch one OSRM table block; legs OSRM cannot answer are left for the fallback.
+
+        The table service returns only distances and durations, so these
+        legs are marked as having no geometry (see RouteCalculator.build_result).
+        """
+        try:
+            data = self.calculator.osrm.table(block['sources'], block['destinations'])
+            durations = data['durations']
+            distances = data['distances']
+        except (OSRMError, KeyError):
+            return {}
+
+        legs = {}
+        for key, origin, destination in block['legs']:
+            i = block['source_index'][origin]
+            j = block['destination_index'][destination]
+            distance, duration = distances[i][j], durations[i][j]
+            if distance is None or duration is None:
+                continue
+            miles = distance * 0.000621371  # meters to miles
+            hours = duration / 3600  # seconds to hours
+            legs[key] = {
+                'distance': miles,
+                'duration': hours,
+                'geometry': False,
+                'steps': [{
+                    'instruction': 'Drive from origin to destination',
+                    'distance': miles,
+                    'duration': hours
+                }]
+            }
+        return legs
@@ -0,0 +1,26 @@
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+
+# Cache backends whose entries other worker processes cannot see
+PROCESS_LOCAL_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+@register(Tags.caches)
+def check_single_flight_cache(app_configs, **kwargs):
+    """Cross-process coalescing only saves work if the waiters can read the leader's plan"""
+    if not getattr(settings, 'SINGLE_FLIGHT_LOCK_DIR', None):
+        return []
+    alias = getattr(settings, 'PLAN_CACHE_ALIAS', 'plans')
+    backend = settings.CACHES.get(alias, {}).get('BACKEND', '')
+    if backend not in PROCESS_LOCAL_CACHES:
+        return []
+    return [Warning(
+        f'SINGLE_FLIGHT_LOCK_DIR is set but the {alias!r} cache ({backend}) is per process.',
+        hint='Set PLAN_CACHE_BACKEND to a shared cache (Redis, Memcached, database or file '
+             'based); otherwise identical plans in other processes wait for the lock and '
+             'are then computed again.',
+        id='api.W001',
+    )]
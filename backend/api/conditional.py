@@ -0,0 +1,60 @@
+import hashlib
+
+from django.core.exceptions import ValidationError
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response
+
+
+def make_etag(request, version):
+    """Strong ETag for a representation: its data version plus what shapes the body"""
+    digest = hashlib.sha256()
+    for part in (request.get_host(), request.get_full_path(),
+                 request.META.get('HTTP_ACCEPT', ''), *version):
+        digest.update(str(part).encode())
+        digest.update(b'\0')
+    return f'"{digest.hexdigest()[:32]}"'
+
+
+class ConditionalGetMixin:
+    """ETags on list and retrieve; a matching If-None-Match gets 304 Not Modified.
+
+    The ETag comes from a single cheap query on version_field (the row's
+    timestamp for retrieve, the newest timestamp and row count for list),
+    made before anything is fetched or serialized, so revalidating an
+    unchanged trip costs one small query instead of the full prefetch.
+    Editing a location a trip embeds bumps the trip's updated_at
+    (api.signals.touch_trips), so the shared rows are covered too.
+    """
+    version_field = 'updated_at'
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset()).prefetch_related(None)
+        version = queryset.aggregate(latest=Max(self.version_field), count=Count('pk'))
+        return self.conditional(request, (version['latest'], version['count']),
+                                super().list, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        lookup = self.lookup_url_kwarg or self.lookup_field
+        queryset = self.filter_queryset(self.get_queryset()).prefetch_related(None)
+        try:
+            latest = queryset.filter(
+                **{self.lookup_field: kwargs[lookup]}
+            ).values_list(self.version_field, flat=True).first()
+        except (TypeError, ValueError, ValidationError):
+            latest = None
+        if latest is None:
+            # Let the normal lookup produce the 404
+            return super().retrieve(request, *args, **kwargs)
+        return self.conditional(request, (kwargs[lookup], latest),
+                                super().retrieve, *args, **kwargs)
+
+    def conditional(self, request, version, respond, *args, **kwargs):
+        etag = make_etag(request, version)
+        not_modified = get_conditional_response(request, etag=etag)
+        if not_modified is not None:
+            not_modified['ETag'] = etag
+            return not_modified
+        response = respond(request, *args, **kwargs)
+        if response.status_code == 200:
+            response['ETag'] = etag
+        return response
@@ -0,0 +1,79 @@
+import numpy as np
+
+EARTH_RADIUS_MILES = 3959  # Earth's radius in miles
+
+
+def _radians(*values):
+    return [np.radians(np.asarray(value, dtype=np.float64)) for value in values]
+
+
+def _points(points):
+    """Turn lat/lng dicts or (lat, lng) pairs into an (N, 2) array of degrees"""
+    if isinstance(points, np.ndarray):
+        return points.reshape(-1, 2).astype(np.float64, copy=False)
+    return np.array([
+        (point['lat'], point['lng']) if isinstance(point, dict) else point
+        for point in points
+    ], dtype=np.float64).reshape(-1, 2)
+
+
+def haversine(lat1, lng1, lat2, lng2):
+    """Great-circle distance in miles; arguments broadcast like NumPy arrays"""
+    lat1, lng1, lat2, lng2 = _radians(lat1, lng1, lat2, lng2)
+    a = (np.sin((lat2 - lat1) / 2) ** 2
+         + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_MILES * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def pairwise_distances(origins, destinations):
+    """Distance in miles between origins[i] and destinations[i]"""
+    a, b = _points(origins), _points(destinations)
+    return haversine(a[:, 0], a[:, 1], b[:, 0], b[:, 1])
+
+
+def distance_matrix(origins, destinations):
+    """Full N x M matrix of distances in miles from every origin to every destination"""
+    a, b = _points(origins), _points(destinations)
+    return haversine(a[:, 0, None], a[:, 1, None], b[None, :, 0], b[None, :, 1])
+
+
+def path_distances(lats, lngs):
+    """Length in miles of each segment of a path given as coordinate arrays"""
+    lats = np.asarray(lats, dtype=np.float64)
+    lngs = np.asarray(lngs, dtype=np.float64)
+    return haversine(lats[:-1], lngs[:-1], lats[1:], lngs[1:])
+
+
+def bearing(lat1, lng1, lat2, lng2):
+    """Initial great-circle bearing in degrees clockwise from north (0-360)"""
+    lat1, lng1, lat2, lng2 = _radians(lat1, lng1, lat2, lng2)
+    dlng = lng2 - lng1
+    x = np.sin(dlng) * np.cos(lat2)
+    y = np.cos(lat1) * np.sin(lat2) - np.sin(lat1) * np.cos(lat2) * np.cos(dlng)
+    return (np.degrees(np.arctan2(x, y)) + 360) % 360
+
+
+def interpolate(lat1, lng1, lat2, lng2, fraction):
+    """Point(s) a fraction of the way along the great circle between two points.
+
+    Returns (lats, lngs) in degrees; every argument broadcasts.
+    """
+    phi1, lam1, phi2, lam2 = _radians(lat1, lng1, lat2, lng2)
+    fraction = np.asarray(fraction, dtype=np.float64)
+    a = (np.sin((phi2 - phi1) / 2) ** 2
+         + np.cos(phi1) * np.cos(phi2) * np.sin((lam2 - lam1) / 2) ** 2)
+    delta = 2 * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+    sin_delta = np.sin(delta)
+
+    # Coincident points: every fraction maps to the start point
+    safe = sin_delta > 1e-12
+    sin_delta = np.where(safe, sin_delta, 1.0)
+    wa = np.where(safe, np.sin((1 - fraction) * delta) / sin_delta, 1 - fraction)
+    wb = np.where(safe, np.sin(fraction * delta) / sin_delta, fraction)
+
+    x = wa * np.cos(phi1) * np.cos(lam1) + wb * np.cos(phi2) * np.cos(lam2)
+    y = wa * np.cos(phi1) * np.sin(lam1) + wb * np.cos(phi2) * np.sin(lam2)
+    z = wa * np.sin(phi1) + wb * np.sin(phi2)
+    lats = np.degrees(np.arctan2(z, np.hypot(x, y)))
+    lngs = np.degrees(np.arctan2(y, x))
+    return lats, lngs
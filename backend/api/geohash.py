@@ -0,0 +1,69 @@
+import math
+
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+STORED_PRECISION = 9  # Characters kept on each Location, cells of about 5 x 5 m
+MILES_PER_DEGREE = 69.09  # Length of a degree of latitude, or of longitude at the equator
+
+
+def encode(lat, lng, precision=STORED_PRECISION):
+    """Geohash of a point; cells sharing a prefix are nested, so prefixes index areas"""
+    lat_range = [-90.0, 90.0]
+    lng_range = [-180.0, 180.0]
+    chars = []
+    bits = value = 0
+    even = True  # Bits alternate longitude, latitude, starting with longitude
+    while len(chars) < precision:
+        bounds, coordinate = (lng_range, lng) if even else (lat_range, lat)
+        middle = (bounds[0] + bounds[1]) / 2
+        if coordinate >= middle:
+            value = value * 2 + 1
+            bounds[0] = middle
+        else:
+            value *= 2
+            bounds[1] = middle
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(BASE32[value])
+            bits = value = 0
+    return ''.join(chars)
+
+
+def cell_size(precision):
+    """(lat_degrees, lng_degrees) spanned by a cell at this precision"""
+    total_bits = 5 * precision
+    lng_bits = (total_bits + 1) // 2
+    lat_bits = total_bits // 2
+    return 180.0 / 2 ** lat_bits, 360.0 / 2 ** lng_bits
+
+
+def precision_for(radius_miles, lat):
+    """Longest prefix whose cells are at least radius_miles across near this latitude"""
+    lat_deg_radius = radius_miles / MILES_PER_DEGREE
+    # Cells narrow toward the poles; size them for the poleward edge of the circle
+    cos_lat = math.cos(math.radians(min(abs(lat) + lat_deg_radius, 89.9)))
+    for precision in range(STORED_PRECISION, 0, -1):
+        lat_deg, lng_deg = cell_size(precision)
+        if (lat_deg * MILES_PER_DEGREE >= radius_miles
+                and lng_deg * MILES_PER_DEGREE * cos_lat >= radius_miles):
+            return precision
+    return 0
+
+
+def neighbourhood(lat, lng, radius_miles):
+    """Cells that together cover every point within radius_miles of (lat, lng).
+
+    The point's cell plus its eight neighbours, at a precision where a cell is
+    wider than the radius. Returns None when no prefix is coarse enough.
+    """
+    precision = precision_for(radius_miles, lat)
+    if precision == 0:
+        return None
+    lat_deg, lng_deg = cell_size(precision)
+    cells = set()
+    for dlat in (-lat_deg, 0.0, lat_deg):
+        for dlng in (-lng_deg, 0.0, lng_deg):
+            cell_lat = max(-90.0, min(90.0 - 1e-9, lat + dlat))
+            cell_lng = (lng + dlng + 180.0) % 360.0 - 180.0
+            cells.add(encode(cell_lat, cell_lng, precision))
+    return cells
@@ -0,0 +1,410 @@
+from datetime import datetime, time, timedelta
+
+from django.utils import timezone
+
+# Constants for DOT hours of service (property-carrying drivers)
+MAX_DRIVING_HOURS = 11  # Maximum driving hours after a 10-hour rest
+MAX_DRIVING_WINDOW = 14  # No driving after the 14th hour since coming on duty
+BREAK_AFTER_DRIVING = 8  # 30-minute break required after 8 hours of driving
+MIN_BREAK = 0.5  # Length of that break
+MIN_REST_BREAK = 10  # Minimum 10-hour rest break
+RESTART_HOURS = 34  # 34-hour restart resets the weekly cycle
+WEEKLY_CYCLE_LIMIT = 70  # 70-hour weekly cycle
+CYCLE_DAYS = 8  # 8-day cycle
+FUEL_STOP_INTERVAL = 1000  # Fuel every 1000 miles
+FUEL_STOP_TIME = 0.5  # 30 minutes per fuel stop
+PICKUP_DROP_TIME = 1  # 1 hour for pickup/dropoff
+DEFAULT_SPEED_MPH = 55  # Used when a leg has no duration
+MIN_DRIVE_HOURS = 0.01  # Shorter drives are folded into the drive or stop next to them
+EPSILON = 1e-9
+
+
+class DutyClocks:
+    """Hours-of-service clocks for one driver, all in hours"""
+    __slots__ = ('driving', 'window', 'since_break', 'cycle', 'on_shift')
+
+    def __init__(self, driving=0.0, window=0.0, since_break=0.0, cycle=0.0):
+        self.driving = driving  # Driving since the last 10-hour rest
+        self.window = window  # Elapsed time since coming on duty
+        self.since_break = since_break  # Driving since the last 30-minute break
+        self.cycle = cycle  # On-duty hours counted against the 70-hour cycle
+        self.on_shift = driving > 0 or window > 0
+
+    def driving_available(self):
+        """Hours that can be driven before some limit forces a stop"""
+        return min(
+            MAX_DRIVING_HOURS - self.driving,
+            MAX_DRIVING_WINDOW - self.window,
+            BREAK_AFTER_DRIVING - self.since_break,
+            WEEKLY_CYCLE_LIMIT - self.cycle,
+        )
+
+    def shift_hours_remaining(self):
+        return max(0.0, min(MAX_DRIVING_HOURS - self.driving, MAX_DRIVING_WINDOW - self.window))
+
+    def drive(self, hours):
+        self.on_shift = True
+        self.driving += hours
+        self.window += hours
+        self.since_break += hours
+        self.cycle += hours
+
+    def work(self, hours):
+        """On duty, not driving"""
+        self.on_shift = True
+        self.window += hours
+        self.cycle += hours
+        if hours >= MIN_BREAK:
+            self.since_break = 0.0
+
+    def pause(self, hours):
+        """Short off-duty period; the 14-hour window keeps running"""
+        if self.on_shift:
+            self.window += hours
+        if hours >= MIN_BREAK:
+            self.since_break = 0.0
+
+    def rest(self):
+        self.driving = self.window = self.since_break = 0.0
+        self.on_shift = False
+
+    def restart(self):
+        self.rest()
+        self.cycle = 0.0
+
+
+class LogBook:
+    """Splits the duty-status timeline into calendar-day ELD logs as it grows"""
+    __slots__ = ('trip_data', 'day_start', 'day_number', 'entries', 'status',
+                 'miles', 'driving_hours', 'on_duty_hours')
+
+    def __init__(self, start_time, trip_data):
+        self.trip_data = trip_data
+        self.day_start = start_time.replace(hour=0, minute=0, second=0, microsecond=0)
+        self.day_number = 1
+        self.entries = []
+        self.status = None
+        self._reset_totals()
+        if start_time > self.day_start:
+            self.append('off_duty', self.day_start, start_time, 'Off duty', 0, 0, MAX_DRIVING_HOURS)
+
+    def _reset_totals(self):
+        self.miles = 0.0
+        self.driving_hours = 0.0
+        self.on_duty_hours = 0.0
+
+    def resume(self, entries, until, miles):
+        """Carry on a day already logged up to `until`, when the odometer read `miles`"""
+        self._reset_totals()
+        self.entries = list(entries)
+        self.status = entries[-1]['status']
+        log_date = self.day_start.date()
+        ends = [entry_time(log_date, entry) for entry in entries[1:]] + [until]
+        odometer = [entry['miles'] for entry in entries[1:]] + [miles]
+        for entry, end, miles_end in zip(entries, ends, odometer):
+            hours = (end - entry_time(log_date, entry)).total_seconds() / 3600
+            if entry['status'] == 'driving':
+                self.driving_hours += hours
+                self.miles += miles_end - entry['miles']
+            if entry['status'] in ('driving', 'on_duty'):
+                self.on_duty_hours += hours
+
+    def append(self, status, start, end, note, miles_start, miles_end, hours_remaining):
+        """Record a status period; returns the logs of any days it completed"""
+        completed = []
+        period_start = start
+        total_seconds = (end - start).total_seconds()
+        miles_at = miles_start
+        while True:
+            day_end = self.day_start + timedelta(days=1)
+            segment_end = min(end, day_end)
+            hours = (segment_end - start).total_seconds() / 3600
+            if total_seconds > 0:
+                fraction = (segment_end - period_start).total_seconds() / total_seconds
+                miles_next = miles_start + (miles_end - miles_start) * fraction
+            else:
+                miles_next = miles_end
+
+            if status != self.status:
+                self.entries.append({
+                    'time': self._clock(start),
+                    'timestamp': start.isoformat(),
+                    'status': status,
+                    'location': note,
+                    'miles': round(miles_at, 1),
+                    'hours_remaining': round(hours_remaining, 1)
+                })
+                self.status = status
+            if status == 'driving':
+                self.driving_hours += hours
+                self.miles += miles_next - miles_at
+            if status in ('driving', 'on_duty'):
+                self.on_duty_hours += hours
+
+            if segment_end < day_end:
+                return completed
+            completed.append(self._close_day(status, miles_next, hours_remaining))
+            if segment_end == end:
+                return completed
+            start, miles_at = segment_end, miles_next
+
+    def finish(self, end_time, miles):
+        """Go off duty until midnight and return the final day's log"""
+        if self.status is None:
+            # The trip ended exactly at midnight; that day is already closed
+            return []
+        day_end = self.day_start + timedelta(days=1)
+        return self.append('off_duty', end_time, day_end, 'Off duty - trip complete',
+                           miles, miles, MAX_DRIVING_HOURS)
+
+    def _clock(self, moment):
+        minutes = int(round((moment - self.day_start).total_seconds() / 60))
+        return f'{minutes // 60:02d}:{minutes % 60:02d}'
+
+    def _close_day(self, status, miles, hours_remaining):
+        day_end = self.day_start + timedelta(days=1)
+        self.entries.append({
+            'time': '24:00',
+            'timestamp': day_end.isoformat(),
+            'status': status,
+            'location': 'End of day',
+            'miles': round(miles, 1),
+            'hours_remaining': round(hours_remaining, 1)
+        })
+        log = {
+            'log_date': self.day_start.date().isoformat(),
+            'driver_id': self.trip_data.get('driver_id', 'DRV001'),
+            'carrier_name': self.trip_data.get('carrier_name', 'Test Carrier'),
+            'truck_number': self.trip_data.get('truck_number', 'TRK001'),
+            'total_miles': round(self.miles, 1),
+            'driving_hours': round(self.driving_hours, 2),
+            'cycle_hours_used': round(self.on_duty_hours, 2),
+            'status_entries': self.entries,
+            'day_number': self.day_number
+        }
+        self.day_start = day_end
+        self.day_number += 1
+        self.entries = []
+        self.status = None
+        self._reset_totals()
+        return log
+
+
+def entry_time(log_date, entry):
+    """Aware datetime of a status entry; older logs only carry an 'HH:MM' time"""
+    if entry.get('timestamp'):
+        moment = datetime.fromisoformat(entry['timestamp'])
+    else:
+        hours, minutes = (int(part) for part in entry['time'].split(':'))
+        moment = datetime.combine(log_date, time()) + timedelta(hours=hours, minutes=minutes)
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+class HOSScheduler:
+    """Single-pass hours-of-service planner.
+
+    Walks the route once as a stream of duty-status events, tracking the
+    11-hour, 14-hour, 30-minute-break and 70-hour/8-day clocks, and yields
+    stops and daily logs as soon as they are final.
+    """
+
+    def __init__(self, waypoints, legs, start_time, trip_data, current_cycle_used=0.0,
+                 locate=None, clocks=None, start_mile=0.0, miles_since_fuel=0.0,
+                 stop_finder=None, log_entries=None):
+        self.waypoints = waypoints
+        self.legs = legs
+        self.time = start_time
+        self.mile = start_mile
+        self.miles_since_fuel = miles_since_fuel
+        self.clocks = clocks or DutyClocks(cycle=current_cycle_used)
+        self.locate = locate or (lambda mile: {'lat': waypoints[0]['lat'], 'lng': waypoints[0]['lng']})
+        self.logbook = LogBook(start_time, trip_data)
+        if log_entries:
+            # Re-planning part way through a day: keep what it already logged
+            self.logbook.resume(log_entries, start_time, start_mile)
+        # Optional RouteStopFinder; fuel and rest stops then move to real facilities
+        self.stop_finder = stop_finder
+        self.pending = None  # (kind, facility) of a stop to make as soon as the drive ends
+        self.segment = 0
+        self.fuel_stops = 0
+
+    def run(self):
+        """Plan the whole trip; returns (stops, eld_logs)"""
+        stops, logs = [], []
+        for kind, item in self.events():
+            (stops if kind == 'stop' else logs).append(item)
+        for log in logs:
+            log['total_trip_days'] = len(logs)
+        return stops, logs
+
+    def events(self):
+        """Yield ('stop', stop) and ('log', daily_log) events in time order"""
+        for leg, waypoint in zip(self.legs, self.waypoints[1:]):
+            leg_end = self.mile + leg['distance']
+            speed = leg['distance'] / leg['duration'] if leg['duration'] > 0 else DEFAULT_SPEED_MPH
+
+            while leg_end - self.mile > EPSILON:
+                if self.pending is not None:
+                    yield from self._pending_stop()
+                    continue
+                if self.miles_since_fuel >= FUEL_STOP_INTERVAL - EPSILON:
+                    yield from self._fuel()
+                    continue
+                available = self.clocks.driving_available()
+                if available <= EPSILON:
+                    yield from self._take_break()
+                    continue
+                remaining = leg_end - self.mile
+                fuel_left = FUEL_STOP_INTERVAL - self.miles_since_fuel
+                miles = min(remaining, available * speed, fuel_left)
+                if remaining - miles < MIN_DRIVE_HOURS * speed:
+                    # The rest of the leg is too short for a segment of its own
+                    miles = remaining
+                elif miles < MIN_DRIVE_HOURS * speed:
+                    # Too little driving left to be worth a segment: stop now
+                    yield from (self._fuel() if fuel_left <= available * speed else self._take_break())
+                    continue
+                if self.stop_finder is not None and miles < remaining - EPSILON:
+                    miles = self._snap(miles, speed)
+                if miles > EPSILON:
+                    yield from self._drive(miles, miles / speed)
+
+            stop_type = waypoint['stop_type']
+            verb = 'Pickup' if stop_type == 'pickup' else 'Drop off'
+            yield from self._stop(stop_type, 'on_duty', PICKUP_DROP_TIME, waypoint['name'],
+                                  f'{verb} cargo - 1 hour allowed',
+                                  position={'lat': waypoint['lat'], 'lng': waypoint['lng']})
+
+        for log in self.logbook.finish(self.time, self.mile):
+            yield 'log', log
+
+    def _drive(self, miles, hours):
+        self.segment += 1
+        end = self.time + timedelta(hours=hours)
+        stop = {
+            'location': {'name': f'Drive - Segment {self.segment}', **self.locate(self.mile)},
+            'stop_type': 'driving',
+            'arrival_time': self.time.isoformat(),
+            'departure_time': end.isoformat(),
+            'duration': round(hours, 2),
+            'miles_driven': round(self.mile + miles, 1),
+            'notes': f'Drive {miles:.1f} miles'
+        }
+        completed = self.logbook.append('driving', self.time, end, 'Driving', self.mile,
+                                        self.mile + miles, self.clocks.shift_hours_remaining())
+        self.clocks.drive(hours)
+        self.time = end
+        self.mile += miles
+        self.miles_since_fuel += miles
+        yield 'stop', stop
+        for log in completed:
+            yield 'log', log
+
+    def _stop_after(self, miles, speed):
+        """Kind of stop a drive of `miles` ends in: 'fuel', 'rest', 'restart' or None.
+
+        None covers 30-minute breaks, which can be taken anywhere.
+        """
+        if miles >= FUEL_STOP_INTERVAL - self.miles_since_fuel - EPSILON:
+            return 'fuel'
+        hours = miles / speed
+        clocks = self.clocks
+        if clocks.cycle + hours >= WEEKLY_CYCLE_LIMIT - EPSILON:
+            return 'restart'
+        if (clocks.driving + hours >= MAX_DRIVING_HOURS - EPSILON
+                or clocks.window + hours >= MAX_DRIVING_WINDOW - EPSILON):
+            return 'rest'
+        return None
+
+    def _snap(self, miles, speed):
+        """Shorten a drive that ends in a fuel or rest stop so it ends at a facility"""
+        kind = self._stop_after(miles, speed)
+        if kind is None:
+            return miles
+        found = self.stop_finder.find('fuel' if kind == 'fuel' else 'rest',
+                                      self.mile, self.mile + miles)
+        if found is None:
+            return miles
+        mile, location, off_route = found
+        self.pending = (kind, {**location, 'off_route_miles': off_route})
+        if mile - self.mile < MIN_DRIVE_HOURS * speed:
+            # The facility is right here; stop without a token drive to it
+            return 0.0
+        return mile - self.mile
+
+    def _pending_stop(self):
+        kind, facility = self.pending
+        self.pending = None
+        if kind == 'fuel':
+            yield from self._fuel(facility)
+        elif kind == 'restart':
+            yield from self._restart(facility)
+        else:
+            yield from self._rest(facility)
+
+    def _fuel(self, facility=None):
+        self.fuel_stops += 1
+        self.miles_since_fuel = 0.0
+        yield from self._stop('fuel', 'on_duty', FUEL_STOP_TIME, f'Fuel Stop #{self.fuel_stops}',
+                              'Refuel vehicle - 30 minutes', facility=facility)
+
+    def _restart(self, facility=None):
+        yield from self._stop('rest', 'off_duty', RESTART_HOURS, '34-Hour Restart',
+                              '34-hour restart - 70-hour/8-day limit reached (DOT)',
+                              facility=facility)
+
+    def _rest(self, facility=None):
+        yield from self._stop('rest', 'sleeper', MIN_REST_BREAK, 'Rest Stop',
+                              'Required 10-hour rest break (DOT)', facility=facility)
+
+    def _take_break(self):
+        """Make the stop the binding clock calls for; it has under MIN_DRIVE_HOURS left"""
+        clocks = self.clocks
+        if clocks.cycle >= WEEKLY_CYCLE_LIMIT - MIN_DRIVE_HOURS:
+            yield from self._restart()
+        elif (clocks.driving >= MAX_DRIVING_HOURS - MIN_DRIVE_HOURS
+              or clocks.window >= MAX_DRIVING_WINDOW - MIN_DRIVE_HOURS):
+            yield from self._rest()
+        else:
+            yield from self._stop('break', 'off_duty', MIN_BREAK, '30-Minute Break',
+                                  '30-minute break after 8 hours driving (DOT)')
+
+    def _stop(self, stop_type, status, hours, name, notes, position=None, facility=None):
+        end = self.time + timedelta(hours=hours)
+        if facility is not None:
+            # Stopping at a real facility: the stop takes its name and position
+            location = {'name': facility['name'], 'lat': facility['lat'], 'lng': facility['lng']}
+            notes = f"{notes} - {facility['off_route_miles']:.1f} mi off route"
+            name = f"{name} - {facility['name']}"
+        else:
+            location = {'name': name, **(position or self.locate(self.mile))}
+        stop = {
+            'location': location,
+            'stop_type': stop_type,
+            'arrival_time': self.time.isoformat(),
+            'departure_time': end.isoformat(),
+            'duration': hours,
+            'miles_driven': round(self.mile, 1),
+            'notes': notes
+        }
+        completed = self.logbook.append(status, self.time, end, name, self.mile, self.mile,
+                                        self.clocks.shift_hours_remaining())
+        if hours >= RESTART_HOURS:
+            self.clocks.restart()
+        elif hours >= MIN_REST_BREAK:
+            self.clocks.rest()
+        elif status == 'on_duty':
+            self.clocks.work(hours)
+        else:
+            self.clocks.pause(hours)
+        self.time = end
+        yield 'stop', stop
+        for log in completed:
+            yield 'log', log
+
+
+def default_start_time():
+    """Plans start at 06:00 today unless a start time is given"""
+    return timezone.localtime().replace(hour=6, minute=0, second=0, microsecond=0)
@@ -0,0 +1,237 @@
+import json
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DatabaseError, close_old_connections, connections
+from django.db.models import F, Q
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+
+from .models import PlanJob
+
+logger = logging.getLogger(__name__)
+
+# Defaults for the database-backed planning queue
+DEFAULT_VISIBILITY_TIMEOUT = 120  # Seconds a claimed job stays invisible to other workers
+DEFAULT_MAX_ATTEMPTS = 3
+DEFAULT_RETRY_BACKOFF = 5  # Seconds before the first retry, doubled per attempt
+DEFAULT_POLL_INTERVAL = 1.0  # Seconds an idle worker sleeps between claims
+CLAIM_CANDIDATES = 10  # Jobs looked at per claim, so racing workers rarely collide
+HEARTBEATS_PER_LEASE = 3  # Lease renewals per visibility timeout while a job runs
+
+
+def submit_job(payload, kind='create_trip'):
+    """Queue a trip-planning job and return it"""
+    return PlanJob.objects.create(
+        kind=kind,
+        payload=payload,
+        max_attempts=getattr(settings, 'JOBS_MAX_ATTEMPTS', DEFAULT_MAX_ATTEMPTS),
+        available_at=timezone.now(),
+    )
+
+
+def fail_expired_jobs(now):
+    """Fail running jobs whose lease expired on their last allowed attempt"""
+    return PlanJob.objects.filter(
+        status='running', locked_until__lt=now, attempts__gte=F('max_attempts')
+    ).update(
+        status='failed',
+        error='Worker lease expired on the final attempt',
+        locked_by='',
+        locked_until=None,
+        finished_at=now,
+    )
+
+
+def claim_job(worker_id, visibility_timeout=DEFAULT_VISIBILITY_TIMEOUT):
+    """Lease the oldest runnable job to a worker, or return None.
+
+    Runnable means queued and due, or running with an expired lease (its
+    worker died or stalled) and attempts left; one that has none is failed
+    instead. The lease is taken with a conditional UPDATE, so exactly one
+    worker wins each job on any database backend.
+    """
+    now = timezone.now()
+    fail_expired_jobs(now)
+    runnable = (
+        Q(status='queued', available_at__lte=now)
+        | Q(status='running', locked_until__lt=now, attempts__lt=F('max_attempts'))
+    )
+    candidates = PlanJob.objects.filter(runnable).order_by('available_at', 'id')
+    for job_id in candidates.values_list('id', flat=True)[:CLAIM_CANDIDATES]:
+        claimed = PlanJob.objects.filter(runnable, pk=job_id).update(
+            status='running',
+            locked_by=worker_id,
+            locked_until=now + timedelta(seconds=visibility_timeout),
+            started_at=now,
+            attempts=F('attempts') + 1,
+        )
+        if claimed:
+            return PlanJob.objects.get(pk=job_id)
+    return None
+
+
+def execute_job(job):
+    """Plan the job's trip; returns (result, trip)"""
+    from .persistence import save_trip_plan
+    from .serializers import TripInputSerializer
+    from .views import RouteCalculator
+
+    input_serializer = TripInputSerializer(data=job.payload)
+    input_serializer.is_valid(raise_exception=True)
+    data = input_serializer.validated_data
+    result = RouteCalculator().calculate(data)
+    if job.kind == 'create_trip':
+        trip = save_trip_plan(data, result)
+        return {'trip_id': trip.pk}, trip
+    return result, None
+
+
+class LeaseHeartbeat:
+    """Extend a running job's lease from a background thread until the block exits.
+
+    Keeps a long plan from outliving its visibility timeout and being
+    claimed, and run, a second time by another worker.
+    """
+
+    def __init__(self, job_id, worker_id, visibility_timeout):
+        self.mine = PlanJob.objects.filter(pk=job_id, locked_by=worker_id, status='running')
+        self.visibility_timeout = visibility_timeout
+        self.stopping = threading.Event()
+        self.thread = threading.Thread(target=self._beat, name=f'plan-lease-{job_id}', daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stopping.set()
+        self.thread.join()
+
+    def _beat(self):
+        try:
+            while not self.stopping.wait(self.visibility_timeout / HEARTBEATS_PER_LEASE):
+                try:
+                    renewed = self.mine.update(
+                        locked_until=timezone.now() + timedelta(seconds=self.visibility_timeout)
+                    )
+                except DatabaseError as exc:
+                    # The next beat tries again, well before the lease runs out
+                    logger.warning('Plan job lease renewal failed: %s', exc)
+                    continue
+                if not renewed:
+                    return
+        finally:
+            connections.close_all()
+
+
+def run_job(job, worker_id, retry_backoff=DEFAULT_RETRY_BACKOFF,
+            visibility_timeout=DEFAULT_VISIBILITY_TIMEOUT):
+    """Run a claimed job and record its outcome, unless the lease was lost"""
+    started = time.monotonic()
+    queue_seconds = (job.started_at - job.created_at).total_seconds()
+    mine = PlanJob.objects.filter(pk=job.pk, locked_by=worker_id, status='running')
+    try:
+        with LeaseHeartbeat(job.pk, worker_id, visibility_timeout):
+            result, trip = execute_job(job)
+    except Exception as exc:
+        run_seconds = time.monotonic() - started
+        # Invalid input will not get better on retry
+        invalid = isinstance(exc, ValidationError)
+        retry = not invalid and job.attempts < job.max_attempts
+        logger.warning('Plan job %s attempt %s failed: %s', job.pk, job.attempts, exc)
+        mine.update(
+            status='queued' if retry else 'failed',
+            error=json.dumps(exc.detail) if invalid else str(exc),
+            available_at=timezone.now() + timedelta(
+                seconds=retry_backoff * 2 ** (job.attempts - 1)
+            ),
+            locked_by='',
+            locked_until=None,
+            finished_at=None if retry else timezone.now(),
+            queue_seconds=queue_seconds,
+            run_seconds=run_seconds,
+        )
+        return False
+
+    mine.update(
+        status='succeeded',
+        result=result,
+        trip=trip,
+        error='',
+        locked_by='',
+        locked_until=None,
+        finished_at=timezone.now(),
+        queue_seconds=queue_seconds,
+        run_seconds=time.monotonic() - started,
+    )
+    return True
+
+
+class PlanWorker:
+    """Pool of threads that claim and run plan jobs until stopped"""
+
+    def __init__(self, concurrency=1, poll_interval=DEFAULT_POLL_INTERVAL,
+                 visibility_timeout=None, retry_backoff=None):
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.visibility_timeout = visibility_timeout or getattr(
+            settings, 'JOBS_VISIBILITY_TIMEOUT', DEFAULT_VISIBILITY_TIMEOUT
+        )
+        self.retry_backoff = retry_backoff if retry_backoff is not None else getattr(
+            settings, 'JOBS_RETRY_BACKOFF', DEFAULT_RETRY_BACKOFF
+        )
+        self.name = f'{socket.gethostname()}:{os.getpid()}'
+        self.stopping = threading.Event()
+        self.processed = 0
+        self._lock = threading.Lock()
+
+    def run(self, once=False):
+        """Start the worker threads and block until they finish"""
+        threads = [
+            threading.Thread(target=self._loop, args=(once,), name=f'plan-worker-{i}', daemon=True)
+            for i in range(self.concurrency)
+        ]
+        for thread in threads:
+            thread.start()
+        try:
+            for thread in threads:
+                while thread.is_alive():
+                    thread.join(0.5)
+        except KeyboardInterrupt:
+            self.stop()
+            for thread in threads:
+                thread.join()
+
+    def stop(self):
+        self.stopping.set()
+
+    def _loop(self, once):
+        worker_id = f'{self.name}:{uuid.uuid4().hex[:8]}'
+        try:
+            while not self.stopping.is_set():
+                close_old_connections()
+                try:
+                    job = claim_job(worker_id, self.visibility_timeout)
+                    if job is not None:
+                        run_job(job, worker_id, self.retry_backoff, self.visibility_timeout)
+                except DatabaseError as exc:
+                    # e.g. a busy SQLite file; the lease expires and the job is retried
+                    logger.warning('Plan worker %s database error: %s', worker_id, exc)
+                    job = None
+                if job is None:
+                    if once:
+                        return
+                    self.stopping.wait(self.poll_interval)
+                    continue
+                with self._lock:
+                    self.processed += 1
+        finally:
+            # Worker threads own their connections; close them on the way out
+            connections.close_all()
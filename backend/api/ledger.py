@@ -0,0 +1,247 @@
+import math
+import threading
+from datetime import datetime, time, timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+from .hos import CYCLE_DAYS, RESTART_HOURS, WEEKLY_CYCLE_LIMIT, entry_time
+from .models import DutyDay, ELDLog
+
+ON_DUTY_STATUSES = ('driving', 'on_duty')
+RECAP_DAYS = 7  # Days ahead covered by the recap schedule
+LEDGER_FIELDS = ('on_duty_hours', 'driving_hours', 'restarted_at', 'hours_since_restart',
+                 'updated_at')
+RESTART_REACH = math.ceil(RESTART_HOURS / 24)  # Days a restart's off-duty time can span
+
+# Ledger ranges queued for rebuild when this thread's transaction commits
+_pending = threading.local()
+
+
+def periods(eld_log):
+    """(status, start, end) for each status period of a daily log"""
+    entries = eld_log.status_entries
+    if not entries:
+        return
+    times = [entry_time(eld_log.log_date, entry) for entry in entries]
+    if entries[-1]['time'] != '24:00':
+        # Older logs have no closing entry; their day ends at midnight
+        next_day = eld_log.log_date + timedelta(days=1)
+        times.append(timezone.make_aware(datetime.combine(next_day, time())))
+    for entry, start, end in zip(entries, times, times[1:]):
+        if end > start:
+            yield entry['status'], start, end
+
+
+def union(periods):
+    """Merge overlapping (start, end) periods; returns them sorted and disjoint"""
+    merged = []
+    for start, end in sorted(periods):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+
+def hours(periods):
+    return sum((end - start).total_seconds() for start, end in periods) / 3600
+
+
+def tally(eld_logs, logged_before=None):
+    """Unsaved DutyDay totals for ELD logs, keyed by (driver_id, day).
+
+    A driver's hours are the union of the on-duty periods of all their
+    logs, so trips planned over the same time are not counted twice.
+    On-duty time starting RESTART_HOURS or more after the driver's
+    previous on-duty time ended follows a restart; on-duty hours after it
+    on the same day are kept apart so the cycle can start over there.
+
+    When the logs are only a recent part of the history, logged_before(driver_id)
+    says whether the driver has older logs; the first on-duty time found
+    then follows a restart, since the logs read reach back further than
+    one. Without it the logs are taken to be the whole history, and a
+    driver's first on-duty time follows no restart.
+    """
+    on_duty = {}
+    for eld_log in eld_logs:
+        key = (eld_log.driver_id, eld_log.log_date)
+        on_duty.setdefault(key, [])
+        on_duty[key].extend(
+            (start, end, status) for status, start, end in periods(eld_log)
+            if status in ON_DUTY_STATUSES
+        )
+
+    days = {}
+    last_end = {}
+    for (driver_id, day), spans in sorted(on_duty.items()):
+        totals = days[(driver_id, day)] = DutyDay(driver_id=driver_id, day=day)
+        for start, end in union((start, end) for start, end, _ in spans):
+            previous = last_end.get(driver_id)
+            if previous is None:
+                restarted = logged_before is not None and logged_before(driver_id)
+            else:
+                restarted = start - previous >= timedelta(hours=RESTART_HOURS)
+            if restarted:
+                totals.restarted_at = start
+                totals.hours_since_restart = 0.0
+            duty = hours([(start, end)])
+            totals.on_duty_hours += duty
+            if totals.restarted_at is not None:
+                totals.hours_since_restart += duty
+            last_end[driver_id] = end
+        totals.driving_hours = hours(union(
+            (start, end) for start, end, status in spans if status == 'driving'
+        ))
+    return days
+
+
+def log_spans(eld_logs):
+    """First and last log date of each driver among some logs"""
+    spans = {}
+    for eld_log in eld_logs:
+        first, last = spans.get(eld_log.driver_id, (eld_log.log_date, eld_log.log_date))
+        spans[eld_log.driver_id] = (min(first, eld_log.log_date), max(last, eld_log.log_date))
+    return spans
+
+
+def record_logs(eld_logs):
+    """Bring the drivers' ledgers up to date with newly bulk-inserted ELD logs.
+
+    bulk_create sends no signals, so this is called directly; it rebuilds
+    the logs' days from what is stored, so recording twice is harmless.
+    """
+    for driver_id, (first, last) in log_spans(eld_logs).items():
+        rebuild_ledger([driver_id], first, last)
+
+
+def rebuild_ledger(driver_ids=None, start=None, end=None):
+    """Recompute ledger rows from stored ELD logs; returns the number of rows written.
+
+    Restricted to some drivers and an inclusive date range when given.
+    A range is widened by RESTART_REACH days each way, since a restart
+    depends on the duty before it: logs that far back are read, and rows
+    that far ahead are rewritten. Three queries, and a fourth per driver
+    with no duty in the logs read, to look for older logs. The rows are
+    deleted before the logs are read, so a concurrent rebuild of the same
+    rows waits for this one and then sees its logs.
+    """
+    logs = ELDLog.objects.only('driver_id', 'log_date', 'status_entries')
+    rows = DutyDay.objects.all()
+    if driver_ids is not None:
+        logs = logs.filter(driver_id__in=driver_ids)
+        rows = rows.filter(driver_id__in=driver_ids)
+    logged_before = None
+    if start is not None:
+        since = start - timedelta(days=RESTART_REACH)
+        logs = logs.filter(log_date__gte=since)
+        rows = rows.filter(day__gte=start)
+
+        def logged_before(driver_id):
+            return ELDLog.objects.filter(driver_id=driver_id, log_date__lt=since).exists()
+    if end is not None:
+        end += timedelta(days=RESTART_REACH)
+        logs = logs.filter(log_date__lte=end)
+        rows = rows.filter(day__lte=end)
+
+    with transaction.atomic(savepoint=False):
+        rows.delete()
+        days = [
+            totals for (_, day), totals in tally(logs.iterator(), logged_before).items()
+            if start is None or day >= start
+        ]
+        DutyDay.objects.bulk_create(
+            days, batch_size=500, update_conflicts=True,
+            unique_fields=['driver_id', 'day'], update_fields=LEDGER_FIELDS
+        )
+    return len(days)
+
+
+def schedule_rebuild(driver_id, day, using=None):
+    """Rebuild a driver's ledger around `day` once the current transaction commits.
+
+    Days queued within one transaction (e.g. every log of a deleted trip)
+    are rebuilt together, one range per driver.
+    """
+    pending = getattr(_pending, 'spans', None)
+    if pending is None:
+        pending = _pending.spans = {}
+    first, last = pending.get(driver_id, (day, day))
+    pending[driver_id] = (min(first, day), max(last, day))
+    transaction.on_commit(flush_rebuilds, using=using)
+
+
+def flush_rebuilds():
+    """Run the rebuilds queued by schedule_rebuild(); later callbacks find nothing left"""
+    pending = getattr(_pending, 'spans', None) or {}
+    _pending.spans = {}
+    for driver_id, (first, last) in pending.items():
+        rebuild_ledger([driver_id], first, last)
+
+
+def _rows(driver_id, first_day, last_day):
+    rows = DutyDay.objects.filter(driver_id=driver_id, day__gte=first_day, day__lte=last_day)
+    return {row.day: row for row in rows}
+
+
+def _used(rows, last_day, days):
+    """On-duty hours over `days` days ending last_day, counted from the latest restart.
+
+    Returns (hours, restarted_at).
+    """
+    used = 0.0
+    for offset in range(days):
+        row = rows.get(last_day - timedelta(days=offset))
+        if row is None:
+            continue
+        if row.restarted_at is not None:
+            return used + row.hours_since_restart, row.restarted_at
+        used += row.on_duty_hours
+    return used, None
+
+
+def cycle_hours_used(driver_id, day):
+    """Hours logged against the 70-hour cycle in the 8 days ending on `day`"""
+    first_day = day - timedelta(days=CYCLE_DAYS - 1)
+    used, _ = _used(_rows(driver_id, first_day, day), day, CYCLE_DAYS)
+    return round(min(used, WEEKLY_CYCLE_LIMIT), 2)
+
+
+def cycle_summary(driver_id, day):
+    """Cycle hours used and available on `day`, the 8-day window and a recap schedule.
+
+    The recap lists the hours available at the start of each following day,
+    as older days drop out of the window, assuming no work beyond what is
+    already logged.
+    """
+    window = [day - timedelta(days=offset) for offset in range(CYCLE_DAYS - 1, -1, -1)]
+    rows = _rows(driver_id, window[0], day + timedelta(days=RECAP_DAYS - 1))
+    used, restarted_at = _used(rows, day, CYCLE_DAYS)
+
+    recap = []
+    for offset in range(1, RECAP_DAYS + 1):
+        next_day = day + timedelta(days=offset)
+        before, _ = _used(rows, next_day - timedelta(days=1), CYCLE_DAYS - 1)
+        recap.append({
+            'date': next_day.isoformat(),
+            'hours_available': round(max(0.0, WEEKLY_CYCLE_LIMIT - before), 2),
+        })
+
+    return {
+        'driver_id': driver_id,
+        'date': day.isoformat(),
+        'cycle_limit': WEEKLY_CYCLE_LIMIT,
+        'cycle_days': CYCLE_DAYS,
+        'hours_used': round(used, 2),
+        'hours_available': round(max(0.0, WEEKLY_CYCLE_LIMIT - used), 2),
+        'last_restart': restarted_at.isoformat() if restarted_at else None,
+        'days': [
+            {
+                'date': window_day.isoformat(),
+                'on_duty_hours': round(rows[window_day].on_duty_hours, 2) if window_day in rows else 0.0,
+                'driving_hours': round(rows[window_day].driving_hours, 2) if window_day in rows else 0.0,
+            }
+            for window_day in window
+        ],
+        'recap': recap,
+    }
@@ -0,0 +1,90 @@
+import numpy as np
+from django.conf import settings
+from django.db.models import Q
+
+from . import geodesic, geohash
+from .models import Location
+
+DEFAULT_INTERN_TOLERANCE_MILES = 0.03  # About 50 m: the same yard, truck stop or dock
+INTERN_CHUNK = 50  # Points looked up per query, keeps the OR list short
+
+
+def cells_filter(cells):
+    """Match geohashes under any of the prefixes, as index range scans.
+
+    A range rather than startswith, since SQLite's case-insensitive LIKE
+    cannot use the index.
+    """
+    query = Q()
+    for cell in cells:
+        query |= Q(geohash__gte=cell, geohash__lt=cell + '~')
+    return query
+
+
+def nearby(lat, lng, radius_miles, limit=None, queryset=None):
+    """Locations within radius_miles of a point, nearest first, with .distance_miles set"""
+    queryset = Location.objects.all() if queryset is None else queryset
+    cells = geohash.neighbourhood(lat, lng, radius_miles)
+    if cells is not None:
+        queryset = queryset.filter(cells_filter(cells))
+    candidates = list(queryset)
+    if not candidates:
+        return []
+    distances = geodesic.haversine(
+        lat, lng,
+        np.array([c.latitude for c in candidates]), np.array([c.longitude for c in candidates])
+    )
+    order = [i for i in np.argsort(distances, kind='stable') if distances[i] <= radius_miles]
+    found = []
+    for i in order[:limit]:
+        candidates[i].distance_miles = float(distances[i])
+        found.append(candidates[i])
+    return found
+
+
+def intern_locations(points):
+    """Location rows for lat/lng/name dicts, reusing saved rows where possible.
+
+    A point reuses the nearest row with the same name within
+    LOCATION_INTERN_TOLERANCE miles (a repeated lane's endpoints and stops),
+    including rows created earlier in the same call. One lookup query per
+    INTERN_CHUNK points plus one bulk insert for the rows still missing.
+    """
+    tolerance = getattr(settings, 'LOCATION_INTERN_TOLERANCE', DEFAULT_INTERN_TOLERANCE_MILES)
+    lats = np.array([point['lat'] for point in points], dtype=np.float64)
+    lngs = np.array([point['lng'] for point in points], dtype=np.float64)
+
+    candidates = []
+    for start in range(0, len(points), INTERN_CHUNK):
+        cells = set()
+        for lat, lng in zip(lats[start:start + INTERN_CHUNK], lngs[start:start + INTERN_CHUNK]):
+            cells |= geohash.neighbourhood(lat, lng, tolerance) or set()
+        if cells:
+            candidates.extend(Location.objects.filter(cells_filter(cells)))
+    by_name = {}
+    for candidate in {c.pk: c for c in candidates}.values():
+        by_name.setdefault(candidate.name, []).append(candidate)
+
+    rows, created = [], []
+    for point, lat, lng in zip(points, lats, lngs):
+        same_name = by_name.setdefault(point['name'], [])
+        match = None
+        if same_name:
+            distances = geodesic.haversine(
+                lat, lng,
+                np.array([c.latitude for c in same_name]), np.array([c.longitude for c in same_name])
+            )
+            nearest = int(np.argmin(distances))
+            if distances[nearest] <= tolerance:
+                match = same_name[nearest]
+        if match is None:
+            match = Location(
+                name=point['name'], latitude=float(lat), longitude=float(lng),
+                geohash=geohash.encode(lat, lng)
+            )
+            same_name.append(match)
+            created.append(match)
+        rows.append(match)
+    # bulk_create sets the new rows' PKs
+    Location.objects.bulk_create(created)
+    return rows
@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from api.models import ELDLog, ELDLogEntry
+from api.persistence import build_log_entries
+
+
+class Command(BaseCommand):
+    help = 'Write ELDLogEntry rows for ELD logs saved before entries were materialized'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Logs converted per transaction (default 500)')
+        parser.add_argument('--rebuild', action='store_true',
+                            help='Also rewrite the entries of logs that already have them')
+
+    def handle(self, *args, **options):
+        logs = ELDLog.objects.order_by('id').only('id', 'driver_id', 'log_date', 'status_entries')
+        if not options['rebuild']:
+            logs = logs.filter(entries__isnull=True)
+
+        last_id, converted, written = 0, 0, 0
+        while True:
+            batch = list(logs.filter(id__gt=last_id)[:options['batch_size']])
+            if not batch:
+                break
+            with transaction.atomic():
+                if options['rebuild']:
+                    ELDLogEntry.objects.filter(eld_log__in=batch).delete()
+                entries = ELDLogEntry.objects.bulk_create(
+                    [entry for eld_log in batch for entry in build_log_entries(eld_log)]
+                )
+            last_id = batch[-1].id
+            converted += len(batch)
+            written += len(entries)
+            self.stdout.write(f'{converted} logs converted')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Wrote {written} entries for {converted} ELD logs'
+        ))
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from api import geohash
+from api.models import Location
+
+
+class Command(BaseCommand):
+    help = 'Fill in the geohash of Location rows saved before the column existed'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Rows updated per query (default 1000)')
+
+    def handle(self, *args, **options):
+        missing = Location.objects.filter(geohash='').order_by('id').only('id', 'latitude', 'longitude')
+        updated = 0
+        while True:
+            batch = list(missing[:options['batch_size']])
+            if not batch:
+                break
+            for location in batch:
+                location.geohash = geohash.encode(location.latitude, location.longitude)
+            Location.objects.bulk_update(batch, ['geohash'])
+            updated += len(batch)
+        self.stdout.write(self.style.SUCCESS(f'Set the geohash of {updated} locations'))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api.road_graph import RoadGraph, build_graph_from_json
+
+
+class Command(BaseCommand):
+    help = 'Build a memory-mappable road graph file for the offline router from a JSON spec'
+
+    def add_arguments(self, parser):
+        parser.add_argument('source', help='JSON file with "nodes" and "edges"')
+        parser.add_argument('output', help='Path of the binary graph file to write')
+
+    def handle(self, *args, **options):
+        try:
+            nodes, edges = build_graph_from_json(options['source'], options['output'])
+        except (OSError, KeyError, ValueError) as exc:
+            raise CommandError(f'Could not build road graph: {exc}')
+        graph = RoadGraph(options['output'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {options['output']}: {nodes} nodes, {edges} directed edges, "
+            f"{len(graph.names)} road names"
+        ))
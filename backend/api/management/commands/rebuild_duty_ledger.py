@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from api.ledger import rebuild_ledger
+
+
+class Command(BaseCommand):
+    help = "Recompute drivers' daily duty totals (the 70-hour cycle ledger) from stored ELD logs"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--driver', action='append', dest='drivers',
+                            help='Only this driver (repeatable; default all drivers)')
+
+    def handle(self, *args, **options):
+        rows = rebuild_ledger(options['drivers'])
+        self.stdout.write(self.style.SUCCESS(f'Wrote {rows} driver-day rows'))
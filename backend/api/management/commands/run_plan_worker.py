@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from api.jobs import DEFAULT_POLL_INTERVAL, PlanWorker
+
+
+class Command(BaseCommand):
+    help = 'Process queued trip-planning jobs with a local pool of worker threads'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=4,
+                            help='Jobs processed in parallel (default 4)')
+        parser.add_argument('--poll-interval', type=float, default=DEFAULT_POLL_INTERVAL,
+                            help='Seconds an idle worker waits before checking again')
+        parser.add_argument('--visibility-timeout', type=int, default=None,
+                            help='Seconds before a stalled job may be claimed by another worker')
+        parser.add_argument('--once', action='store_true',
+                            help='Exit once the queue is empty instead of polling forever')
+
+    def handle(self, *args, **options):
+        worker = PlanWorker(
+            concurrency=options['concurrency'],
+            poll_interval=options['poll_interval'],
+            visibility_timeout=options['visibility_timeout'],
+        )
+        self.stdout.write(f"Plan worker {worker.name} running {worker.concurrency} threads")
+        worker.run(once=options['once'])
+        self.stdout.write(self.style.SUCCESS(f'Processed {worker.processed} jobs'))
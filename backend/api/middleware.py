@@ -0,0 +1,186 @@
+import gzip
+import time
+import zlib
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+from django.utils.cache import patch_vary_headers
+
+from .metrics import REQUEST_QUERIES, REQUEST_SECONDS, finish_request, start_request
+
+try:
+    import brotli
+except ImportError:  # Optional - responses are only gzipped without it
+    brotli = None
+
+DEFAULT_COMPRESSION_MIN_LENGTH = 512  # Smaller bodies are not worth compressing
+DEFAULT_GZIP_LEVEL = 6
+DEFAULT_BROTLI_QUALITY = 4  # Brotli's sweet spot for dynamic content; 11 is for static assets
+COMPRESSIBLE_TYPES = ('application/json', 'application/x-ndjson', 'text/')
+
+
+class ServerTimingMiddleware:
+    """Per-request stage timings as a Server-Timing header, plus request metrics.
+
+    Stages are recorded by metrics.timed() inside the views; the middleware
+    adds SQL time and query count (via a cheap execute wrapper) and the
+    total, and feeds the request histograms served at /api/metrics.
+    A streamed response is planned while its body is iterated, after the
+    headers have gone out, so it gets no header; its metrics cover the
+    whole stream and are recorded when the stream closes.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        db = {'queries': 0, 'seconds': 0.0}
+        timings = {}
+        started = time.perf_counter()
+        with self.measuring(db, timings):
+            response = self.get_response(request)
+
+        if response.streaming:
+            response.streaming_content = self.measure_stream(
+                response.streaming_content, request, response, db, timings, started
+            )
+            return response
+
+        total = time.perf_counter() - started
+        self.record(request, response, db, total)
+        metrics = [f'{stage};dur={seconds * 1000:.1f}' for stage, seconds in timings.items()]
+        metrics.append(f'db;desc="{db["queries"]} queries";dur={db["seconds"] * 1000:.1f}')
+        metrics.append(f'total;dur={total * 1000:.1f}')
+        response['Server-Timing'] = ', '.join(metrics)
+        return response
+
+    @contextmanager
+    def measuring(self, db, timings):
+        """Count queries into db and collect stage timings into timings inside the block"""
+        def count_query(execute, sql, params, many, context):
+            started = time.perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                db['queries'] += 1
+                db['seconds'] += time.perf_counter() - started
+
+        token = start_request(timings)
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(count_query))
+                yield
+        finally:
+            finish_request(token)
+
+    def measure_stream(self, chunks, request, response, db, timings, started):
+        """Yield the streamed body, measuring the work behind each chunk"""
+        chunks = iter(chunks)
+        try:
+            while True:
+                # The stream runs after __call__ returned, so measuring is entered per chunk
+                with self.measuring(db, timings):
+                    chunk = next(chunks, None)
+                if chunk is None:
+                    return
+                yield chunk
+        finally:
+            self.record(request, response, db, time.perf_counter() - started)
+
+    def record(self, request, response, db, total):
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match and match.view_name else 'unmatched'
+        REQUEST_SECONDS.observe(total, view=view, method=request.method,
+                                status=str(response.status_code))
+        REQUEST_QUERIES.observe(db['queries'], view=view)
+
+
+def accepted_encodings(header):
+    """Content codings the client accepts (q > 0), from an Accept-Encoding header"""
+    accepted = set()
+    for item in header.split(','):
+        coding, _, params = item.strip().partition(';')
+        quality = 1.0
+        for param in params.split(';'):
+            name, _, value = param.strip().partition('=')
+            if name == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if coding and quality > 0:
+            accepted.add(coding.strip().lower())
+    return accepted
+
+
+class CompressionMiddleware:
+    """Brotli or gzip response compression, negotiated from Accept-Encoding.
+
+    Brotli is preferred when the optional brotli package is installed.
+    Streaming responses are compressed chunk by chunk with a flush after
+    each, so NDJSON records still reach the client as they are planned.
+    Like Django's GZipMiddleware, strong ETags are made weak, since the
+    compressed bytes differ from the identity representation.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.min_length = getattr(settings, 'COMPRESSION_MIN_LENGTH', DEFAULT_COMPRESSION_MIN_LENGTH)
+        self.gzip_level = getattr(settings, 'GZIP_LEVEL', DEFAULT_GZIP_LEVEL)
+        self.brotli_quality = getattr(settings, 'BROTLI_QUALITY', DEFAULT_BROTLI_QUALITY)
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if response.has_header('Content-Encoding') or not self.compressible(response):
+            return response
+        patch_vary_headers(response, ('Accept-Encoding',))
+
+        accepted = accepted_encodings(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        if brotli is not None and 'br' in accepted:
+            encoding = 'br'
+        elif 'gzip' in accepted:
+            encoding = 'gzip'
+        else:
+            return response
+
+        if response.streaming:
+            response.streaming_content = self.compress_stream(response.streaming_content, encoding)
+            del response['Content-Length']
+        else:
+            compressed = self.compress(response.content, encoding)
+            if len(compressed) >= len(response.content):
+                return response
+            response.content = compressed
+            response['Content-Length'] = str(len(compressed))
+
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        response['Content-Encoding'] = encoding
+        return response
+
+    def compressible(self, response):
+        content_type = response.get('Content-Type', '')
+        if not content_type.startswith(COMPRESSIBLE_TYPES):
+            return False
+        return response.streaming or len(response.content) >= self.min_length
+
+    def compress(self, content, encoding):
+        if encoding == 'br':
+            return brotli.compress(content, quality=self.brotli_quality)
+        return gzip.compress(content, compresslevel=self.gzip_level, mtime=0)
+
+    def compress_stream(self, chunks, encoding):
+        if encoding == 'br':
+            compressor = brotli.Compressor(quality=self.brotli_quality)
+            for chunk in chunks:
+                yield compressor.process(chunk) + compressor.flush()
+            yield compressor.finish()
+        else:
+            # wbits=31 writes a gzip header and trailer around the deflate stream
+            compressor = zlib.compressobj(self.gzip_level, zlib.DEFLATED, 31)
+            for chunk in chunks:
+                yield compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+            yield compressor.flush()
@@ -1,20 +1,40 @@
 from django.db import models
 from django.conf import settings
 
+from . import geohash
+
 class Location(models.Model):
-    """Model for storing location coordinates"""
+    """Model for storing location coordinates.
+
+    Rows are shared between trips (see api.locations.intern_locations), so
+    they are never edited in place, and cannot be deleted while referenced.
+    """
     name = models.CharField(max_length=255)
     latitude = models.FloatField()
     longitude = models.FloatField()
     address = models.TextField(blank=True, null=True)
+    geohash = models.CharField(
+        max_length=12,
+        blank=True,
+        default='',
+        editable=False,
+        help_text="Geohash of the coordinates; its prefixes index proximity lookups"
+    )
     created_at = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        self.geohash = geohash.encode(self.latitude, self.longitude)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'latitude', 'longitude'} & set(update_fields):
+            kwargs['update_fields'] = set(update_fields) | {'geohash'}
+        super().save(*args, **kwargs)
+
     class Meta:
         indexes = [
-            models.Index(fields=['latitude', 'longitude']),
+            models.Index(fields=['geohash'], name='location_geohash_idx'),
         ]
 
 class Trip(models.Model):
@@ -27,21 +47,21 @@ class Trip(models.Model):
 
     current_location = models.ForeignKey(
         Location, 
-        on_delete=models.CASCADE, 
+        on_delete=models.PROTECT, 
         related_name='current_trips',
         null=True,
         blank=True
     )
     pickup_location = models.ForeignKey(
         Location, 
-        on_delete=models.CASCADE, 
+        on_delete=models.PROTECT, 
         related_name='pickup_trips',
         null=True,
         blank=True
     )
     dropoff_location = models.ForeignKey(
         Location, 
-        on_delete=models.CASCADE, 
+        on_delete=models.PROTECT, 
         related_name='dropoff_trips',
         null=True,
         blank=True
@@ -68,6 +88,12 @@ class Trip(models.Model):
     def __str__(self):
         return f"Trip #{self.id} - {self.status}"
 
+    class Meta:
+        indexes = [
+            # Keyset pagination walks trips newest first by (created_at, id)
+            models.Index(fields=['-created_at', '-id'], name='trip_created_id_idx'),
+        ]
+
 class Route(models.Model):
     """Model for storing route information"""
     trip = models.ForeignKey(
@@ -110,7 +136,7 @@ class Stop(models.Model):
     )
     location = models.ForeignKey(
         Location, 
-        on_delete=models.CASCADE
+        on_delete=models.PROTECT
     )
     stop_type = models.CharField(
         max_length=20, 
@@ -182,6 +208,11 @@ class ELDLog(models.Model):
     def __str__(self):
         return f"ELD Log - {self.log_date} for Trip #{self.trip.id}"
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['driver_id', 'log_date'], name='eldlog_driver_date_idx'),
+        ]
+
 class ELDLogEntry(models.Model):
     """Individual entries within an ELD log"""
     eld_log = models.ForeignKey(
@@ -189,6 +220,11 @@ class ELDLogEntry(models.Model):
         on_delete=models.CASCADE, 
         related_name='entries'
     )
+    driver_id = models.CharField(
+        max_length=50,
+        default='DRV001',
+        help_text="Copied from the log so driver/time queries need no join"
+    )
     event_time = models.DateTimeField()
     status = models.CharField(
         max_length=20, 
@@ -196,7 +232,7 @@ class ELDLogEntry(models.Model):
     )
     location = models.ForeignKey(
         Location, 
-        on_delete=models.CASCADE,
+        on_delete=models.PROTECT,
         null=True,
         blank=True
     )
@@ -213,3 +249,124 @@ class ELDLogEntry(models.Model):
 
     def __str__(self):
         return f"Entry - {self.event_time} - {self.status}"
+
+    class Meta:
+        indexes = [
+            # "Driver X's events in a time window", optionally for one status
+            models.Index(fields=['driver_id', 'event_time'], name='eldentry_driver_time_idx'),
+            models.Index(fields=['driver_id', 'status', 'event_time'],
+                         name='eldentry_driver_status_idx'),
+            models.Index(fields=['status', 'event_time'], name='eldentry_status_time_idx'),
+        ]
+
+class DutyDay(models.Model):
+    """One driver's on-duty totals for one calendar day, kept by api.ledger.
+
+    Rebuilt from the stored ELD logs whenever logs are saved or deleted,
+    so the 70-hour/8-day cycle is a sum over at most eight rows instead of
+    a scan of the driver's logs. The logs are plans, so these are planned
+    hours, not hours actually worked.
+    """
+    driver_id = models.CharField(max_length=50)
+    day = models.DateField()
+    on_duty_hours = models.FloatField(
+        default=0,
+        help_text="Driving plus on-duty (not driving) hours"
+    )
+    driving_hours = models.FloatField(default=0)
+    restarted_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        help_text="End of the latest 34-hour restart that finished on this day"
+    )
+    hours_since_restart = models.FloatField(
+        default=0,
+        help_text="On-duty hours on this day after restarted_at"
+    )
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.driver_id} - {self.day}: {self.on_duty_hours:.2f}h"
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['driver_id', 'day'], name='dutyday_driver_day_uniq'),
+        ]
+
+class PlanJob(models.Model):
+    """Queued trip-planning request, processed by the run_plan_worker command"""
+    KIND_CHOICES = [
+        ('calculate', 'Calculate Route'),
+        ('create_trip', 'Create Trip'),
+    ]
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('succeeded', 'Succeeded'),
+        ('failed', 'Failed'),
+    ]
+
+    kind = models.CharField(
+        max_length=20,
+        choices=KIND_CHOICES,
+        default='create_trip'
+    )
+    status = models.CharField(
+        max_length=20,
+        choices=STATUS_CHOICES,
+        default='queued'
+    )
+    payload = models.JSONField(
+        help_text="Trip input as submitted, validated again by the worker"
+    )
+    result = models.JSONField(
+        null=True,
+        blank=True,
+        help_text="Calculated plan, or the created trip id"
+    )
+    error = models.TextField(blank=True, default='')
+    trip = models.ForeignKey(
+        Trip,
+        on_delete=models.SET_NULL,
+        related_name='jobs',
+        null=True,
+        blank=True
+    )
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=3)
+    available_at = models.DateTimeField(
+        help_text="Earliest time a worker may claim the job (delayed on retry)"
+    )
+    locked_by = models.CharField(max_length=100, blank=True, default='')
+    locked_until = models.DateTimeField(
+        null=True,
+        blank=True,
+        help_text="Visibility timeout; after this a stalled job can be reclaimed"
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    queue_seconds = models.FloatField(
+        null=True,
+        blank=True,
+        help_text="Time from submission to the final attempt starting"
+    )
+    run_seconds = models.FloatField(
+        null=True,
+        blank=True,
+        help_text="Duration of the final attempt"
+    )
+
+    def __str__(self):
+        return f"Plan job #{self.id} - {self.status}"
+
+    @property
+    def is_finished(self):
+        return self.status in ('succeeded', 'failed')
+
+    class Meta:
+        indexes = [
+            # Workers claim the oldest available job in each state
+            models.Index(fields=['status', 'available_at'], name='planjob_claim_idx'),
+            models.Index(fields=['status', 'locked_until'], name='planjob_lease_idx'),
+        ]
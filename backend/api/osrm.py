@@ -0,0 +1,253 @@
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+from .metrics import OSRM_SECONDS
+
+# Responses OSRM returns for a healthy server that simply cannot route the request
+NO_ROUTE_CODES = ('NoRoute', 'NoSegment', 'NoTable', 'NoMatch')
+RETRYABLE_STATUS = (429, 500, 502, 503, 504)
+
+
+class OSRMError(Exception):
+    """Raised when OSRM cannot produce a usable response"""
+
+
+class OSRMNoRoute(OSRMError):
+    """OSRM answered, but found no route between the coordinates"""
+
+
+class CircuitOpenError(OSRMError):
+    """Raised without touching the network while the circuit breaker is open"""
+
+
+class _Retryable(OSRMError):
+    pass
+
+
+class CircuitBreaker:
+    """Closed/open/half-open breaker guarding calls to an upstream service"""
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._state == self.OPEN and self._cooled_down():
+                return self.HALF_OPEN
+            return self._state
+
+    def _cooled_down(self):
+        return time.monotonic() - self._opened_at >= self.reset_timeout
+
+    def allow(self):
+        """Return True if a call may go upstream; lets one probe through after the cool-down"""
+        with self._lock:
+            if self._state == self.CLOSED:
+                return True
+            if self._state == self.OPEN:
+                if not self._cooled_down():
+                    return False
+                self._state = self.HALF_OPEN
+            if self._probe_in_flight:
+                return False
+            self._probe_in_flight = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self._state = self.CLOSED
+            self._failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._probe_in_flight = False
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+
+    def snapshot(self):
+        state = self.state
+        with self._lock:
+            retry_in = 0.0
+            if state == self.OPEN:
+                retry_in = max(0.0, self.reset_timeout - (time.monotonic() - self._opened_at))
+            return {
+                'state': state,
+                'consecutive_failures': self._failures,
+                'failure_threshold': self.failure_threshold,
+                'reset_timeout': self.reset_timeout,
+                'retry_in': round(retry_in, 1),
+            }
+
+
+class OSRMClient:
+    """Keep-alive OSRM client with bounded retries, optional hedging and a circuit breaker"""
+
+    def __init__(self, base_url, connect_timeout=3.05, read_timeout=10, retries=2,
+                 backoff=0.25, backoff_max=2.0, deadline=12, hedge_after=None,
+                 pool_size=16, breaker=None):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = (connect_timeout, read_timeout)
+        self.retries = retries
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.deadline = deadline
+        self.hedge_after = hedge_after
+        self.breaker = breaker or CircuitBreaker()
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self._hedge_executor = None
+        if hedge_after:
+            self._hedge_executor = ThreadPoolExecutor(
+                max_workers=pool_size, thread_name_prefix='osrm-hedge'
+            )
+
+    @classmethod
+    def from_settings(cls):
+        return cls(
+            base_url=getattr(settings, 'OSRM_BASE_URL', 'https://router.project-osrm.org'),
+            connect_timeout=getattr(settings, 'OSRM_CONNECT_TIMEOUT', 3.05),
+            read_timeout=getattr(settings, 'OSRM_READ_TIMEOUT', 10),
+            retries=getattr(settings, 'OSRM_RETRIES', 2),
+            backoff=getattr(settings, 'OSRM_BACKOFF', 0.25),
+            backoff_max=getattr(settings, 'OSRM_BACKOFF_MAX', 2.0),
+            deadline=getattr(settings, 'OSRM_DEADLINE', 12),
+            hedge_after=getattr(settings, 'OSRM_HEDGE_AFTER', None),
+            pool_size=getattr(settings, 'OSRM_POOL_SIZE', 16),
+            breaker=CircuitBreaker(
+                failure_threshold=getattr(settings, 'OSRM_BREAKER_THRESHOLD', 5),
+                reset_timeout=getattr(settings, 'OSRM_BREAKER_RESET', 30),
+            ),
+        )
+
+    def route(self, origin, destination, **params):
+        """Call the OSRM route service between two lat/lng dicts"""
+        coordinates = f"{origin['lng']},{origin['lat']};{destination['lng']},{destination['lat']}"
+        return self.request('route', coordinates, params)
+
+    def table(self, sources, destinations, **params):
+        """Call the OSRM table service for a sources x destinations block of lat/lng dicts"""
+        points = list(sources) + list(destinations)
+        coordinates = ';'.join(f"{point['lng']},{point['lat']}" for point in points)
+        params.setdefault('sources', ';'.join(str(i) for i in range(len(sources))))
+        params.setdefault('destinations', ';'.join(
+            str(i) for i in range(len(sources), len(points))
+        ))
+        params.setdefault('annotations', 'duration,distance')
+        return self.request('table', coordinates, params)
+
+    def request(self, service, coordinates, params=None):
+        """Call an OSRM service and return the decoded 'Ok' payload"""
+        if not self.breaker.allow():
+            raise CircuitOpenError('OSRM circuit breaker is open')
+        url = f'{self.base_url}/{service}/v1/driving/{coordinates}'
+        started = time.perf_counter()
+        try:
+            data = self._get_with_retries(url, params or {})
+        except OSRMNoRoute:
+            OSRM_SECONDS.observe(time.perf_counter() - started, service=service, outcome='no_route')
+            self.breaker.record_success()
+            raise
+        except OSRMError:
+            OSRM_SECONDS.observe(time.perf_counter() - started, service=service, outcome='error')
+            self.breaker.record_failure()
+            raise
+        OSRM_SECONDS.observe(time.perf_counter() - started, service=service, outcome='ok')
+        self.breaker.record_success()
+        return data
+
+    def _get_with_retries(self, url, params):
+        deadline_at = time.monotonic() + self.deadline
+        for attempt in range(self.retries + 1):
+            try:
+                return self._hedged_get(url, params, deadline_at)
+            except _Retryable as exc:
+                delay = random.uniform(0, min(self.backoff_max, self.backoff * 2 ** attempt))
+                out_of_time = time.monotonic() + delay >= deadline_at
+                if attempt == self.retries or out_of_time:
+                    raise OSRMError(str(exc)) from exc
+                time.sleep(delay)
+
+    def _attempt_timeout(self, deadline_at):
+        """(connect, read) timeout for a request, cut to the time left before the deadline"""
+        remaining = deadline_at - time.monotonic()
+        if remaining <= 0:
+            raise _Retryable('OSRM deadline exceeded')
+        return tuple(min(timeout, remaining) for timeout in self.timeout)
+
+    def _hedged_get(self, url, params, deadline_at):
+        if self._hedge_executor is None:
+            return self._get(url, params, deadline_at)
+        primary = self._hedge_executor.submit(self._get, url, params, deadline_at)
+        done, _ = wait([primary], timeout=self.hedge_after)
+        if done:
+            return primary.result()
+
+        # Primary is slow - race a second request and take whichever succeeds first
+        pending = {primary, self._hedge_executor.submit(self._get, url, params, deadline_at)}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    return future.result()
+                except OSRMError as exc:
+                    error = exc
+        raise error
+
+    def _get(self, url, params, deadline_at):
+        timeout = self._attempt_timeout(deadline_at)
+        try:
+            response = self.session.get(url, params=params, timeout=timeout)
+        except requests.RequestException as exc:
+            raise _Retryable(f'OSRM request failed: {exc}') from exc
+
+        if response.status_code in RETRYABLE_STATUS:
+            raise _Retryable(f'OSRM returned HTTP {response.status_code}')
+        try:
+            data = response.json()
+        except ValueError as exc:
+            raise OSRMError('OSRM returned invalid JSON') from exc
+
+        code = data.get('code')
+        if code in NO_ROUTE_CODES:
+            raise OSRMNoRoute(data.get('message', code))
+        if response.status_code >= 400 or code != 'Ok':
+            raise OSRMError(data.get('message') or f'OSRM returned {code or response.status_code}')
+        return data
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_osrm_client():
+    """Return the process-wide OSRM client, building it on first use"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = OSRMClient.from_settings()
+    return _client
@@ -0,0 +1,171 @@
+from datetime import datetime
+
+from django.db import transaction
+
+from .hos import entry_time
+from .ledger import record_logs
+from .locations import intern_locations
+from .models import Trip, Route, Stop, ELDLog, ELDLogEntry
+
+
+class TripChanged(Exception):
+    """The trip was saved by someone else after a re-plan read it"""
+
+
+def save_trip_plan(data, result):
+    """Persist a calculated plan as a Trip with its route, stops and ELD logs.
+
+    Runs in one transaction with a fixed number of queries (one bulk insert per
+    table, plus the driver ledger update) however many stops and days the trip has.
+    """
+    waypoints = result['waypoints']
+    pickup = next((w for w in waypoints[1:-1] if w['stop_type'] == 'pickup'), None)
+    endpoints = [waypoints[0], waypoints[-1]] + ([pickup] if pickup else [])
+
+    with transaction.atomic():
+        # Endpoint and stop locations go in together, reusing rows saved by earlier trips
+        locations = intern_locations([
+            {'name': point['name'], 'lat': point['lat'], 'lng': point['lng']}
+            for point in endpoints
+        ] + [
+            {
+                'name': stop_data['location']['name'],
+                'lat': stop_data['location'].get('lat', 0),
+                'lng': stop_data['location'].get('lng', 0)
+            }
+            for stop_data in result['stops']
+        ])
+        current_loc, dropoff_loc = locations[0], locations[1]
+        pickup_loc = locations[2] if pickup else None
+        stop_locations = locations[len(endpoints):]
+
+        trip = Trip.objects.create(
+            current_location=current_loc,
+            pickup_location=pickup_loc,
+            dropoff_location=dropoff_loc,
+            current_cycle_used=data['current_cycle_used'],
+            status='planned',
+            total_distance=result['distance_miles'],
+            estimated_duration=result['duration_hours']
+        )
+
+        Route.objects.create(
+            trip=trip,
+            polyline=result.get('polyline', ''),
+            distance=result['distance_miles'],
+            duration=result['duration_hours'] * 3600,
+            steps=result['steps']
+        )
+
+        save_stops(trip, result['stops'], stop_locations)
+        record_logs(save_logs(trip, result['eld_logs']))
+
+    return trip
+
+
+def save_stops(trip, stops, locations, first_order=0):
+    """Bulk insert planned stops at their interned locations, numbered from first_order"""
+    Stop.objects.bulk_create([
+        Stop(
+            trip=trip,
+            location=loc,
+            stop_type=stop_data['stop_type'],
+            arrival_time=datetime.fromisoformat(stop_data['arrival_time']),
+            departure_time=datetime.fromisoformat(stop_data['departure_time']),
+            duration=stop_data['duration'],
+            miles_driven=stop_data['miles_driven'],
+            notes=stop_data.get('notes', ''),
+            sequence_order=first_order + i
+        )
+        for i, (stop_data, loc) in enumerate(zip(stops, locations))
+    ])
+
+
+def save_logs(trip, logs):
+    """Bulk insert planned ELD logs and their entry rows; returns the saved logs"""
+    eld_logs = ELDLog.objects.bulk_create([
+        ELDLog(
+            trip=trip,
+            log_date=datetime.fromisoformat(log_data['log_date']).date(),
+            driver_id=log_data['driver_id'],
+            carrier_name=log_data['carrier_name'],
+            truck_number=log_data['truck_number'],
+            total_miles=log_data['total_miles'],
+            cycle_hours_used=log_data['cycle_hours_used'],
+            status_entries=log_data['status_entries']
+        )
+        for log_data in logs
+    ])
+    ELDLogEntry.objects.bulk_create(
+        [entry for eld_log in eld_logs for entry in build_log_entries(eld_log)]
+    )
+    return eld_logs
+
+
+def save_replan(trip, plan):
+    """Swap a stored trip's future stops and logs for a re-plan from replan.plan_remaining().
+
+    Stops that had finished by the re-plan time and logs of earlier days
+    stay as they are. The ledger is rebuilt for the days that changed.
+
+    The plan was made from the trip as read at trip.updated_at. The trip
+    row is locked before anything is written, and TripChanged is raised
+    if it has been saved since (say by a concurrent re-plan), so two
+    re-plans never leave a mix of both.
+    """
+    with transaction.atomic():
+        stored = Trip.objects.select_for_update().filter(pk=trip.pk).values_list(
+            'updated_at', flat=True
+        ).first()
+        if stored != trip.updated_at:
+            raise TripChanged(trip.pk)
+        trip.stops.filter(sequence_order__gte=plan['first_order']).delete()
+        # The ledger drops the deleted logs' hours on commit (api.signals)
+        trip.eld_logs.filter(log_date__gte=plan['log_date']).delete()
+
+        locations = intern_locations([
+            {
+                'name': stop_data['location']['name'],
+                'lat': stop_data['location'].get('lat', 0),
+                'lng': stop_data['location'].get('lng', 0)
+            }
+            for stop_data in plan['stops']
+        ])
+        save_stops(trip, plan['stops'], locations, first_order=plan['first_order'])
+        eld_logs = save_logs(trip, plan['eld_logs'])
+
+        route = plan.get('route')
+        if route is not None:
+            Route.objects.filter(trip=trip).update(
+                polyline=route['polyline'],
+                distance=route['distance_miles'],
+                duration=route['duration_hours'] * 3600,
+                steps=route['steps']
+            )
+        trip.total_distance = plan['distance_miles']
+        trip.estimated_duration = plan['duration_hours']
+        trip.save(update_fields=['total_distance', 'estimated_duration', 'updated_at'])
+        record_logs(eld_logs)
+
+
+def build_log_entries(eld_log):
+    """Unsaved ELDLogEntry rows for a log's status_entries.
+
+    The '24:00' entry that closes each day is skipped; the next day's
+    log opens with the same status at 00:00.
+    """
+    entries = []
+    for entry in eld_log.status_entries:
+        if entry['time'] == '24:00':
+            continue
+        entries.append(ELDLogEntry(
+            eld_log=eld_log,
+            driver_id=eld_log.driver_id,
+            event_time=entry_time(eld_log.log_date, entry),
+            status=entry['status'],
+            miles_at_entry=entry.get('miles', 0),
+            hours_remaining=entry.get('hours_remaining', 0),
+            notes=entry.get('location', '')
+        ))
+    return entries
+
@@ -0,0 +1,106 @@
+import hashlib
+import json
+import threading
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.base import InvalidCacheBackendError
+
+# Bump whenever a change alters planned routes, stops, logs or polylines so
+# results computed by an older engine are never served again
+PLAN_ENGINE_VERSION = 2
+DEFAULT_TTL = 24 * 3600  # Plans are tied to a start time, so a day is plenty
+
+
+def canonical_json(data):
+    """Stable JSON for validated input: sorted keys, compact, datetimes as ISO strings"""
+    return json.dumps(data, sort_keys=True, separators=(',', ':'), default=_encode_value)
+
+
+def _encode_value(value):
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+
+class PlanCache:
+    """Full calculate-route results memoized in a Django cache.
+
+    Keys are a SHA-256 of the canonical validated input plus the routing
+    backend and truck-stop settings; the engine version is passed as the cache version, so bumping
+    PLAN_ENGINE_VERSION invalidates every stored plan at once.
+    """
+
+    def __init__(self, alias='plans', ttl=DEFAULT_TTL, version=PLAN_ENGINE_VERSION):
+        self.ttl = ttl
+        self.version = version
+        try:
+            self.cache = caches[alias] if alias else None
+        except InvalidCacheBackendError:
+            self.cache = None
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'sets': 0}
+
+    @classmethod
+    def from_settings(cls):
+        return cls(
+            alias=getattr(settings, 'PLAN_CACHE_ALIAS', 'plans'),
+            ttl=getattr(settings, 'PLAN_CACHE_TTL', DEFAULT_TTL),
+        )
+
+    def make_key(self, data):
+        payload = canonical_json({
+            'input': data,
+            'routing_backend': getattr(settings, 'ROUTING_BACKEND', 'osrm'),
+            'truck_stops': [
+                getattr(settings, 'TRUCK_STOPS_PATH', None),
+                getattr(settings, 'TRUCK_STOP_MAX_DETOUR', None),
+                getattr(settings, 'TRUCK_STOP_MAX_BACKTRACK', None),
+            ],
+        })
+        return 'plan:' + hashlib.sha256(payload.encode()).hexdigest()
+
+    def get(self, key):
+        value = self.cache.get(key, version=self.version) if self.cache is not None else None
+        self._count('misses' if value is None else 'hits')
+        return value
+
+    def set(self, key, value):
+        if self.cache is not None:
+            self.cache.set(key, value, timeout=self.ttl, version=self.version)
+            self._count('sets')
+
+    def delete(self, key):
+        if self.cache is not None:
+            self.cache.delete(key, version=self.version)
+
+    def clear(self):
+        if self.cache is not None:
+            self.cache.clear()
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def stats(self):
+        """Return hit/miss counters and the engine version in use"""
+        with self._lock:
+            stats = dict(self._stats)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = round(stats['hits'] / lookups, 4) if lookups else 0.0
+        stats['engine_version'] = self.version
+        return stats
+
+
+_plan_cache = None
+_plan_cache_lock = threading.Lock()
+
+
+def get_plan_cache():
+    """Return the process-wide plan cache, building it on first use"""
+    global _plan_cache
+    if _plan_cache is None:
+        with _plan_cache_lock:
+            if _plan_cache is None:
+                _plan_cache = PlanCache.from_settings()
+    return _plan_cache
@@ -0,0 +1,163 @@
+from bisect import bisect_left
+
+from django.conf import settings
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+
+from .hos import DEFAULT_SPEED_MPH, EPSILON, DutyClocks, HOSScheduler, entry_time
+from .route_geometry import RouteGeometry
+
+DEFAULT_REPLAN_MAX_OFF_ROUTE_MILES = 2  # Further than this from the stored route, re-route
+
+
+def stored_waypoints(trip, stops):
+    """The trip's start and its pickup/drop-off stops, each with the trip mile it sits at"""
+    start = trip.current_location
+    waypoints = [{'lat': start.latitude, 'lng': start.longitude, 'stop_type': 'start',
+                  'name': start.name, 'mile': 0.0}]
+    for stop in stops:
+        if stop.stop_type in ('pickup', 'dropoff'):
+            waypoints.append({
+                'lat': stop.location.latitude, 'lng': stop.location.longitude,
+                'stop_type': stop.stop_type, 'name': stop.location.name,
+                'mile': stop.miles_driven,
+            })
+    return waypoints
+
+
+def leg_speeds(waypoints, stops, default):
+    """Average driving speed of each stored leg, from the drives planned on it"""
+    ends = [waypoint['mile'] for waypoint in waypoints[1:]]
+    totals = [[0.0, 0.0] for _ in ends]
+    previous = 0.0
+    for stop in stops:
+        if stop.stop_type == 'driving' and stop.duration > 0:
+            leg = min(bisect_left(ends, stop.miles_driven - EPSILON), len(ends) - 1)
+            totals[leg][0] += stop.miles_driven - previous
+            totals[leg][1] += stop.duration
+        previous = stop.miles_driven
+    return [miles / hours if hours > 0 else default for miles, hours in totals]
+
+
+def steps_between(steps, start, end):
+    """Stored turn steps starting between two trip miles, placed by their cumulative distance"""
+    found = []
+    mile = 0.0
+    for step in steps:
+        if start - EPSILON <= mile < end:
+            found.append(step)
+        mile += step['distance']
+    return found
+
+
+def plan_remaining(trip, data, calculator):
+    """Re-plan the rest of a stored trip from the truck's position and duty clocks.
+
+    The stored route geometry locates the truck: on the corridor nothing
+    is routed, and the remaining legs are measured along the stored route.
+    Off the corridor only the way back to the next pickup or drop-off is
+    routed, and the stored route is followed from there. Returns the new
+    future stops and logs in the shape persistence.save_replan() expects.
+    """
+    routes = list(trip.routes.all())
+    if not routes or not routes[0].polyline or trip.current_location is None:
+        raise ValidationError({'trip': 'This trip has no stored route to re-plan along.'})
+    route = routes[0]
+    stops = sorted(trip.stops.all(), key=lambda stop: stop.sequence_order)
+    now = data.get('current_time') or timezone.now()
+    here = {'lat': data['current_location']['lat'], 'lng': data['current_location']['lng']}
+
+    waypoints = stored_waypoints(trip, stops)
+    geometry = RouteGeometry.from_legs(
+        [waypoints[0], waypoints[-1]], [{'polyline': route.polyline, 'distance': route.distance}]
+    )
+    progress, off_route = geometry.project(here['lat'], here['lng'])
+    ahead = [i for i, waypoint in enumerate(waypoints) if i and waypoint['mile'] > progress + EPSILON]
+    if not ahead:
+        raise ValidationError(
+            {'current_location': 'No pickups or drop-offs are left ahead of this position.'}
+        )
+    hours = route.duration / 3600
+    speeds = leg_speeds(waypoints, stops, route.distance / hours if hours > 0 else DEFAULT_SPEED_MPH)
+    remaining = [dict(waypoints[i]) for i in ahead]
+    legs = []
+    mile = progress
+    for i, waypoint in zip(ahead, remaining):
+        legs.append({'distance': waypoint['mile'] - mile,
+                     'duration': (waypoint['mile'] - mile) / speeds[i - 1]})
+        mile = waypoint['mile']
+    past_hours = hours * progress / route.distance if route.distance > 0 else 0.0
+
+    max_off_route = getattr(settings, 'REPLAN_MAX_OFF_ROUTE', DEFAULT_REPLAN_MAX_OFF_ROUTE_MILES)
+    new_route = None
+    if off_route > max_off_route:
+        # Route back to the next stop only; the stored route still holds from there
+        rejoin = remaining[0]['mile']
+        detour = calculator.fetch_legs([here, remaining[0]])[0]
+        geometry = RouteGeometry.chain([
+            geometry.slice(0.0, progress),
+            RouteGeometry.from_legs([here, remaining[0]], [detour]),
+            geometry.slice(rejoin, geometry.total_miles),
+        ])
+        shift = progress + detour['distance'] - rejoin
+        for waypoint in remaining:
+            waypoint['mile'] += shift
+        legs[0] = {'distance': detour['distance'], 'duration': detour['duration']}
+        new_route = {
+            'polyline': geometry.encode(),
+            'distance_miles': geometry.total_miles,
+            'duration_hours': past_hours + sum(leg['duration'] for leg in legs),
+            'steps': (steps_between(route.steps, 0.0, progress) + detour.get('steps', [])
+                      + steps_between(route.steps, rejoin, float('inf'))),
+        }
+
+    # Stops already over and behind the truck stand; so does the day's log up to now
+    kept = []
+    for stop in stops:
+        if stop.departure_time > now or stop.miles_driven > progress + EPSILON:
+            break
+        kept.append(stop)
+    fuel_miles = [stop.miles_driven for stop in kept if stop.stop_type == 'fuel']
+    miles_since_fuel = data.get('miles_since_fuel')
+    if miles_since_fuel is None:
+        miles_since_fuel = progress - (fuel_miles[-1] if fuel_miles else 0.0)
+
+    logs = list(trip.eld_logs.all())
+    log_date = timezone.localtime(now).date()
+    today = next((log for log in logs if log.log_date == log_date), None)
+    earlier = [
+        entry for entry in (today.status_entries if today else [])
+        if entry['time'] != '24:00' and entry_time(log_date, entry) < now
+    ]
+    sample = today or (logs[0] if logs else None)
+    trip_data = {
+        'driver_id': sample.driver_id, 'carrier_name': sample.carrier_name,
+        'truck_number': sample.truck_number,
+    } if sample else {}
+
+    scheduler = HOSScheduler(
+        [{**here, 'stop_type': 'start', 'name': 'Current Location'}] + remaining, legs,
+        start_time=timezone.localtime(now), trip_data=trip_data,
+        clocks=DutyClocks(driving=data['driving_hours'], window=data['on_duty_hours'],
+                          since_break=data['hours_since_break'], cycle=data['current_cycle_used']),
+        start_mile=progress, miles_since_fuel=miles_since_fuel,
+        locate=geometry.locate, stop_finder=calculator.create_stop_finder(geometry),
+        log_entries=earlier
+    )
+    # Carry on the stored plan's numbering of drives and fuel stops
+    scheduler.segment = sum(1 for stop in kept if stop.stop_type == 'driving')
+    scheduler.fuel_stops = len(fuel_miles)
+    new_stops, new_logs = scheduler.run()
+
+    return {
+        'first_order': len(kept),
+        'log_date': log_date,
+        'stops': new_stops,
+        'eld_logs': new_logs,
+        'route': new_route,
+        'distance_miles': new_route['distance_miles'] if new_route else route.distance,
+        'duration_hours': new_route['duration_hours'] if new_route else trip.estimated_duration,
+        'progress_miles': round(progress, 1),
+        'off_route_miles': round(off_route, 2),
+        'rerouted': new_route is not None,
+    }
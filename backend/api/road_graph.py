@@ -0,0 +1,327 @@
+import heapq
+import json
+import math
+import mmap
+import struct
+import threading
+from pathlib import Path
+
+from django.conf import settings
+
+from . import polyline as polyline_codec
+
+# Binary road graph layout (little-endian, every array 8-byte aligned):
+#   header    MAGIC, node_count, edge_count, names_size, max_speed_mps
+#   nodes     lat float64[n], lng float64[n]
+#   forward   offsets uint32[n+1], targets uint32[m], length_m float32[m],
+#             time_s float32[m], name uint32[m]
+#   reverse   offsets uint32[n+1], sources uint32[m], edge uint32[m]
+#   names     NUL-separated UTF-8 road names
+MAGIC = b'RDGRAPH1'
+HEADER = struct.Struct('<8sIIId')
+EARTH_RADIUS_M = 6371008.8
+METERS_PER_MILE = 1609.344
+DEFAULT_MAX_SNAP_MILES = 50  # Give up (and fall back) if no node is this close
+ACCESS_SPEED_MPH = 35  # Assumed speed between a coordinate and its snapped node
+SNAP_CELL_DEGREES = 0.5
+
+
+def haversine_m(lat1, lng1, lat2, lng2):
+    """Great-circle distance in meters"""
+    lat1, lng1, lat2, lng2 = map(math.radians, (lat1, lng1, lat2, lng2))
+    a = (math.sin((lat2 - lat1) / 2) ** 2
+         + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_M * math.asin(math.sqrt(a))
+
+
+def _align(offset):
+    return (offset + 7) & ~7
+
+
+def write_graph(path, nodes, edges):
+    """Write a graph file from nodes [(lat, lng)] and directed edges.
+
+    Each edge is (source, target, length_m, time_s, name).
+    """
+    n, m = len(nodes), len(edges)
+    names = sorted({edge[4] for edge in edges})
+    name_index = {name: i for i, name in enumerate(names)}
+    names_blob = '\0'.join(names).encode('utf-8')
+    max_speed = max((edge[2] / edge[3] for edge in edges if edge[3] > 0), default=1.0)
+
+    forward = sorted(range(m), key=lambda i: edges[i][0])
+    reverse = sorted(range(m), key=lambda i: edges[i][1])
+    position = {edge_id: i for i, edge_id in enumerate(forward)}
+
+    def offsets(order, column):
+        counts = [0] * (n + 1)
+        for edge_id in order:
+            counts[edges[edge_id][column] + 1] += 1
+        for i in range(n):
+            counts[i + 1] += counts[i]
+        return counts
+
+    sections = [
+        ('d', [lat for lat, _ in nodes]),
+        ('d', [lng for _, lng in nodes]),
+        ('I', offsets(forward, 0)),
+        ('I', [edges[i][1] for i in forward]),
+        ('f', [edges[i][2] for i in forward]),
+        ('f', [edges[i][3] for i in forward]),
+        ('I', [name_index[edges[i][4]] for i in forward]),
+        ('I', offsets(reverse, 1)),
+        ('I', [edges[i][0] for i in reverse]),
+        ('I', [position[i] for i in reverse]),
+    ]
+    with open(path, 'wb') as fh:
+        fh.write(HEADER.pack(MAGIC, n, m, len(names_blob), max_speed))
+        for code, values in sections:
+            fh.write(b'\0' * (_align(fh.tell()) - fh.tell()))
+            fh.write(struct.pack(f'<{len(values)}{code}', *values))
+        fh.write(b'\0' * (_align(fh.tell()) - fh.tell()))
+        fh.write(names_blob)
+
+
+def build_graph_from_json(source, path):
+    """Build a graph file from a JSON description of nodes and road segments.
+
+    Nodes are {"id", "lat", "lng"}; edges are {"from", "to", "name"} with an
+    optional "speed_mph", "length_miles" and "oneway". Missing lengths are the
+    great-circle distance times "detour_factor" (default 1.0).
+    """
+    with open(source) as fh:
+        spec = json.load(fh)
+    ids = {node['id']: i for i, node in enumerate(spec['nodes'])}
+    nodes = [(node['lat'], node['lng']) for node in spec['nodes']]
+    detour = spec.get('detour_factor', 1.0)
+    default_speed = spec.get('default_speed_mph', 60)
+
+    edges = []
+    for edge in spec['edges']:
+        a, b = ids[edge['from']], ids[edge['to']]
+        if 'length_miles' in edge:
+            length = edge['length_miles'] * METERS_PER_MILE
+        else:
+            length = haversine_m(*nodes[a], *nodes[b]) * detour
+        speed = edge.get('speed_mph', default_speed) * METERS_PER_MILE / 3600
+        edges.append((a, b, length, length / speed, edge.get('name', '')))
+        if not edge.get('oneway', False):
+            edges.append((b, a, length, length / speed, edge.get('name', '')))
+    write_graph(path, nodes, edges)
+    return len(nodes), len(edges)
+
+
+class RoadGraph:
+    """Read-only CSR road graph backed by a memory-mapped file"""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        with open(self.path, 'rb') as fh:
+            self._mmap = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, n, m, names_size, self.max_speed = HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC:
+            raise ValueError(f'{self.path} is not a road graph file')
+        self.node_count, self.edge_count = n, m
+
+        view = memoryview(self._mmap)
+        offset = HEADER.size
+
+        def take(code, count, size):
+            nonlocal offset
+            offset = _align(offset)
+            array = view[offset:offset + count * size].cast(code)
+            offset += count * size
+            return array
+
+        self.lat = take('d', n, 8)
+        self.lng = take('d', n, 8)
+        self.fwd_offsets = take('I', n + 1, 4)
+        self.fwd_targets = take('I', m, 4)
+        self.fwd_length = take('f', m, 4)
+        self.fwd_time = take('f', m, 4)
+        self.fwd_name = take('I', m, 4)
+        self.rev_offsets = take('I', n + 1, 4)
+        self.rev_sources = take('I', m, 4)
+        self.rev_edge = take('I', m, 4)
+        offset = _align(offset)
+        blob = bytes(view[offset:offset + names_size]).decode('utf-8')
+        self.names = blob.split('\0') if blob else ['']
+
+        # Coarse grid over node coordinates for snapping
+        self._cells = {}
+        for i in range(n):
+            self._cells.setdefault(self._cell(self.lat[i], self.lng[i]), []).append(i)
+
+    def _cell(self, lat, lng):
+        return (math.floor(lat / SNAP_CELL_DEGREES), math.floor(lng / SNAP_CELL_DEGREES))
+
+    def nearest_node(self, lat, lng, max_distance_m):
+        """Return (node, distance_m) of the closest node, or (None, None) if none is in range"""
+        ci, cj = self._cell(lat, lng)
+        ring_m = SNAP_CELL_DEGREES * 111000 * max(0.1, math.cos(math.radians(lat)))
+        max_ring = int(max_distance_m / ring_m) + 1
+        best, best_d = None, max_distance_m
+        for ring in range(max_ring + 1):
+            for di in range(-ring, ring + 1):
+                for dj in range(-ring, ring + 1):
+                    if max(abs(di), abs(dj)) != ring:
+                        continue
+                    for node in self._cells.get((ci + di, cj + dj), ()):
+                        d = haversine_m(lat, lng, self.lat[node], self.lng[node])
+                        if d <= best_d:
+                            best, best_d = node, d
+            # Anything in a further ring is at least this far away
+            if best is not None and best_d <= ring * ring_m:
+                break
+        return (best, best_d) if best is not None else (None, None)
+
+    def shortest_path(self, source, target):
+        """Fastest path by bidirectional A*; returns (forward edge ids, seconds) or None"""
+        if source == target:
+            return [], 0.0
+        lat, lng, speed = self.lat, self.lng, self.max_speed
+
+        def potential(v):
+            # Average of forward and reverse heuristics keeps both searches consistent
+            to_target = haversine_m(lat[v], lng[v], lat[target], lng[target]) / speed
+            to_source = haversine_m(lat[v], lng[v], lat[source], lng[source]) / speed
+            return (to_target - to_source) / 2
+
+        dist_f, dist_r = {source: 0.0}, {target: 0.0}
+        parent_f, parent_r = {source: None}, {target: None}
+        done_f, done_r = set(), set()
+        heap_f = [(potential(source), source)]
+        heap_r = [(-potential(target), target)]
+        best, meeting = math.inf, None
+
+        while heap_f and heap_r:
+            if heap_f[0][0] + heap_r[0][0] >= best:
+                break
+            if heap_f[0][0] <= heap_r[0][0]:
+                _, u = heapq.heappop(heap_f)
+                if u in done_f:
+                    continue
+                done_f.add(u)
+                for e in range(self.fwd_offsets[u], self.fwd_offsets[u + 1]):
+                    v = self.fwd_targets[e]
+                    d = dist_f[u] + self.fwd_time[e]
+                    if d < dist_f.get(v, math.inf):
+                        dist_f[v] = d
+                        parent_f[v] = e
+                        heapq.heappush(heap_f, (d + potential(v), v))
+                    if v in dist_r and d + dist_r[v] < best:
+                        best, meeting = d + dist_r[v], v
+            else:
+                _, u = heapq.heappop(heap_r)
+                if u in done_r:
+                    continue
+                done_r.add(u)
+                for r in range(self.rev_offsets[u], self.rev_offsets[u + 1]):
+                    v = self.rev_sources[r]
+                    e = self.rev_edge[r]
+                    d = dist_r[u] + self.fwd_time[e]
+                    if d < dist_r.get(v, math.inf):
+                        dist_r[v] = d
+                        parent_r[v] = e
+                        heapq.heappush(heap_r, (d - potential(v), v))
+                    if v in dist_f and d + dist_f[v] < best:
+                        best, meeting = d + dist_f[v], v
+
+        if meeting is None:
+            return None
+        path = []
+        node = meeting
+        while parent_f[node] is not None:
+            e = parent_f[node]
+            path.append(e)
+            node = self._edge_source(e)
+        path.reverse()
+        node = meeting
+        while parent_r[node] is not None:
+            e = parent_r[node]
+            path.append(e)
+            node = self.fwd_targets[e]
+        return path, best
+
+    def _edge_source(self, e):
+        # Binary search the forward offsets for the node owning edge e
+        lo, hi = 0, self.node_count - 1
+        while lo < hi:
+            mid = (lo + hi + 1) // 2
+            if self.fwd_offsets[mid] <= e:
+                lo = mid
+            else:
+                hi = mid - 1
+        return lo
+
+
+class LocalRouter:
+    """Offline router returning the same shape as RouteCalculator.get_osrm_route"""
+
+    def __init__(self, graph, max_snap_miles=DEFAULT_MAX_SNAP_MILES):
+        self.graph = graph
+        self.max_snap_m = max_snap_miles * METERS_PER_MILE
+
+    def route(self, origin, destination):
+        """Route between two lat/lng dicts; returns None if the graph cannot serve them"""
+        graph = self.graph
+        source, source_gap = graph.nearest_node(origin['lat'], origin['lng'], self.max_snap_m)
+        target, target_gap = graph.nearest_node(destination['lat'], destination['lng'], self.max_snap_m)
+        if source is None or target is None:
+            return None
+        found = graph.shortest_path(source, target)
+        if found is None:
+            return None
+        path, _ = found
+
+        access_speed = ACCESS_SPEED_MPH * METERS_PER_MILE / 3600
+        points = [(origin['lat'], origin['lng']), (graph.lat[source], graph.lng[source])]
+        steps = [self._step('Head to the road network', '', source_gap, source_gap / access_speed)]
+        for e in path:
+            target_node = graph.fwd_targets[e]
+            points.append((graph.lat[target_node], graph.lng[target_node]))
+            name = graph.names[graph.fwd_name[e]]
+            if steps[-1]['name'] == name and len(steps) > 1:
+                steps[-1]['distance'] += graph.fwd_length[e]
+                steps[-1]['duration'] += graph.fwd_time[e]
+            else:
+                verb = 'Continue onto' if len(steps) > 1 else 'Merge onto'
+                steps.append(self._step(f'{verb} {name}' if name else 'Continue', name,
+                                        graph.fwd_length[e], graph.fwd_time[e]))
+        points.append((destination['lat'], destination['lng']))
+        steps.append(self._step('Arrive at destination', '', target_gap, target_gap / access_speed))
+
+        distance_m = sum(step['distance'] for step in steps)
+        duration_s = sum(step['duration'] for step in steps)
+        return {
+            'distance': distance_m / METERS_PER_MILE,
+            'duration': duration_s / 3600,
+            'polyline': polyline_codec.encode(points),
+            'steps': [
+                {**step, 'distance': step['distance'] / METERS_PER_MILE,
+                 'duration': step['duration'] / 3600}
+                for step in steps
+            ]
+        }
+
+    def _step(self, instruction, name, distance_m, duration_s):
+        return {'instruction': instruction, 'name': name,
+                'distance': distance_m, 'duration': duration_s}
+
+
+_router = None
+_router_lock = threading.Lock()
+
+
+def get_local_router():
+    """Return the process-wide offline router for ROUTING_GRAPH_PATH, loading it on first use"""
+    global _router
+    if _router is None:
+        with _router_lock:
+            if _router is None:
+                graph = RoadGraph(settings.ROUTING_GRAPH_PATH)
+                _router = LocalRouter(
+                    graph,
+                    max_snap_miles=getattr(settings, 'ROUTING_MAX_SNAP_MILES', DEFAULT_MAX_SNAP_MILES)
+                )
+    return _router
@@ -0,0 +1,143 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.base import InvalidCacheBackendError
+
+# Defaults for the two-tier OSRM route cache
+DEFAULT_PRECISION = 4  # Decimal places kept when snapping coordinates (~11 m)
+DEFAULT_TTL = 7 * 24 * 3600  # One week, road geometry rarely changes
+DEFAULT_LRU_SIZE = 1024  # Routes kept in process memory
+
+
+class LRUCache:
+    """Thread-safe in-process LRU with per-entry expiry"""
+
+    def __init__(self, max_size=DEFAULT_LRU_SIZE, ttl=DEFAULT_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class RouteCache:
+    """Two-tier route cache: in-process LRU in front of a shared Django cache"""
+
+    def __init__(self, precision=DEFAULT_PRECISION, ttl=DEFAULT_TTL,
+                 lru_size=DEFAULT_LRU_SIZE, shared_alias='routes'):
+        self.precision = precision
+        self.ttl = ttl
+        self.local = LRUCache(max_size=lru_size, ttl=ttl)
+        try:
+            self.shared = caches[shared_alias] if shared_alias else None
+        except InvalidCacheBackendError:
+            self.shared = None
+        self._lock = threading.Lock()
+        self._stats = {'local_hits': 0, 'shared_hits': 0, 'misses': 0, 'sets': 0}
+
+    @classmethod
+    def from_settings(cls):
+        return cls(
+            precision=getattr(settings, 'ROUTE_CACHE_PRECISION', DEFAULT_PRECISION),
+            ttl=getattr(settings, 'ROUTE_CACHE_TTL', DEFAULT_TTL),
+            lru_size=getattr(settings, 'ROUTE_CACHE_LRU_SIZE', DEFAULT_LRU_SIZE),
+            shared_alias=getattr(settings, 'ROUTE_CACHE_ALIAS', 'routes'),
+        )
+
+    def snap(self, point):
+        """Snap a lat/lng dict onto the cache grid"""
+        return (round(point['lat'], self.precision), round(point['lng'], self.precision))
+
+    def make_key(self, origin, destination, kind='route'):
+        (lat1, lng1), (lat2, lng2) = self.snap(origin), self.snap(destination)
+        p = self.precision
+        return f'osrm:{kind}:{lat1:.{p}f},{lng1:.{p}f};{lat2:.{p}f},{lng2:.{p}f}'
+
+    def get(self, key):
+        value = self.local.get(key)
+        if value is not None:
+            self._count('local_hits')
+            return value
+        if self.shared is not None:
+            value = self.shared.get(key)
+            if value is not None:
+                self._count('shared_hits')
+                self.local.set(key, value)
+                return value
+        self._count('misses')
+        return None
+
+    def set(self, key, value):
+        self.local.set(key, value)
+        if self.shared is not None:
+            self.shared.set(key, value, timeout=self.ttl)
+        self._count('sets')
+
+    def delete(self, key):
+        self.local.delete(key)
+        if self.shared is not None:
+            self.shared.delete(key)
+
+    def clear(self):
+        self.local.clear()
+        if self.shared is not None:
+            self.shared.clear()
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def stats(self):
+        """Return hit/miss counters and the current in-process size"""
+        with self._lock:
+            stats = dict(self._stats)
+        lookups = stats['local_hits'] + stats['shared_hits'] + stats['misses']
+        stats['hit_rate'] = round((lookups - stats['misses']) / lookups, 4) if lookups else 0.0
+        stats['local_size'] = len(self.local)
+        return stats
+
+
+_route_cache = None
+_route_cache_lock = threading.Lock()
+
+
+def get_route_cache():
+    """Return the process-wide route cache, building it on first use"""
+    global _route_cache
+    if _route_cache is None:
+        with _route_cache_lock:
+            if _route_cache is None:
+                _route_cache = RouteCache.from_settings()
+    return _route_cache
@@ -0,0 +1,168 @@
+import numpy as np
+
+from . import geodesic
+from . import polyline as polyline_codec
+
+# Douglas-Peucker tolerance in miles for each polyline resolution
+POLYLINE_RESOLUTIONS = {
+    'low': 0.5,  # Country / multi-state zoom
+    'medium': 0.05,  # State zoom
+    'high': 0.005,  # City zoom
+    'full': 0.0,  # Every routed vertex
+}
+DEFAULT_POLYLINE_RESOLUTION = 'medium'
+
+
+class RouteGeometry:
+    """A trip's route as coordinate arrays with a cumulative mile prefix sum.
+
+    Mile markers map to on-route coordinates by binary search over the
+    prefix sum plus interpolation inside one segment, so placing a stop
+    costs O(log n) however many vertices the route has.
+    """
+
+    def __init__(self, lats, lngs, miles):
+        self.lats = np.asarray(lats, dtype=np.float64)
+        self.lngs = np.asarray(lngs, dtype=np.float64)
+        self.miles = np.asarray(miles, dtype=np.float64)  # Trip mile at each vertex
+
+    @classmethod
+    def from_legs(cls, waypoints, legs):
+        """Decode each leg's polyline once and chain the legs end to end.
+
+        Each leg's vertex miles are scaled to the leg's routed distance, so
+        the markers line up with the miles the HOS scheduler counts.
+        """
+        lats, lngs, miles = [], [], []
+        offset = 0.0
+        for leg, origin, destination in zip(legs, waypoints, waypoints[1:]):
+            points = polyline_codec.decode(leg.get('polyline') or '')
+            if len(points) < 2:
+                points = [(origin['lat'], origin['lng']), (destination['lat'], destination['lng'])]
+            coords = np.array(points, dtype=np.float64)
+
+            cumulative = np.concatenate(([0.0], np.cumsum(
+                geodesic.path_distances(coords[:, 0], coords[:, 1])
+            )))
+            length = cumulative[-1]
+            if length > 0:
+                cumulative *= leg['distance'] / length
+            else:
+                cumulative = np.linspace(0.0, leg['distance'], len(coords))
+
+            # Drop the first vertex of later legs; it repeats the previous leg's end
+            start = 1 if lats else 0
+            lats.append(coords[start:, 0])
+            lngs.append(coords[start:, 1])
+            miles.append(cumulative[start:] + offset)
+            offset += leg['distance']
+
+        return cls(np.concatenate(lats), np.concatenate(lngs), np.concatenate(miles))
+
+    @property
+    def total_miles(self):
+        return float(self.miles[-1])
+
+    @classmethod
+    def chain(cls, parts):
+        """Join route pieces end to end, shifting each piece's miles to follow on from the last"""
+        lats, lngs, miles = [], [], []
+        offset = 0.0
+        for part in parts:
+            lats.append(part.lats)
+            lngs.append(part.lngs)
+            miles.append(part.miles - part.miles[0] + offset)
+            offset = miles[-1][-1]
+        return cls(np.concatenate(lats), np.concatenate(lngs), np.concatenate(miles))
+
+    def slice(self, start, end):
+        """The route between two mile markers, keeping its mile values"""
+        inside = (self.miles > start) & (self.miles < end)
+        lats, lngs = self.locate_many([start, end])
+        return RouteGeometry(
+            np.concatenate(([lats[0]], self.lats[inside], [lats[1]])),
+            np.concatenate(([lngs[0]], self.lngs[inside], [lngs[1]])),
+            np.concatenate(([start], self.miles[inside], [end])),
+        )
+
+    def project(self, lat, lng):
+        """(mile, miles off route) of the point on the route nearest to a position.
+
+        Segments are compared in a flat projection centred on the position,
+        which is exact enough to pick the nearest one near the route.
+        """
+        scale = geodesic.EARTH_RADIUS_MILES * np.pi / 180
+        x = (self.lngs - lng) * scale * np.cos(np.radians(lat))
+        y = (self.lats - lat) * scale
+        if len(x) < 2:
+            return float(self.miles[0]), float(np.hypot(x[0], y[0]))
+        dx, dy = np.diff(x), np.diff(y)
+        length = dx * dx + dy * dy
+        # Fraction along each segment of the foot of the perpendicular from the position
+        t = np.clip(-(x[:-1] * dx + y[:-1] * dy) / np.where(length > 0, length, 1.0), 0.0, 1.0)
+        i = int(np.argmin(np.hypot(x[:-1] + t * dx, y[:-1] + t * dy)))
+        mile = float(self.miles[i] + t[i] * (self.miles[i + 1] - self.miles[i]))
+        point = self.locate(mile)
+        return mile, float(geodesic.haversine(lat, lng, point['lat'], point['lng']))
+
+    def locate_many(self, miles):
+        """Coordinates at an array of mile markers, as (lats, lngs) arrays"""
+        miles = np.clip(np.asarray(miles, dtype=np.float64), self.miles[0], self.miles[-1])
+        upper = np.clip(np.searchsorted(self.miles, miles, side='right'), 1, len(self.miles) - 1)
+        lower = upper - 1
+        span = self.miles[upper] - self.miles[lower]
+        fraction = np.where(span > 0, (miles - self.miles[lower]) / np.where(span > 0, span, 1.0), 0.0)
+        lats = self.lats[lower] + (self.lats[upper] - self.lats[lower]) * fraction
+        lngs = self.lngs[lower] + (self.lngs[upper] - self.lngs[lower]) * fraction
+        return lats, lngs
+
+    def locate(self, mile):
+        """On-route lat/lng dict at a trip mile marker"""
+        lats, lngs = self.locate_many([mile])
+        return {'lat': float(lats[0]), 'lng': float(lngs[0])}
+
+    def simplify(self, tolerance):
+        """Indices of the vertices Douglas-Peucker keeps at a tolerance in miles"""
+        count = len(self.lats)
+        if tolerance <= 0 or count < 3:
+            return np.arange(count)
+
+        # Sinusoidal projection around the route's mean longitude, in miles
+        lat = np.radians(self.lats)
+        lng = np.radians(self.lngs - self.lngs.mean())
+        x = geodesic.EARTH_RADIUS_MILES * lng * np.cos(lat)
+        y = geodesic.EARTH_RADIUS_MILES * lat
+
+        keep = np.zeros(count, dtype=bool)
+        keep[0] = keep[-1] = True
+        stack = [(0, count - 1)]
+        while stack:
+            first, last = stack.pop()
+            if last - first < 2:
+                continue
+            dx, dy = x[last] - x[first], y[last] - y[first]
+            px, py = x[first + 1:last] - x[first], y[first + 1:last] - y[first]
+            length = np.hypot(dx, dy)
+            if length > 0:
+                distances = np.abs(dx * py - dy * px) / length
+            else:
+                distances = np.hypot(px, py)
+            i = int(np.argmax(distances))
+            if distances[i] > tolerance:
+                index = first + 1 + i
+                keep[index] = True
+                stack.append((first, index))
+                stack.append((index, last))
+        return np.flatnonzero(keep)
+
+    def encode(self, tolerance=0.0):
+        """Encoded polyline of the route simplified to a tolerance in miles"""
+        indices = self.simplify(tolerance)
+        return polyline_codec.encode(zip(self.lats[indices].tolist(), self.lngs[indices].tolist()))
+
+    def polylines(self):
+        """The route encoded at every resolution in POLYLINE_RESOLUTIONS"""
+        return {
+            resolution: self.encode(tolerance)
+            for resolution, tolerance in POLYLINE_RESOLUTIONS.items()
+        }
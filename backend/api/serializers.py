@@ -1,11 +1,54 @@
 from rest_framework import serializers
-from .models import Location, Trip, Route, Stop, ELDLog, ELDLogEntry
+from .hos import default_start_time
+from .ledger import cycle_hours_used
+from .models import Location, Trip, Route, Stop, ELDLog, ELDLogEntry, PlanJob
+
+def split_query_param(request, name):
+    """Return the comma-separated values of a query parameter as a set"""
+    if request is None:
+        return set()
+    value = request.query_params.get(name, '')
+    return {item.strip() for item in value.split(',') if item.strip()}
+
+class DynamicFieldsMixin:
+    """Sparse fieldsets: ?fields= picks fields, ?expand= adds expandable ones"""
+    expandable_fields = {}
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        expand = split_query_param(request, 'expand')
+        for name, factory in self.expandable_fields.items():
+            if name in expand:
+                self.fields[name] = factory()
+        fields = split_query_param(request, 'fields')
+        if fields:
+            for name in set(self.fields) - fields - expand:
+                self.fields.pop(name)
 
 class LocationSerializer(serializers.ModelSerializer):
     class Meta:
         model = Location
         fields = ['id', 'name', 'latitude', 'longitude', 'address', 'created_at']
 
+class NearbyLocationSerializer(LocationSerializer):
+    distance_miles = serializers.FloatField(read_only=True)
+
+    class Meta(LocationSerializer.Meta):
+        fields = LocationSerializer.Meta.fields + ['distance_miles']
+
+class NearbyQuerySerializer(serializers.Serializer):
+    """Query parameters for locations near a point"""
+    lat = serializers.FloatField(min_value=-90, max_value=90)
+    lng = serializers.FloatField(min_value=-180, max_value=180)
+    radius = serializers.FloatField(
+        min_value=0,
+        max_value=100,
+        default=1,
+        help_text="Search radius in miles"
+    )
+    limit = serializers.IntegerField(min_value=1, max_value=500, default=50)
+
 class RouteSerializer(serializers.ModelSerializer):
     class Meta:
         model = Route
@@ -27,11 +70,33 @@ class ELDLogEntrySerializer(serializers.ModelSerializer):
     class Meta:
         model = ELDLogEntry
         fields = [
-            'id', 'eld_log', 'event_time', 'status', 
+            'id', 'eld_log', 'driver_id', 'event_time', 'status', 
             'location', 'miles_at_entry', 'hours_remaining', 
             'notes', 'created_at'
         ]
 
+class ELDLogEntryQuerySerializer(serializers.Serializer):
+    """Filters for the ELD entry query API"""
+    driver_id = serializers.CharField(max_length=50)
+    status = serializers.MultipleChoiceField(
+        choices=ELDLog.STATUS_CHOICES,
+        required=False,
+        help_text="One status or a comma-separated list"
+    )
+    start = serializers.DateTimeField(required=False, help_text="Events at or after this time")
+    end = serializers.DateTimeField(required=False, help_text="Events before this time")
+
+    def to_internal_value(self, data):
+        data = {key: data.get(key) for key in self.fields if data.get(key)}
+        if 'status' in data:
+            data['status'] = [item.strip() for item in data['status'].split(',') if item.strip()]
+        return super().to_internal_value(data)
+
+    def validate(self, attrs):
+        if attrs.get('start') and attrs.get('end') and attrs['start'] >= attrs['end']:
+            raise serializers.ValidationError({'end': 'Must be after start.'})
+        return attrs
+
 class ELDLogSerializer(serializers.ModelSerializer):
     entries = ELDLogEntrySerializer(many=True, read_only=True)
     
@@ -43,7 +108,7 @@ class ELDLogSerializer(serializers.ModelSerializer):
             'status_entries', 'entries', 'created_at'
         ]
 
-class TripSerializer(serializers.ModelSerializer):
+class TripSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     current_location_data = LocationSerializer(source='current_location', read_only=True)
     pickup_location_data = LocationSerializer(source='pickup_location', read_only=True)
     dropoff_location_data = LocationSerializer(source='dropoff_location', read_only=True)
@@ -62,10 +127,42 @@ class TripSerializer(serializers.ModelSerializer):
             'created_at', 'updated_at'
         ]
 
+class WaypointSerializer(serializers.Serializer):
+    """Serializer for a single stop in an ordered waypoint list"""
+    lat = serializers.FloatField(min_value=-90, max_value=90)
+    lng = serializers.FloatField(min_value=-180, max_value=180)
+    stop_type = serializers.ChoiceField(
+        choices=['pickup', 'dropoff'],
+        required=False,
+        help_text="Activity at this waypoint (intermediate waypoints default to dropoff)"
+    )
+    name = serializers.CharField(max_length=255, required=False)
+
+class TripSummarySerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    """Lightweight trip representation for list views"""
+    current_location_data = LocationSerializer(source='current_location', read_only=True)
+    pickup_location_data = LocationSerializer(source='pickup_location', read_only=True)
+    dropoff_location_data = LocationSerializer(source='dropoff_location', read_only=True)
+
+    expandable_fields = {
+        'routes': lambda: RouteSerializer(many=True, read_only=True),
+        'stops': lambda: StopSerializer(many=True, read_only=True),
+        'eld_logs': lambda: ELDLogSerializer(many=True, read_only=True),
+    }
+
+    class Meta:
+        model = Trip
+        fields = [
+            'id', 'current_location_data', 'pickup_location_data',
+            'dropoff_location_data', 'current_cycle_used', 'status',
+            'total_distance', 'estimated_duration', 'created_at', 'updated_at'
+        ]
+
 class TripInputSerializer(serializers.Serializer):
     """Serializer for trip calculation input"""
     current_location = serializers.DictField(
         child=serializers.FloatField(),
+        required=False,
         help_text="Current location with lat/lng"
     )
     pickup_location = serializers.DictField(
@@ -76,12 +173,23 @@ class TripInputSerializer(serializers.Serializer):
     )
     dropoff_location = serializers.DictField(
         child=serializers.FloatField(),
+        required=False,
         help_text="Dropoff location with lat/lng"
     )
+    waypoints = WaypointSerializer(
+        many=True,
+        required=False,
+        help_text="Ordered stops starting at the current location (replaces current/pickup/dropoff)"
+    )
     current_cycle_used = serializers.FloatField(
         min_value=0,
         max_value=70,
-        help_text="Current cycle used in hours (0-70)"
+        required=False,
+        help_text="Current cycle used in hours (0-70); taken from the driver's logs if omitted"
+    )
+    start_time = serializers.DateTimeField(
+        required=False,
+        help_text="When the driver sets out (defaults to 06:00 today)"
     )
     driver_id = serializers.CharField(
         max_length=50,
@@ -102,6 +210,75 @@ class TripInputSerializer(serializers.Serializer):
         help_text="Truck number"
     )
 
+    def validate(self, attrs):
+        if 'current_cycle_used' not in attrs:
+            # Without an explicit driver the ledger would only hold the default's hours
+            if 'driver_id' not in self.initial_data:
+                raise serializers.ValidationError({
+                    'current_cycle_used': 'This field is required unless driver_id is given.'
+                })
+            start_time = attrs.get('start_time') or default_start_time()
+            attrs['current_cycle_used'] = cycle_hours_used(attrs['driver_id'], start_time.date())
+        waypoints = attrs.get('waypoints')
+        if waypoints:
+            if len(waypoints) < 2:
+                raise serializers.ValidationError(
+                    {'waypoints': 'At least two waypoints are required.'}
+                )
+            return attrs
+        missing = {
+            field: 'This field is required.'
+            for field in ('current_location', 'dropoff_location')
+            if not attrs.get(field)
+        }
+        if missing:
+            raise serializers.ValidationError(missing)
+        return attrs
+
+class TripReplanSerializer(serializers.Serializer):
+    """Serializer for re-planning a stored trip from the truck's current state"""
+    current_location = serializers.DictField(
+        child=serializers.FloatField(),
+        help_text="Truck position with lat/lng"
+    )
+    current_time = serializers.DateTimeField(
+        required=False,
+        help_text="Time of the position fix (defaults to now)"
+    )
+    current_cycle_used = serializers.FloatField(
+        min_value=0,
+        max_value=70,
+        help_text="On-duty hours used in the 70-hour/8-day cycle"
+    )
+    driving_hours = serializers.FloatField(
+        min_value=0,
+        max_value=11,
+        default=0,
+        help_text="Hours driven since the last 10-hour rest"
+    )
+    on_duty_hours = serializers.FloatField(
+        min_value=0,
+        max_value=24,
+        default=0,
+        help_text="Hours since coming on duty (the 14-hour window)"
+    )
+    hours_since_break = serializers.FloatField(
+        min_value=0,
+        max_value=8,
+        default=0,
+        help_text="Hours driven since the last 30-minute break"
+    )
+    miles_since_fuel = serializers.FloatField(
+        min_value=0,
+        required=False,
+        help_text="Miles since the last fuel stop (defaults to the stored plan's)"
+    )
+
+    def validate_current_location(self, value):
+        if 'lat' not in value or 'lng' not in value:
+            raise serializers.ValidationError('Both lat and lng are required.')
+        return value
+
 class RouteCalculationSerializer(serializers.Serializer):
     """Serializer for route calculation response"""
     origin = serializers.DictField()
@@ -113,3 +290,29 @@ class RouteCalculationSerializer(serializers.Serializer):
     stops = serializers.ListField()
     eld_logs = serializers.ListField()
     total_days = serializers.IntegerField()
+
+class PlanJobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = PlanJob
+        fields = [
+            'id', 'kind', 'status', 'result', 'error', 'trip', 'attempts', 'max_attempts',
+            'created_at', 'started_at', 'finished_at', 'queue_seconds', 'run_seconds'
+        ]
+        read_only_fields = fields
+
+class PlanJobInputSerializer(serializers.Serializer):
+    """Serializer for submitting a planning job"""
+    kind = serializers.ChoiceField(
+        choices=PlanJob.KIND_CHOICES,
+        default='create_trip',
+        help_text="'create_trip' saves the plan as a trip; 'calculate' only returns it"
+    )
+    payload = serializers.DictField(
+        help_text="Trip input, as accepted by calculate-route"
+    )
+
+    def validate_payload(self, value):
+        input_serializer = TripInputSerializer(data=value)
+        if not input_serializer.is_valid():
+            raise serializers.ValidationError(input_serializer.errors)
+        return value
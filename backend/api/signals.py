@@ -0,0 +1,44 @@
+from django.db.models import Q
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .ledger import schedule_rebuild
+from .models import ELDLog, Location, Trip
+
+
+@receiver(post_save, sender=Location)
+def touch_trips(sender, instance, created, raw=False, **kwargs):
+    """Bump updated_at on the trips embedding an edited location, so their ETags change"""
+    if created or raw:
+        return
+    Trip.objects.filter(
+        Q(current_location=instance) | Q(pickup_location=instance)
+        | Q(dropoff_location=instance) | Q(stops__location=instance)
+    ).update(updated_at=timezone.now())
+
+
+@receiver(pre_save, sender=ELDLog)
+def remember_log_day(sender, instance, raw=False, using=None, **kwargs):
+    """An edited log may move to another driver or day; keep the old one for the rebuild"""
+    if raw or instance.pk is None:
+        return
+    instance._stored_day = ELDLog.objects.using(using).filter(pk=instance.pk).values_list(
+        'driver_id', 'log_date'
+    ).first()
+
+
+@receiver(post_save, sender=ELDLog)
+@receiver(post_delete, sender=ELDLog)
+def rerecord_log(sender, instance, raw=False, using=None, **kwargs):
+    """Keep the duty ledger in step with logs saved or deleted one by one.
+
+    Covers trips deleted by any path, since their logs go in the cascade.
+    Bulk inserts send no signals and call ledger.record_logs() instead.
+    """
+    if raw:
+        return
+    stored = instance.__dict__.pop('_stored_day', None)
+    if stored is not None:
+        schedule_rebuild(*stored, using=using)
+    schedule_rebuild(instance.driver_id, instance.log_date, using=using)
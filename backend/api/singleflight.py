@@ -0,0 +1,110 @@
+import hashlib
+import os
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+
+try:
+    import fcntl
+except ImportError:  # Windows - cross-process coalescing is unavailable
+    fcntl = None
+
+DEFAULT_LOCK_STRIPES = 256  # Lock files per flight group; keys hash onto a stripe
+
+
+class _Call:
+    __slots__ = ('event', 'result', 'error', 'waiters')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Collapse concurrent calls that share a key into one execution.
+
+    The first caller for a key runs the function; callers arriving while it
+    is in flight wait and receive the same result (or exception). With a
+    lock directory the leader also holds a striped file lock, so leaders in
+    other processes queue behind it and can find its result in a shared
+    cache instead of recomputing it.
+    """
+
+    def __init__(self, lock_dir=None, stripes=DEFAULT_LOCK_STRIPES):
+        self.lock_dir = lock_dir if fcntl is not None else None
+        self.stripes = stripes
+        if self.lock_dir:
+            os.makedirs(self.lock_dir, exist_ok=True)
+        self._calls = {}
+        self._lock = threading.Lock()
+        self._stats = {'executions': 0, 'coalesced': 0}
+
+    def do(self, key, fn, *args, **kwargs):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self._stats['executions'] += 1
+            else:
+                call.waiters += 1
+                self._stats['coalesced'] += 1
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            with self.process_lock(key):
+                call.result = fn(*args, **kwargs)
+        except BaseException as exc:
+            call.error = exc
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+        return call.result
+
+    @contextmanager
+    def process_lock(self, key):
+        """Exclusive lock on the key's stripe file, when a lock directory is set"""
+        if not self.lock_dir:
+            yield
+            return
+        stripe = int(hashlib.sha1(key.encode()).hexdigest(), 16) % self.stripes
+        with open(os.path.join(self.lock_dir, f'{stripe:03d}.lock'), 'a') as handle:
+            fcntl.flock(handle, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(handle, fcntl.LOCK_UN)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['in_flight'] = len(self._calls)
+        stats['cross_process'] = bool(self.lock_dir)
+        return stats
+
+
+_flights = {}
+_flights_lock = threading.Lock()
+
+
+def get_single_flight(name):
+    """Return the process-wide flight group for a kind of work ('plans', 'routes')"""
+    flight = _flights.get(name)
+    if flight is None:
+        with _flights_lock:
+            flight = _flights.get(name)
+            if flight is None:
+                lock_dir = getattr(settings, 'SINGLE_FLIGHT_LOCK_DIR', None)
+                flight = _flights[name] = SingleFlight(
+                    lock_dir=os.path.join(lock_dir, name) if lock_dir else None
+                )
+    return flight
@@ -0,0 +1,56 @@
+import logging
+
+from django.http import StreamingHttpResponse
+from rest_framework.renderers import BaseRenderer
+
+from .renderers import dumps
+
+logger = logging.getLogger(__name__)
+
+NDJSON_MEDIA_TYPE = 'application/x-ndjson'
+
+
+def ndjson_line(record):
+    return dumps(record) + b'\n'
+
+
+class NDJSONRenderer(BaseRenderer):
+    """Newline-delimited JSON; a list renders one line per item.
+
+    Views that stream bypass the renderer with stream_ndjson(); it still
+    renders their error responses when the client asked for NDJSON.
+    """
+    media_type = NDJSON_MEDIA_TYPE
+    format = 'ndjson'
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        records = data if isinstance(data, list) else [data]
+        return b''.join(ndjson_line(record) for record in records)
+
+
+def wants_ndjson(request):
+    """Whether content negotiation picked NDJSON (Accept header or ?format=ndjson)"""
+    renderer = getattr(request, 'accepted_renderer', None)
+    return renderer is not None and renderer.format == NDJSONRenderer.format
+
+
+def stream_ndjson(records):
+    """Response that writes each record as a line as soon as the iterable produces it.
+
+    The status is sent before the first record, so a failure part way
+    through ends the stream with an {"type": "error"} record instead.
+    """
+    def lines():
+        try:
+            for record in records:
+                yield ndjson_line(record)
+        except Exception:
+            logger.exception('NDJSON stream failed')
+            yield ndjson_line({'type': 'error', 'detail': 'Planning failed part way through.'})
+
+    response = StreamingHttpResponse(lines(), content_type=NDJSON_MEDIA_TYPE)
+    response['X-Accel-Buffering'] = 'no'  # Let nginx pass each line straight through
+    return response
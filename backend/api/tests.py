@@ -0,0 +1,575 @@
+import heapq
+import json
+import math
+import tempfile
+import time
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from pathlib import Path
+from unittest import mock
+
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from . import polyline as polyline_codec
+from .hos import (
+    BREAK_AFTER_DRIVING, FUEL_STOP_INTERVAL, MAX_DRIVING_HOURS, MAX_DRIVING_WINDOW, MIN_BREAK,
+    MIN_REST_BREAK, PICKUP_DROP_TIME, RESTART_HOURS, WEEKLY_CYCLE_LIMIT, DutyClocks, HOSScheduler,
+)
+from .jobs import DEFAULT_MAX_ATTEMPTS, claim_job, run_job, submit_job
+from .geohash import MILES_PER_DEGREE
+from .ledger import cycle_hours_used, cycle_summary
+from .locations import DEFAULT_INTERN_TOLERANCE_MILES, intern_locations
+from .models import DutyDay, ELDLog, Location, PlanJob, Stop, Trip
+from .persistence import TripChanged, save_replan
+from .replan import plan_remaining
+from .road_graph import (
+    METERS_PER_MILE, LocalRouter, RoadGraph, build_graph_from_json, haversine_m,
+)
+from .views import RouteCalculator
+
+# A fixed number of queries however long the trip is. Saving (13): savepoint,
+# location lookup, location insert, trip, route, stops, logs, log entries,
+# four ledger queries (the driver has no older logs to look for), release.
+# Reading it back (6): trip joined with its locations, route, stops, stop
+# locations, logs, log entries.
+CREATE_TRIP_QUERIES = 19
+
+CHICAGO = {'lat': 41.8781, 'lng': -87.6298}
+NEARBY = {'lat': 42.5, 'lng': -88.5}
+LOS_ANGELES = {'lat': 34.0522, 'lng': -118.2437}
+
+
+def create_trip(dropoff, **fields):
+    """POST a trip from Chicago; a field given as None is left out"""
+    data = {
+        'current_location': CHICAGO,
+        'dropoff_location': dropoff,
+        'current_cycle_used': 20,
+        'start_time': '2024-03-04T06:00:00Z',
+        **fields,
+    }
+    return APIClient().post('/api/trips/create_trip/',
+                            {key: value for key, value in data.items() if value is not None},
+                            format='json')
+
+
+@override_settings(ROUTING_BACKEND='local', TRUCK_STOPS_PATH='')
+class CreateTripQueriesTest(TestCase):
+    """Trip creation must not grow a query per stop or per day"""
+
+    def test_short_trip(self):
+        with self.assertNumQueries(CREATE_TRIP_QUERIES):
+            response = create_trip(NEARBY)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(ELDLog.objects.count(), 1)
+
+    def test_multi_day_trip(self):
+        with self.assertNumQueries(CREATE_TRIP_QUERIES):
+            response = create_trip(LOS_ANGELES)
+        self.assertEqual(response.status_code, 200)
+        trip = Trip.objects.get()
+        self.assertGreater(ELDLog.objects.filter(trip=trip).count(), 1)
+        self.assertGreater(Stop.objects.filter(trip=trip, stop_type='fuel').count(), 0)
+        self.assertEqual(DutyDay.objects.count(), ELDLog.objects.count())
+
+
+@override_settings(ROUTING_BACKEND='local', TRUCK_STOPS_PATH='')
+class DutyLedgerTest(TestCase):
+    """The per-driver ledger behind the 70-hour cycle"""
+
+    def test_same_plan_counted_once(self):
+        create_trip(NEARBY)
+        once = DutyDay.objects.get().on_duty_hours
+        create_trip(NEARBY)
+        self.assertEqual(Trip.objects.count(), 2)
+        self.assertAlmostEqual(DutyDay.objects.get().on_duty_hours, once)
+
+    def test_restart_detected_across_trips(self):
+        create_trip(NEARBY)
+        first = cycle_summary('DRV001', date(2024, 3, 4))
+        self.assertIsNone(first['last_restart'])
+        self.assertEqual(first['hours_used'], round(DutyDay.objects.get().on_duty_hours, 2))
+
+        # Three days off duty, then a second trip: the first one's hours drop out
+        create_trip(NEARBY, start_time='2024-03-07T06:00:00Z')
+        second = cycle_summary('DRV001', date(2024, 3, 7))
+        self.assertEqual(second['last_restart'], '2024-03-07T06:00:00+00:00')
+        self.assertEqual(second['hours_used'],
+                         round(DutyDay.objects.get(day=date(2024, 3, 7)).on_duty_hours, 2))
+
+    def test_orm_delete_rebuilds_ledger(self):
+        create_trip(LOS_ANGELES)
+        self.assertTrue(DutyDay.objects.exists())
+        with self.captureOnCommitCallbacks(execute=True):
+            Trip.objects.get().delete()
+        self.assertFalse(DutyDay.objects.exists())
+
+    def test_cycle_used_from_driver_logs(self):
+        create_trip(LOS_ANGELES, driver_id='DRV042')
+        used = cycle_hours_used('DRV042', date(2024, 3, 6))
+        self.assertGreater(used, 0)
+        response = create_trip(NEARBY, driver_id='DRV042', current_cycle_used=None,
+                               start_time='2024-03-06T06:00:00Z')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['current_cycle_used'], used)
+
+    def test_cycle_used_needs_driver(self):
+        response = create_trip(NEARBY, current_cycle_used=None)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('current_cycle_used', response.data)
+
+
+def hours_between(start, end):
+    return (datetime.fromisoformat(end) - datetime.fromisoformat(start)).total_seconds() / 3600
+
+
+class HOSSchedulerTest(SimpleTestCase):
+    """Hours-of-service rules, planned on straight legs at a fixed speed"""
+    start = datetime(2024, 3, 4, 6, tzinfo=dt_timezone.utc)
+
+    def plan(self, *hours, speed=50, start=None, **kwargs):
+        """Schedule legs of the given driving hours; every waypoint is a 1-hour dropoff"""
+        waypoints = [{'lat': 41.0, 'lng': -87.0, 'name': 'Start', 'stop_type': 'start'}]
+        legs = []
+        for number, leg_hours in enumerate(hours, 1):
+            waypoints.append({'lat': 41.0, 'lng': -87.0, 'name': f'Stop {number}',
+                              'stop_type': 'dropoff'})
+            legs.append({'distance': leg_hours * speed, 'duration': leg_hours})
+        scheduler = HOSScheduler(waypoints, legs, start or self.start, {}, **kwargs)
+        stops, logs = scheduler.run()
+        return scheduler, stops, logs
+
+    def driving_until(self, stops, stop_type):
+        """Hours driven before the first stop of stop_type"""
+        driven = 0.0
+        for stop in stops:
+            if stop['stop_type'] == stop_type:
+                return driven
+            if stop['stop_type'] == 'driving':
+                driven += hours_between(stop['arrival_time'], stop['departure_time'])
+        self.fail(f'No {stop_type} stop')
+
+    def test_eleven_hour_driving_limit(self):
+        _, stops, _ = self.plan(14)
+        rest = next(stop for stop in stops if stop['stop_type'] == 'rest')
+        self.assertAlmostEqual(self.driving_until(stops, 'rest'), MAX_DRIVING_HOURS)
+        self.assertEqual(rest['duration'], MIN_REST_BREAK)
+
+    def test_fourteen_hour_window(self):
+        # Five 1.5-hour legs, each ending in an hour on duty, use 12.5 hours of
+        # the window on 7.5 hours of driving
+        _, stops, _ = self.plan(1.5, 1.5, 1.5, 1.5, 1.5, 6)
+        rest = next(stop for stop in stops if stop['stop_type'] == 'rest')
+        self.assertLess(self.driving_until(stops, 'rest'), MAX_DRIVING_HOURS)
+        self.assertAlmostEqual(hours_between(self.start.isoformat(), rest['arrival_time']),
+                               MAX_DRIVING_WINDOW)
+
+    def test_break_after_eight_hours_driving(self):
+        _, stops, _ = self.plan(9)
+        self.assertEqual([stop['stop_type'] for stop in stops],
+                         ['driving', 'break', 'driving', 'dropoff'])
+        self.assertAlmostEqual(self.driving_until(stops, 'break'), BREAK_AFTER_DRIVING)
+        self.assertEqual(stops[1]['duration'], MIN_BREAK)
+
+    def test_seventy_hour_cycle_restart(self):
+        scheduler, stops, _ = self.plan(8, current_cycle_used=65)
+        restart = next(stop for stop in stops if stop['stop_type'] == 'rest')
+        self.assertEqual(restart['duration'], RESTART_HOURS)
+        self.assertAlmostEqual(self.driving_until(stops, 'rest'), WEEKLY_CYCLE_LIMIT - 65)
+        # The cycle starts over: the last 3 hours of driving plus the dropoff
+        self.assertAlmostEqual(scheduler.clocks.cycle, 3 + PICKUP_DROP_TIME)
+
+    def test_fuel_every_thousand_miles(self):
+        _, stops, _ = self.plan(2500 / 60, speed=60)
+        fuel = [stop for stop in stops if stop['stop_type'] == 'fuel']
+        self.assertEqual([stop['miles_driven'] for stop in fuel],
+                         [FUEL_STOP_INTERVAL, 2 * FUEL_STOP_INTERVAL])
+
+    def test_logs_split_at_midnight(self):
+        start = datetime(2024, 3, 4, 20, tzinfo=dt_timezone.utc)
+        _, _, logs = self.plan(6, start=start)
+        self.assertEqual([log['log_date'] for log in logs], ['2024-03-04', '2024-03-05'])
+        self.assertEqual([log['driving_hours'] for log in logs], [4, 2])
+        self.assertEqual([log['total_miles'] for log in logs], [200, 100])
+        self.assertEqual(logs[0]['status_entries'][-1]['time'], '24:00')
+        first = logs[1]['status_entries'][0]
+        self.assertEqual((first['time'], first['status']), ('00:00', 'driving'))
+
+    def test_short_tail_folds_into_drive(self):
+        # Eight hours of driving leaves 11 seconds of the leg; that is not a segment
+        _, stops, _ = self.plan(8 + 11 / 3600)
+        self.assertEqual([stop['stop_type'] for stop in stops], ['driving', 'dropoff'])
+
+    def test_break_taken_before_token_drive(self):
+        clocks = DutyClocks(since_break=BREAK_AFTER_DRIVING - 0.005)
+        _, stops, _ = self.plan(2, clocks=clocks)
+        self.assertEqual([stop['stop_type'] for stop in stops], ['break', 'driving', 'dropoff'])
+
+
+@override_settings(ROUTING_BACKEND='local', TRUCK_STOPS_PATH='')
+class ReplanTest(TestCase):
+    """Re-planning the rest of a saved trip from the truck's position"""
+
+    def setUp(self):
+        create_trip(LOS_ANGELES)
+        self.trip = Trip.objects.get()
+        stops = list(self.trip.stops.order_by('sequence_order'))
+        # Re-plan just after the first fuel stop, on the stored route
+        self.fuel = next(stop for stop in stops if stop.stop_type == 'fuel')
+        self.stops = [stop.pk for stop in stops]
+        self.current_time = self.fuel.departure_time
+        self.earlier_logs = list(self.trip.eld_logs.filter(
+            log_date__lt=timezone.localtime(self.current_time).date()
+        ).values_list('pk', flat=True))
+
+    def replan(self, position):
+        return APIClient().post(f'/api/trips/{self.trip.pk}/replan/', {
+            'current_location': position,
+            'current_time': self.current_time.isoformat(),
+            'current_cycle_used': 40,
+        }, format='json')
+
+    def assert_future_rewritten(self, response):
+        """Stops before the re-plan point and earlier days' logs are the stored rows"""
+        self.assertEqual(response.status_code, 200)
+        kept = response.data['replan']['stops_kept']
+        self.assertGreater(kept, 0)
+        stops = set(Stop.objects.filter(trip=self.trip).values_list('pk', flat=True))
+        self.assertTrue(stops.issuperset(self.stops[:kept]))
+        self.assertFalse(stops & set(self.stops[kept:]))
+        logs = set(ELDLog.objects.filter(trip=self.trip).values_list('pk', flat=True))
+        self.assertTrue(logs.issuperset(self.earlier_logs))
+        self.assertEqual(DutyDay.objects.count(), ELDLog.objects.count())
+
+    def test_on_corridor_routes_nothing(self):
+        position = {'lat': self.fuel.location.latitude, 'lng': self.fuel.location.longitude}
+        with mock.patch.object(RouteCalculator, 'fetch_legs') as fetch_legs:
+            response = self.replan(position)
+        fetch_legs.assert_not_called()
+        self.assertFalse(response.data['replan']['rerouted'])
+        self.assertEqual(response.data['replan']['stops_kept'],
+                         self.stops.index(self.fuel.pk) + 1)
+        self.assertAlmostEqual(response.data['replan']['progress_miles'],
+                               self.fuel.miles_driven, delta=1)
+        self.assert_future_rewritten(response)
+
+    def test_off_corridor_routes_rejoin_leg(self):
+        # A few miles north of the fuel stop, well off the stored route
+        position = {'lat': self.fuel.location.latitude + 0.1, 'lng': self.fuel.location.longitude}
+        with mock.patch.object(RouteCalculator, 'fetch_legs', autospec=True,
+                               side_effect=RouteCalculator.fetch_legs) as fetch_legs:
+            response = self.replan(position)
+        fetch_legs.assert_called_once()
+        rejoin = fetch_legs.call_args.args[1]
+        self.assertEqual([(point['lat'], point['lng']) for point in rejoin],
+                         [(position['lat'], position['lng']),
+                          (LOS_ANGELES['lat'], LOS_ANGELES['lng'])])
+        self.assertTrue(response.data['replan']['rerouted'])
+        self.assertGreater(response.data['replan']['off_route_miles'], 2)
+        self.assert_future_rewritten(response)
+
+    def test_stale_trip_not_saved(self):
+        plan = plan_remaining(self.trip, {
+            'current_location': {'lat': self.fuel.location.latitude,
+                                 'lng': self.fuel.location.longitude},
+            'current_time': self.current_time, 'current_cycle_used': 40, 'driving_hours': 0,
+            'on_duty_hours': 0, 'hours_since_break': 0,
+        }, RouteCalculator())
+        # Another re-plan saves the trip in the meantime
+        Trip.objects.filter(pk=self.trip.pk).update(updated_at=timezone.now())
+        with self.assertRaises(TripChanged):
+            save_replan(self.trip, plan)
+        self.assertEqual(set(Stop.objects.values_list('pk', flat=True)), set(self.stops))
+
+
+SAMPLE_GRAPH = Path(__file__).resolve().parent / 'data' / 'sample_graph.bin'
+SEATTLE = {'lat': 47.6062, 'lng': -122.3321}
+HONOLULU = {'lat': 21.3069, 'lng': -157.8583}
+
+
+def dijkstra(graph, source):
+    """Fastest time from source to every reachable node, for checking the A* search"""
+    best = {source: 0.0}
+    heap = [(0.0, source)]
+    while heap:
+        d, u = heapq.heappop(heap)
+        if d > best[u]:
+            continue
+        for e in range(graph.fwd_offsets[u], graph.fwd_offsets[u + 1]):
+            v = graph.fwd_targets[e]
+            if d + graph.fwd_time[e] < best.get(v, math.inf):
+                best[v] = d + graph.fwd_time[e]
+                heapq.heappush(heap, (best[v], v))
+    return best
+
+
+class LocalRouterTest(SimpleTestCase):
+    """The offline router against the sample graph shipped in api/data"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.graph = RoadGraph(SAMPLE_GRAPH)
+        cls.router = LocalRouter(cls.graph)
+
+    def test_route_runs_from_origin_to_destination(self):
+        route = self.router.route(CHICAGO, LOS_ANGELES)
+        straight = haversine_m(CHICAGO['lat'], CHICAGO['lng'],
+                               LOS_ANGELES['lat'], LOS_ANGELES['lng']) / METERS_PER_MILE
+        self.assertGreater(route['distance'], straight)
+        self.assertLess(route['distance'], 1.5 * straight)
+        self.assertAlmostEqual(sum(step['distance'] for step in route['steps']), route['distance'])
+        self.assertAlmostEqual(sum(step['duration'] for step in route['steps']), route['duration'])
+        points = polyline_codec.decode(route['polyline'])
+        for point, end in [(points[0], CHICAGO), (points[-1], LOS_ANGELES)]:
+            self.assertAlmostEqual(point[0], end['lat'], places=5)
+            self.assertAlmostEqual(point[1], end['lng'], places=5)
+
+    def test_snaps_to_nearest_node(self):
+        for lat, lng in [(41.9, -87.7), (39.0, -105.0), (33.0, -97.5), (45.0, -93.0)]:
+            nearest = min(range(self.graph.node_count), key=lambda node: haversine_m(
+                lat, lng, self.graph.lat[node], self.graph.lng[node]))
+            node, distance = self.graph.nearest_node(lat, lng, 500 * METERS_PER_MILE)
+            self.assertEqual(node, nearest)
+            self.assertAlmostEqual(distance, haversine_m(
+                lat, lng, self.graph.lat[node], self.graph.lng[node]))
+
+    def test_no_node_within_snap_distance(self):
+        self.assertEqual(self.graph.nearest_node(HONOLULU['lat'], HONOLULU['lng'],
+                                                 50 * METERS_PER_MILE), (None, None))
+        self.assertIsNone(self.router.route(HONOLULU, SEATTLE))
+
+    def test_bidirectional_astar_matches_dijkstra(self):
+        for source in range(self.graph.node_count):
+            fastest = dijkstra(self.graph, source)
+            for target in range(self.graph.node_count):
+                found = self.graph.shortest_path(source, target)
+                if target not in fastest:
+                    self.assertIsNone(found)
+                    continue
+                path, seconds = found
+                self.assertAlmostEqual(seconds, fastest[target], places=3)
+                # The edges returned chain from source to target and add up to that time
+                node = source
+                for e in path:
+                    self.assertEqual(self.graph._edge_source(e), node)
+                    node = self.graph.fwd_targets[e]
+                self.assertEqual(node, target)
+                self.assertAlmostEqual(sum(self.graph.fwd_time[e] for e in path), seconds, places=3)
+
+    def test_one_way_and_speed(self):
+        # A fast detour B-C-D around a slow direct road B-D, and a one-way A->B
+        spec = {
+            'nodes': [{'id': 'A', 'lat': 40.0, 'lng': -100.0},
+                      {'id': 'B', 'lat': 40.0, 'lng': -99.0},
+                      {'id': 'C', 'lat': 40.3, 'lng': -98.5},
+                      {'id': 'D', 'lat': 40.0, 'lng': -98.0}],
+            'edges': [{'from': 'A', 'to': 'B', 'name': 'Ramp', 'oneway': True},
+                      {'from': 'B', 'to': 'D', 'name': 'Main St', 'speed_mph': 20},
+                      {'from': 'B', 'to': 'C', 'name': 'I-1', 'speed_mph': 70},
+                      {'from': 'C', 'to': 'D', 'name': 'I-1', 'speed_mph': 70}],
+        }
+        with tempfile.TemporaryDirectory() as directory:
+            source = Path(directory) / 'graph.json'
+            source.write_text(json.dumps(spec))
+            self.assertEqual(build_graph_from_json(source, Path(directory) / 'graph.bin'), (4, 7))
+            graph = RoadGraph(Path(directory) / 'graph.bin')
+            path, _ = graph.shortest_path(0, 3)
+            self.assertEqual([graph.fwd_targets[e] for e in path], [1, 2, 3])
+            self.assertIsNone(graph.shortest_path(1, 0))
+            route = LocalRouter(graph).route({'lat': 40.0, 'lng': -100.0}, {'lat': 40.0, 'lng': -98.0})
+            self.assertEqual([step['name'] for step in route['steps']], ['', 'Ramp', 'I-1', ''])
+
+    @override_settings(ROUTING_BACKEND='local')
+    def test_calculator_falls_back_off_the_graph(self):
+        route = RouteCalculator().get_route(HONOLULU, SEATTLE)
+        self.assertTrue(route['fallback'])
+        self.assertAlmostEqual(route['distance'], haversine_m(
+            HONOLULU['lat'], HONOLULU['lng'], SEATTLE['lat'], SEATTLE['lng']) / METERS_PER_MILE,
+            delta=1)
+
+
+class PlanJobQueueTest(TestCase):
+    """Leasing, retrying and failing jobs in the database-backed queue"""
+    payload = {'current_location': CHICAGO, 'dropoff_location': NEARBY, 'current_cycle_used': 20}
+
+    def expire_lease(self, job):
+        PlanJob.objects.filter(pk=job.pk).update(locked_until=timezone.now() - timedelta(seconds=1))
+
+    def test_leased_job_not_claimed_twice(self):
+        submitted = submit_job(self.payload)
+        job = claim_job('worker-1')
+        self.assertEqual((job.pk, job.status, job.locked_by, job.attempts),
+                         (submitted.pk, 'running', 'worker-1', 1))
+        self.assertIsNone(claim_job('worker-2'))
+
+        # A stalled worker loses the job once its lease runs out
+        self.expire_lease(job)
+        job = claim_job('worker-2')
+        self.assertEqual((job.locked_by, job.attempts), ('worker-2', 2))
+
+    def test_lease_expiring_on_last_attempt_fails_job(self):
+        job = submit_job(self.payload)
+        PlanJob.objects.filter(pk=job.pk).update(max_attempts=1)
+        claim_job('worker-1')
+        self.expire_lease(job)
+        self.assertIsNone(claim_job('worker-2'))
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'failed')
+        self.assertEqual(job.locked_by, '')
+        self.assertIsNotNone(job.finished_at)
+
+    def test_failed_job_retried_with_backoff(self):
+        submit_job(self.payload)
+        with mock.patch('api.jobs.execute_job', side_effect=RuntimeError('OSRM down')), \
+                self.assertLogs('api.jobs', 'WARNING'):
+            for attempt in range(1, DEFAULT_MAX_ATTEMPTS + 1):
+                job = claim_job('worker-1')
+                self.assertEqual(job.attempts, attempt)
+                before = timezone.now()
+                self.assertFalse(run_job(job, 'worker-1', retry_backoff=5))
+                job.refresh_from_db()
+                self.assertEqual(job.error, 'OSRM down')
+                if attempt == DEFAULT_MAX_ATTEMPTS:
+                    break
+                self.assertEqual(job.status, 'queued')
+                # Not due again until the backoff, doubled per attempt, has passed
+                self.assertGreaterEqual(job.available_at,
+                                        before + timedelta(seconds=5 * 2 ** (attempt - 1)))
+                self.assertIsNone(claim_job('worker-1'))
+                PlanJob.objects.filter(pk=job.pk).update(available_at=timezone.now())
+        self.assertEqual(job.status, 'failed')
+        self.assertIsNone(claim_job('worker-1'))
+
+    def test_invalid_payload_not_retried(self):
+        submit_job({'current_location': CHICAGO})
+        job = claim_job('worker-1')
+        with self.assertLogs('api.jobs', 'WARNING'):
+            self.assertFalse(run_job(job, 'worker-1'))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('failed', 1))
+
+    @override_settings(ROUTING_BACKEND='local', TRUCK_STOPS_PATH='')
+    def test_succeeded_job_saves_trip(self):
+        submit_job(self.payload)
+        self.assertTrue(run_job(claim_job('worker-1'), 'worker-1'))
+        job = PlanJob.objects.get()
+        self.assertEqual(job.status, 'succeeded')
+        self.assertEqual(job.result, {'trip_id': Trip.objects.get().pk})
+
+
+class LeaseHeartbeatTest(TransactionTestCase):
+    """A job running past its visibility timeout keeps its lease"""
+
+    def test_slow_job_keeps_lease(self):
+        submit_job(PlanJobQueueTest.payload)
+        job = claim_job('worker-1', visibility_timeout=0.6)
+        stolen = []
+
+        def slow_plan(job):
+            time.sleep(1.5)
+            stolen.append(claim_job('worker-2', visibility_timeout=0.6))
+            return {}, None
+
+        with mock.patch('api.jobs.execute_job', side_effect=slow_plan):
+            self.assertTrue(run_job(job, 'worker-1', visibility_timeout=0.6))
+        self.assertEqual(stolen, [None])
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('succeeded', 1))
+
+
+def offset(point, north_miles=0.0, east_miles=0.0):
+    """A point moved some miles north and east of a lat/lng dict"""
+    return {
+        **point,
+        'lat': point['lat'] + north_miles / MILES_PER_DEGREE,
+        'lng': point['lng'] + east_miles / (MILES_PER_DEGREE * math.cos(math.radians(point['lat']))),
+    }
+
+
+@override_settings(ROUTING_BACKEND='local', TRUCK_STOPS_PATH='')
+class LocationTest(TestCase):
+    """Interning saved locations and finding them by geohash"""
+
+    def test_repeated_lane_adds_no_locations(self):
+        create_trip(LOS_ANGELES)
+        count = Location.objects.count()
+        create_trip(LOS_ANGELES)
+        self.assertEqual(Trip.objects.count(), 2)
+        self.assertEqual(Location.objects.count(), count)
+
+    def test_intern_tolerance(self):
+        yard = {'name': 'Yard', **CHICAGO}
+        saved, = intern_locations([yard])
+        inside, outside, renamed = intern_locations([
+            offset(yard, north_miles=0.8 * DEFAULT_INTERN_TOLERANCE_MILES),
+            offset(yard, east_miles=1.5 * DEFAULT_INTERN_TOLERANCE_MILES),
+            {**yard, 'name': 'Dock'},
+        ])
+        self.assertEqual(inside.pk, saved.pk)
+        self.assertNotEqual(outside.pk, saved.pk)
+        self.assertNotEqual(renamed.pk, saved.pk)
+        self.assertEqual(Location.objects.count(), 3)
+
+    def test_near_across_cell_boundaries(self):
+        # Around (0, 0) and the antimeridian every neighbour is in another top-level cell
+        for centre in ({'lat': 0.0, 'lng': 0.0}, {'lat': 0.0, 'lng': 180.0}):
+            points = [
+                offset(centre, north, east)
+                for north in (-0.2, 0.2) for east in (-0.2, 0.2)
+            ]
+            for point in points:
+                point['lng'] = (point['lng'] + 180.0) % 360.0 - 180.0
+            far = offset(centre, north_miles=3)
+            created = intern_locations([
+                {'name': f'Point {i}', **point} for i, point in enumerate(points + [far])
+            ])
+            self.assertEqual(len({location.geohash[0] for location in created[:4]}), 4)
+
+            response = APIClient().get('/api/locations/near/', {
+                'lat': centre['lat'], 'lng': (centre['lng'] + 180.0) % 360.0 - 180.0, 'radius': 1,
+            })
+            self.assertEqual(response.status_code, 200)
+            found = {location['id'] for location in response.data}
+            self.assertEqual(found, {location.pk for location in created[:4]})
+            distances = [location['distance_miles'] for location in response.data]
+            self.assertEqual(distances, sorted(distances))
+            self.assertTrue(all(distance < 0.3 for distance in distances))
+
+
+class TripListTest(TestCase):
+    """Keyset pages and sparse fieldsets on the trip list"""
+
+    def setUp(self):
+        Trip.objects.bulk_create([Trip(current_cycle_used=hours) for hours in range(11)])
+        # Most trips share a created_at, so only the id orders them
+        ids = list(Trip.objects.order_by('id').values_list('id', flat=True))
+        same = datetime(2024, 3, 4, 6, tzinfo=dt_timezone.utc)
+        Trip.objects.filter(pk__in=ids[1:9]).update(created_at=same)
+        Trip.objects.filter(pk=ids[0]).update(created_at=same - timedelta(hours=1))
+        Trip.objects.filter(pk__in=ids[9:]).update(created_at=same + timedelta(hours=1))
+        self.expected = list(Trip.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+
+    def test_pages_through_tied_created_at(self):
+        client = APIClient()
+        seen = []
+        url = '/api/trips/?page_size=3'
+        # Bounded, so a cursor that repeats rows fails instead of looping
+        while url and len(seen) <= len(self.expected):
+            response = client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertLessEqual(len(response.data['results']), 3)
+            seen.extend(trip['id'] for trip in response.data['results'])
+            url = response.data['next']
+        self.assertEqual(seen, self.expected)
+
+    def test_invalid_cursor(self):
+        response = APIClient().get('/api/trips/', {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 404)
+
+    def test_sparse_fieldsets(self):
+        response = APIClient().get('/api/trips/', {'fields': 'id,status', 'page_size': 2})
+        self.assertEqual([set(trip) for trip in response.data['results']], [{'id', 'status'}] * 2)
+        response = APIClient().get('/api/trips/', {'fields': 'id', 'expand': 'stops'})
+        self.assertEqual(set(response.data['results'][0]), {'id', 'stops'})
@@ -0,0 +1,158 @@
+import csv
+import math
+import threading
+
+import numpy as np
+from django.conf import settings
+
+from . import geodesic
+
+CELL_DEGREES = 0.25  # Grid cell size; about 17 x 12 miles at US latitudes
+MILES_PER_DEGREE = 69.09
+DEFAULT_MAX_DETOUR_MILES = 3  # How far off the route a facility may be
+DEFAULT_MAX_BACKTRACK_MILES = 50  # How much earlier than planned a stop may move
+CORRIDOR_SAMPLE_MILES = 1  # Spacing of route points the corridor is matched against
+AMENITY_FOR_STOP = {'fuel': 'fuel', 'rest': 'parking'}
+
+_index = None
+_index_lock = threading.Lock()
+
+
+class TruckStopIndex:
+    """Truck stops in a uniform lat/lng grid held in NumPy arrays.
+
+    Facilities are sorted by grid cell, and each cell maps to a slice of
+    the arrays, so a box query touches only the cells it overlaps.
+    """
+
+    def __init__(self, names, lats, lngs, fuel, parking, cell_degrees=CELL_DEGREES):
+        self.cell_degrees = cell_degrees
+        rows = np.floor(np.asarray(lats, dtype=np.float64) / cell_degrees).astype(np.int64)
+        cols = np.floor(np.asarray(lngs, dtype=np.float64) / cell_degrees).astype(np.int64)
+        order = np.lexsort((cols, rows))
+        self.names = [names[i] for i in order]
+        self.lats = np.asarray(lats, dtype=np.float64)[order]
+        self.lngs = np.asarray(lngs, dtype=np.float64)[order]
+        self.amenities = {
+            'fuel': np.asarray(fuel, dtype=bool)[order],
+            'parking': np.asarray(parking, dtype=bool)[order],
+        }
+        self.cells = {}
+        keys = list(zip(rows[order].tolist(), cols[order].tolist()))
+        start = 0
+        for i in range(1, len(keys) + 1):
+            if i == len(keys) or keys[i] != keys[start]:
+                self.cells[keys[start]] = (start, i)
+                start = i
+
+    def __len__(self):
+        return len(self.names)
+
+    @classmethod
+    def from_csv(cls, path, **kwargs):
+        """Load a CSV with name, lat and lng columns plus optional 0/1 fuel and parking"""
+        names, lats, lngs, fuel, parking = [], [], [], [], []
+        with open(path, newline='') as handle:
+            for row in csv.DictReader(handle):
+                names.append(row['name'])
+                lats.append(float(row['lat']))
+                lngs.append(float(row['lng']))
+                fuel.append(row.get('fuel', '1').strip() not in ('0', 'false', 'False', ''))
+                parking.append(row.get('parking', '1').strip() not in ('0', 'false', 'False', ''))
+        return cls(names, lats, lngs, fuel, parking, **kwargs)
+
+    def in_box(self, lat_min, lat_max, lng_min, lng_max):
+        """Indexes of facilities in the cells overlapping a lat/lng box"""
+        size = self.cell_degrees
+        found = []
+        for row in range(math.floor(lat_min / size), math.floor(lat_max / size) + 1):
+            for col in range(math.floor(lng_min / size), math.floor(lng_max / size) + 1):
+                span = self.cells.get((row, col))
+                if span is not None:
+                    found.append(np.arange(*span))
+        return np.concatenate(found) if found else np.empty(0, dtype=np.int64)
+
+    def nearest(self, lat, lng, radius_miles, amenity=None):
+        """(index, miles) of the closest facility within radius_miles, or None"""
+        lat_pad = radius_miles / MILES_PER_DEGREE
+        lng_pad = lat_pad / max(math.cos(math.radians(min(abs(lat) + lat_pad, 89.9))), 1e-6)
+        candidates = self.in_box(lat - lat_pad, lat + lat_pad, lng - lng_pad, lng + lng_pad)
+        if amenity is not None:
+            candidates = candidates[self.amenities[amenity][candidates]]
+        if not len(candidates):
+            return None
+        distances = geodesic.haversine(lat, lng, self.lats[candidates], self.lngs[candidates])
+        best = int(np.argmin(distances))
+        if distances[best] > radius_miles:
+            return None
+        return int(candidates[best]), float(distances[best])
+
+
+class RouteStopFinder:
+    """Finds facilities along one routed trip for the HOS scheduler.
+
+    find() looks for the latest facility with the needed amenity within
+    max_detour miles of the route, between max_backtrack miles before the
+    planned stop and the planned stop itself, since hours-of-service
+    limits allow stopping early but never late.
+    """
+
+    def __init__(self, index, geometry, max_detour=DEFAULT_MAX_DETOUR_MILES,
+                 max_backtrack=DEFAULT_MAX_BACKTRACK_MILES):
+        self.index = index
+        self.geometry = geometry
+        self.max_detour = max_detour
+        self.max_backtrack = max_backtrack
+
+    def find(self, stop_type, mile_from, mile_to):
+        """(mile, location, off_route_miles) of the facility to stop at, or None"""
+        amenity = AMENITY_FOR_STOP.get(stop_type)
+        start = max(mile_from, mile_to - self.max_backtrack)
+        if amenity is None or mile_to <= start:
+            return None
+        miles = np.linspace(start, mile_to, int((mile_to - start) / CORRIDOR_SAMPLE_MILES) + 2)
+        lats, lngs = self.geometry.locate_many(miles)
+
+        lat_pad = self.max_detour / MILES_PER_DEGREE
+        lng_pad = lat_pad / max(math.cos(math.radians(min(np.abs(lats).max() + lat_pad, 89.9))), 1e-6)
+        candidates = self.index.in_box(lats.min() - lat_pad, lats.max() + lat_pad,
+                                       lngs.min() - lng_pad, lngs.max() + lng_pad)
+        candidates = candidates[self.index.amenities[amenity][candidates]]
+        if not len(candidates):
+            return None
+
+        # Distance from every candidate to every corridor sample
+        distances = geodesic.haversine(
+            self.index.lats[candidates, None], self.index.lngs[candidates, None],
+            lats[None, :], lngs[None, :]
+        )
+        nearest_sample = distances.argmin(axis=1)
+        off_route = distances[np.arange(len(candidates)), nearest_sample]
+        usable = off_route <= self.max_detour
+        if not usable.any():
+            return None
+        # Latest along the route wins, then the smallest detour
+        choice = max(np.flatnonzero(usable), key=lambda i: (nearest_sample[i], -off_route[i]))
+        facility = int(candidates[choice])
+        return (
+            float(miles[nearest_sample[choice]]),
+            {
+                'name': self.index.names[facility],
+                'lat': float(self.index.lats[facility]),
+                'lng': float(self.index.lngs[facility]),
+            },
+            float(off_route[choice]),
+        )
+
+
+def get_truck_stop_index():
+    """Return the process-wide truck-stop index for TRUCK_STOPS_PATH, or None when disabled"""
+    global _index
+    path = getattr(settings, 'TRUCK_STOPS_PATH', None)
+    if not path:
+        return None
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = TruckStopIndex.from_csv(path)
+    return _index
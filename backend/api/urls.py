@@ -2,7 +2,10 @@ from django.http import JsonResponse
 from django.contrib import admin
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import LocationViewSet, TripViewSet, RouteCalculationView
+from .views import (
+    LocationViewSet, TripViewSet, PlanJobViewSet, ELDLogEntryViewSet, RouteCalculationView, RouteBatchView,
+    DriverCycleView, OSRMStatusView, metrics_view
+)
 
 def api_root(request):
     return JsonResponse({
@@ -10,8 +13,15 @@ def api_root(request):
         'message': 'ELD Trip Planner API',
         'endpoints': {
             'calculate_route': '/api/calculate-route/',
+            'calculate_route_batch': '/api/calculate-route/batch/',
+            'osrm_status': '/api/osrm/status/',
+            'metrics': '/api/metrics',
             'locations': '/api/locations/',
             'trips': '/api/trips/',
+            'trip_replan': '/api/trips/<id>/replan/',
+            'jobs': '/api/jobs/',
+            'eld_entries': '/api/eld-entries/',
+            'driver_cycle': '/api/drivers/<driver_id>/cycle/',
             'admin': '/admin/'
         }
     })
@@ -19,10 +29,16 @@ def api_root(request):
 router = DefaultRouter()
 router.register(r'locations', LocationViewSet)
 router.register(r'trips', TripViewSet)
+router.register(r'jobs', PlanJobViewSet)
+router.register(r'eld-entries', ELDLogEntryViewSet)
 
 urlpatterns = [
     path('', api_root, name='api-root'),
     path('admin/', admin.site.urls),
     path('api/', include(router.urls)),
     path('api/calculate-route/', RouteCalculationView.as_view(), name='calculate-route'),
+    path('api/calculate-route/batch/', RouteBatchView.as_view(), name='calculate-route-batch'),
+    path('api/drivers/<str:driver_id>/cycle/', DriverCycleView.as_view(), name='driver-cycle'),
+    path('api/osrm/status/', OSRMStatusView.as_view(), name='osrm-status'),
+    path('api/metrics', metrics_view, name='metrics'),
 ]
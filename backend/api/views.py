@@ -1,40 +1,164 @@
-import requests
-import json
-import math
-from datetime import datetime, timedelta
+import numpy as np
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
 from django.utils import timezone
-from rest_framework import viewsets, status
+from rest_framework import mixins, viewsets, status
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
 from rest_framework.views import APIView
-from .models import Location, Trip, Route, Stop, ELDLog, ELDLogEntry
+from .models import Location, Trip, ELDLogEntry, PlanJob
 from .serializers import (
-    LocationSerializer, TripSerializer, RouteSerializer, 
-    StopSerializer, ELDLogSerializer, ELDLogEntrySerializer,
-    TripInputSerializer, RouteCalculationSerializer
+    LocationSerializer, TripSerializer, ELDLogEntrySerializer, ELDLogEntryQuerySerializer,
+    TripInputSerializer, TripSummarySerializer,
+    PlanJobSerializer, PlanJobInputSerializer, NearbyLocationSerializer, NearbyQuerySerializer,
+    TripReplanSerializer, split_query_param
 )
 from django.conf import settings
+from django.http import HttpResponse
+from . import geodesic
+from . import polyline as polyline_codec
+from .batch import BatchPlanner
+from .conditional import ConditionalGetMixin
+from .database import ReplicaReadMixin, use_replica
+from .hos import HOSScheduler, default_start_time
+from .jobs import submit_job
+from .ledger import cycle_summary
+from .locations import nearby
+from .metrics import ROUTE_LEGS, registry, timed
+from .pagination import EventTimePagination, KeysetPagination
+from .persistence import TripChanged, save_replan, save_trip_plan
+from .plan_cache import get_plan_cache
+from .replan import plan_remaining
+from .osrm import OSRMError, get_osrm_client
+from .road_graph import get_local_router
+from .route_geometry import DEFAULT_POLYLINE_RESOLUTION, POLYLINE_RESOLUTIONS, RouteGeometry
+from .route_cache import get_route_cache
+from .singleflight import get_single_flight
+from .streaming import NDJSONRenderer, stream_ndjson, wants_ndjson
+from .truck_stops import (
+    DEFAULT_MAX_BACKTRACK_MILES, DEFAULT_MAX_DETOUR_MILES, RouteStopFinder, get_truck_stop_index
+)
+
+FALLBACK_SPEED_MPH = 55  # Average speed assumed when routing by haversine
+FALLBACK_SAMPLE_MILES = 25  # Spacing of great-circle points in fallback geometry
+JOB_POLL_INTERVAL = 0.25  # Seconds between checks while long-polling a job
+DEFAULT_JOB_MAX_WAIT = 30  # Longest ?wait= a client may hold a request open for
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+# Planning endpoints also answer Accept: application/x-ndjson, streaming the plan
+STREAMING_RENDERERS = [*api_settings.DEFAULT_RENDERER_CLASSES, NDJSONRenderer]
+
+# Related data loaded alongside a trip for the full TripSerializer
+TRIP_LOCATION_FIELDS = ('current_location', 'pickup_location', 'dropoff_location')
+TRIP_DETAIL_PREFETCH = ('routes', 'stops__location', 'eld_logs__entries')
+
+# Default display names for trip waypoints
+WAYPOINT_NAMES = {
+    'start': 'Current Location',
+    'pickup': 'Pickup Location',
+    'dropoff': 'Dropoff Location',
+}
+
+_leg_executor = None
+_leg_executor_lock = threading.Lock()
+
+
+def get_leg_executor():
+    """Return the shared, bounded thread pool used to fetch route legs"""
+    global _leg_executor
+    if _leg_executor is None:
+        with _leg_executor_lock:
+            if _leg_executor is None:
+                _leg_executor = ThreadPoolExecutor(
+                    max_workers=getattr(settings, 'OSRM_MAX_WORKERS', 8),
+                    thread_name_prefix='osrm-leg'
+                )
+    return _leg_executor
+
+
+def get_polyline_resolution(request):
+    """Polyline resolution chosen with ?resolution= (low, medium, high or full)"""
+    resolution = request.query_params.get('resolution', DEFAULT_POLYLINE_RESOLUTION)
+    if resolution not in POLYLINE_RESOLUTIONS:
+        raise ValidationError({
+            'resolution': f'Expected one of: {", ".join(POLYLINE_RESOLUTIONS)}.'
+        })
+    return resolution
 
-# Constants for DOT hours of service
-MAX_DRIVING_HOURS = 11  # Maximum driving hours in a 24-hour period
-MAX_DRIVING_WINDOW = 14  # Maximum driving window (14-hour rule)
-MIN_REST_BREAK = 10  # Minimum 10-hour rest break
-FUEL_STOP_INTERVAL = 1000  # Fuel every 1000 miles
-PICKUP_DROP_TIME = 1  # 1 hour for pickup/dropoff
-WEEKLY_CYCLE_LIMIT = 70  # 70-hour weekly cycle
-CYCLE_DAYS = 8  # 8-day cycle
 
+def select_polyline(result, resolution):
+    """Return a route result carrying only the polyline at the chosen resolution"""
+    result = dict(result)
+    polylines = result.pop('polylines', None)
+    if polylines:
+        result['polyline'] = polylines[resolution]
+        result['resolution'] = resolution
+    return result
 
-class LocationViewSet(viewsets.ModelViewSet):
+
+def plan_records(result):
+    """NDJSON records of a finished plan, in the order RouteCalculator.stream emits them"""
+    summary = {key: value for key, value in result.items()
+               if key not in ('steps', 'stops', 'eld_logs', 'total_days')}
+    yield {'type': 'summary', **summary}
+    for step in result['steps']:
+        yield {'type': 'step', **step}
+    # Stops and logs interleaved by time, as the scheduler yields them; a live
+    # stream cannot know total_trip_days until the end record
+    logs = iter([{key: value for key, value in log.items() if key != 'total_trip_days'}
+                 for log in result['eld_logs']])
+    log = next(logs, None)
+    for stop in result['stops']:
+        while log is not None and log['log_date'] < stop['arrival_time'][:10]:
+            yield {'type': 'log', **log}
+            log = next(logs, None)
+        yield {'type': 'stop', **stop}
+    while log is not None:
+        yield {'type': 'log', **log}
+        log = next(logs, None)
+    yield {'type': 'end', 'stops': len(result['stops']), 'total_days': result['total_days']}
+
+
+class LocationViewSet(ReplicaReadMixin, viewsets.ReadOnlyModelViewSet):
+    """Saved locations; read-only, since trips share the rows they are interned into"""
     queryset = Location.objects.all()
     serializer_class = LocationSerializer
 
+    @action(detail=False, methods=['get'])
+    def near(self, request):
+        """Locations within ?radius= miles of ?lat=&lng=, nearest first"""
+        query = NearbyQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        params = query.validated_data
+        with use_replica():
+            found = nearby(params['lat'], params['lng'], params['radius'], limit=params['limit'])
+        return Response(NearbyLocationSerializer(found, many=True).data)
 
-class TripViewSet(viewsets.ModelViewSet):
+
+class TripViewSet(ReplicaReadMixin, ConditionalGetMixin, viewsets.ModelViewSet):
     queryset = Trip.objects.all()
     serializer_class = TripSerializer
+    pagination_class = KeysetPagination
 
-    @action(detail=False, methods=['post'])
+    def get_queryset(self):
+        queryset = Trip.objects.select_related(*TRIP_LOCATION_FIELDS)
+        if self.action == 'list':
+            # Only prefetch the relations the client asked to expand
+            expand = split_query_param(self.request, 'expand')
+            return queryset.prefetch_related(
+                *[p for p in TRIP_DETAIL_PREFETCH if p.split('__')[0] in expand]
+            )
+        return queryset.prefetch_related(*TRIP_DETAIL_PREFETCH)
+
+    def get_serializer_class(self):
+        if self.action == 'list':
+            return TripSummarySerializer
+        return TripSerializer
+
+    @action(detail=False, methods=['post'], renderer_classes=STREAMING_RENDERERS)
     def calculate_route(self, request):
         """Calculate route and generate ELD logs for a trip"""
         input_serializer = TripInputSerializer(data=request.data)
@@ -42,10 +166,13 @@ class TripViewSet(viewsets.ModelViewSet):
             return Response(input_serializer.errors, status=status.HTTP_400_BAD_REQUEST)
         
         data = input_serializer.validated_data
+        resolution = get_polyline_resolution(request)
         calculator = RouteCalculator()
+        if wants_ndjson(request):
+            return stream_ndjson(calculator.stream(data, resolution))
         result = calculator.calculate(data)
         
-        return Response(result)
+        return Response(select_polyline(result, resolution))
 
     @action(detail=False, methods=['post'])
     def create_trip(self, request):
@@ -60,85 +187,133 @@ class TripViewSet(viewsets.ModelViewSet):
         calculator = RouteCalculator()
         result = calculator.calculate(data)
         
-        # Create trip in database
-        trip = Trip.objects.create(
-            current_cycle_used=data['current_cycle_used'],
-            status='planned',
-            total_distance=result['distance_miles'],
-            estimated_duration=result['duration_hours']
-        )
-        
-        # Create locations
-        current_loc = Location.objects.create(
-            name='Current Location',
-            latitude=data['current_location']['lat'],
-            longitude=data['current_location']['lng']
-        )
-        dropoff_loc = Location.objects.create(
-            name='Dropoff Location',
-            latitude=data['dropoff_location']['lat'],
-            longitude=data['dropoff_location']['lng']
-        )
-        trip.current_location = current_loc
-        trip.dropoff_location = dropoff_loc
-        
-        if data.get('pickup_location'):
-            pickup_loc = Location.objects.create(
-                name='Pickup Location',
-                latitude=data['pickup_location']['lat'],
-                longitude=data['pickup_location']['lng']
-            )
-            trip.pickup_location = pickup_loc
-        
-        trip.save()
-        
-        # Create route
-        Route.objects.create(
-            trip=trip,
-            polyline=result.get('polyline', ''),
-            distance=result['distance_miles'],
-            duration=result['duration_hours'] * 3600,
-            steps=result['steps']
+        # Save trip, route, stops and logs in one transaction
+        with timed('db_write'):
+            trip = save_trip_plan(data, result)
+        with timed('db_read'):
+            trip = Trip.objects.select_related(*TRIP_LOCATION_FIELDS).prefetch_related(
+                *TRIP_DETAIL_PREFETCH
+            ).get(pk=trip.pk)
+        
+        with timed('serialize'):
+            serializer_data = TripSerializer(trip, context=self.get_serializer_context()).data
+        return Response(serializer_data)
+
+    @action(detail=True, methods=['post'])
+    def replan(self, request, pk=None):
+        """Re-plan the rest of a stored trip from the truck's current position and duty clocks"""
+        trip = self.get_object()
+        input_serializer = TripReplanSerializer(data=request.data)
+        if not input_serializer.is_valid():
+            return Response(input_serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        with timed('replan'):
+            plan = plan_remaining(trip, input_serializer.validated_data, RouteCalculator())
+        with timed('db_write'):
+            try:
+                save_replan(trip, plan)
+            except TripChanged:
+                return Response(
+                    {'detail': 'The trip changed while it was being re-planned; try again.'},
+                    status=status.HTTP_409_CONFLICT
+                )
+        with timed('db_read'):
+            trip = Trip.objects.select_related(*TRIP_LOCATION_FIELDS).prefetch_related(
+                *TRIP_DETAIL_PREFETCH
+            ).get(pk=trip.pk)
+
+        with timed('serialize'):
+            serializer_data = TripSerializer(trip, context=self.get_serializer_context()).data
+        return Response({
+            **serializer_data,
+            'replan': {
+                'progress_miles': plan['progress_miles'],
+                'off_route_miles': plan['off_route_miles'],
+                'rerouted': plan['rerouted'],
+                'stops_kept': plan['first_order'],
+            },
+        })
+
+
+class PlanJobViewSet(mixins.CreateModelMixin, mixins.RetrieveModelMixin,
+                     mixins.ListModelMixin, viewsets.GenericViewSet):
+    """Submit trip plans to the background queue and poll for their results"""
+    queryset = PlanJob.objects.all()
+    serializer_class = PlanJobSerializer
+    pagination_class = KeysetPagination
+
+    def create(self, request):
+        """Queue a plan; returns 202 with the job to poll"""
+        input_serializer = PlanJobInputSerializer(data=request.data)
+        if not input_serializer.is_valid():
+            return Response(input_serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        job = submit_job(**input_serializer.validated_data)
+        serializer = PlanJobSerializer(job, context=self.get_serializer_context())
+        return Response(serializer.data, status=status.HTTP_202_ACCEPTED,
+                        headers={'Location': request.build_absolute_uri(f'{job.pk}/')})
+
+    def retrieve(self, request, pk=None):
+        """Job status; ?wait=<seconds> long-polls until the job finishes"""
+        job = self.get_object()
+        try:
+            wait = float(request.query_params.get('wait', 0))
+        except ValueError:
+            wait = 0
+        deadline = time.monotonic() + min(
+            max(wait, 0), getattr(settings, 'JOBS_MAX_WAIT', DEFAULT_JOB_MAX_WAIT)
         )
-        
-        # Create stops
-        for i, stop_data in enumerate(result['stops']):
-            loc = Location.objects.create(
-                name=stop_data['location']['name'],
-                latitude=stop_data['location'].get('lat', 0),
-                longitude=stop_data['location'].get('lng', 0)
-            )
-            Stop.objects.create(
-                trip=trip,
-                location=loc,
-                stop_type=stop_data['stop_type'],
-                arrival_time=datetime.fromisoformat(stop_data['arrival_time']),
-                departure_time=datetime.fromisoformat(stop_data['departure_time']),
-                duration=stop_data['duration'],
-                miles_driven=stop_data['miles_driven'],
-                notes=stop_data.get('notes', ''),
-                sequence_order=i
-            )
-        
-        # Create ELD logs
-        for log_data in result['eld_logs']:
-            eld_log = ELDLog.objects.create(
-                trip=trip,
-                log_date=datetime.fromisoformat(log_data['log_date']).date(),
-                driver_id=log_data['driver_id'],
-                carrier_name=log_data['carrier_name'],
-                truck_number=log_data['truck_number'],
-                total_miles=log_data['total_miles'],
-                cycle_hours_used=log_data['cycle_hours_used'],
-                status_entries=log_data['status_entries']
-            )
-        
-        serializer = TripSerializer(trip)
-        return Response(serializer.data)
+        while not job.is_finished and time.monotonic() < deadline:
+            time.sleep(JOB_POLL_INTERVAL)
+            job.refresh_from_db()
+        return Response(PlanJobSerializer(job, context=self.get_serializer_context()).data)
+
+
+class ELDLogEntryViewSet(ReplicaReadMixin, ConditionalGetMixin, viewsets.ReadOnlyModelViewSet):
+    """Duty-status events, queried by driver and time window.
+
+    ?driver_id= is required; ?status= (comma-separated), ?start= and ?end=
+    narrow the window. Results come in event_time order.
+    """
+    version_field = 'created_at'  # Entries are only ever inserted or deleted
+    queryset = ELDLogEntry.objects.all()
+    serializer_class = ELDLogEntrySerializer
+    pagination_class = EventTimePagination
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action != 'list':
+            return queryset
+        filters = ELDLogEntryQuerySerializer(data=self.request.query_params)
+        filters.is_valid(raise_exception=True)
+        params = filters.validated_data
+
+        queryset = queryset.filter(driver_id=params['driver_id'])
+        if params.get('status'):
+            queryset = queryset.filter(status__in=params['status'])
+        if params.get('start'):
+            queryset = queryset.filter(event_time__gte=params['start'])
+        if params.get('end'):
+            queryset = queryset.filter(event_time__lt=params['end'])
+        return queryset
+
+
+class DriverCycleView(APIView):
+    """Rolling 70-hour/8-day cycle for one driver, from the duty ledger"""
+
+    def get(self, request, driver_id):
+        """Hours used and available on ?date= (default today) plus the recap schedule"""
+        value = request.query_params.get('date')
+        try:
+            day = date.fromisoformat(value) if value else timezone.localdate()
+        except ValueError:
+            raise ValidationError({'date': 'Expected a date as YYYY-MM-DD.'})
+        return Response(cycle_summary(driver_id, day))
 
 
 class RouteCalculationView(APIView):
-    """API view for route calculations"""
+    """API view for route calculations; Accept: application/x-ndjson streams the plan"""
+    renderer_classes = STREAMING_RENDERERS
     
     def post(self, request):
         """Calculate route and generate ELD logs"""
@@ -147,108 +322,389 @@ class RouteCalculationView(APIView):
             return Response(input_serializer.errors, status=status.HTTP_400_BAD_REQUEST)
         
         data = input_serializer.validated_data
+        resolution = get_polyline_resolution(request)
         calculator = RouteCalculator()
+        if wants_ndjson(request):
+            return stream_ndjson(calculator.stream(data, resolution))
         result = calculator.calculate(data)
         
-        return Response(result)
+        return Response(select_polyline(result, resolution))
+
+
+class RouteBatchView(APIView):
+    """API view for planning many trips in one request"""
+    renderer_classes = STREAMING_RENDERERS
+
+    def post(self, request):
+        """Calculate routes for a list of trip payloads, preserving input order"""
+        items = request.data.get('trips') if isinstance(request.data, dict) else request.data
+        if not isinstance(items, list) or not items:
+            return Response(
+                {'trips': 'Expected a non-empty list of trip payloads.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        max_items = getattr(settings, 'BATCH_MAX_ITEMS', 1000)
+        if len(items) > max_items:
+            return Response(
+                {'trips': f'At most {max_items} trips can be planned per batch.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        resolution = get_polyline_resolution(request)
+        planner = BatchPlanner(RouteCalculator())
+        outcomes = self.outcomes(items, planner, resolution)
+        if wants_ndjson(request):
+            return stream_ndjson(self.records(outcomes, len(items), planner))
+
+        results = list(outcomes)
+        return Response({
+            'results': results,
+            'summary': {
+                'items': len(items),
+                'succeeded': sum(1 for r in results if r['status'] == 'ok'),
+                'failed': sum(1 for r in results if r['status'] == 'error'),
+                **planner.stats,
+            }
+        })
+
+    def outcomes(self, items, planner, resolution):
+        """Yield each item's outcome in input order, as soon as it is planned"""
+        errors = {}
+        valid_data = []
+        for i, item in enumerate(items):
+            input_serializer = TripInputSerializer(data=item)
+            if input_serializer.is_valid():
+                valid_data.append(input_serializer.validated_data)
+            else:
+                errors[i] = input_serializer.errors
+
+        planned = planner.iter_plan(valid_data) if valid_data else iter(())
+        for i in range(len(items)):
+            if i in errors:
+                yield {'index': i, 'status': 'error', 'errors': errors[i]}
+                continue
+            outcome = next(planned)
+            if 'result' in outcome:
+                outcome = {**outcome, 'result': select_polyline(outcome['result'], resolution)}
+            yield {'index': i, **outcome}
+
+    def records(self, outcomes, count, planner):
+        """NDJSON records: one per item, then the batch summary"""
+        succeeded = failed = 0
+        for outcome in outcomes:
+            if outcome['status'] == 'ok':
+                succeeded += 1
+            else:
+                failed += 1
+            yield {'type': 'result', **outcome}
+        yield {'type': 'summary', 'items': count, 'succeeded': succeeded, 'failed': failed,
+               **planner.stats}
+
+
+class OSRMStatusView(APIView):
+    """Expose OSRM circuit breaker state and route cache counters"""
+
+    def get(self, request):
+        return Response({
+            'osrm_base_url': get_osrm_client().base_url,
+            'circuit_breaker': get_osrm_client().breaker.snapshot(),
+            'route_cache': get_route_cache().stats(),
+            'plan_cache': get_plan_cache().stats(),
+            'single_flight': {
+                name: get_single_flight(name).stats() for name in ('plans', 'routes')
+            },
+        })
+
+
+@registry.collector
+def collect_routing_stats():
+    """Cache, single-flight and circuit breaker counters, read at scrape time"""
+    route = get_route_cache().stats()
+    for result, key in (('local_hit', 'local_hits'), ('shared_hit', 'shared_hits'),
+                        ('miss', 'misses')):
+        yield ('eld_route_cache_lookups_total', 'Route cache lookups by result', 'counter',
+               {'result': result}, route[key])
+    plan = get_plan_cache().stats()
+    for result, key in (('hit', 'hits'), ('miss', 'misses')):
+        yield ('eld_plan_cache_lookups_total', 'Plan cache lookups by result', 'counter',
+               {'result': result}, plan[key])
+    for name in ('plans', 'routes'):
+        flight = get_single_flight(name).stats()
+        yield ('eld_single_flight_calls_total', 'Calls that ran or joined an in-flight call',
+               'counter', {'group': name, 'role': 'executed'}, flight['executions'])
+        yield ('eld_single_flight_calls_total', 'Calls that ran or joined an in-flight call',
+               'counter', {'group': name, 'role': 'coalesced'}, flight['coalesced'])
+    breaker = get_osrm_client().breaker.snapshot()
+    yield ('eld_osrm_circuit_open', 'Whether the OSRM circuit breaker is open (1) or not (0)',
+           'gauge', {}, int(breaker['state'] == 'open'))
+
+
+def metrics_view(request):
+    """Prometheus text exposition of this process's metrics"""
+    return HttpResponse(registry.render(), content_type=PROMETHEUS_CONTENT_TYPE)
 
 
 class RouteCalculator:
     """Route calculation logic using OSRM free API"""
     
     def __init__(self):
-        self.osrm_base_url = getattr(settings, 'OSRM_BASE_URL', 'https://router.project-osrm.org')
+        self.routing_backend = getattr(settings, 'ROUTING_BACKEND', 'osrm')
+        self.osrm = get_osrm_client()
+        self.route_cache = get_route_cache()
+        self.plan_cache = get_plan_cache()
     
     def calculate(self, data):
-        """Main calculation method"""
-        current_loc = data['current_location']
-        pickup_loc = data.get('pickup_location')
-        dropoff_loc = data['dropoff_location']
-        current_cycle_used = data['current_cycle_used']
-        
-        # Get route from OSRM
-        if pickup_loc:
-            route1 = self.get_osrm_route(current_loc, pickup_loc)
-            route2 = self.get_osrm_route(pickup_loc, dropoff_loc)
-            total_distance = route1['distance'] + route2['distance']
-            total_duration = route1['duration'] + route2['duration']
-            full_route = route1['steps'] + route2['steps']
-            polyline = route1.get('polyline', '') + ';' + route2.get('polyline', '')
-        else:
-            route = self.get_osrm_route(current_loc, dropoff_loc)
-            total_distance = route['distance']
-            total_duration = route['duration']
-            full_route = route['steps']
-            polyline = route.get('polyline', '')
-        
+        """Main calculation method; identical inputs are served from the plan cache"""
+        # Pin the start time so the plan is a pure function of its input
+        data = {**data, 'start_time': data.get('start_time') or default_start_time()}
+        with timed('plan_cache'):
+            cache_key = self.plan_cache.make_key(data)
+            cached = self.plan_cache.get(cache_key)
+        if cached is not None:
+            return cached
+        # Concurrent identical requests wait for one computation
+        return get_single_flight('plans').do(cache_key, self.compute_plan, cache_key, data)
+
+    def compute_plan(self, cache_key, data):
+        """Plan a trip and memoize it; runs once per in-flight key"""
+        # Another process may have finished this plan while we waited for its lock
+        # (visible only with a shared PLAN_CACHE_BACKEND; see checks.check_single_flight_cache)
+        cached = self.plan_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+        waypoints = self.get_waypoints(data)
+        with timed('routing'):
+            legs = self.fetch_legs(waypoints)
+        result = self.build_result(data, waypoints, legs)
+        # Haversine fallbacks are not memoized, so the plan improves once OSRM recovers
+        if not any(leg.get('fallback') for leg in legs):
+            self.plan_cache.set(cache_key, result)
+        return result
+
+    def get_waypoints(self, data):
+        """Normalize trip input into an ordered list of waypoints"""
+        if data.get('waypoints'):
+            last = len(data['waypoints']) - 1
+            waypoints = []
+            for i, point in enumerate(data['waypoints']):
+                if i == 0:
+                    stop_type = 'start'
+                elif i == last:
+                    stop_type = 'dropoff'
+                else:
+                    stop_type = point.get('stop_type', 'dropoff')
+                waypoints.append({
+                    'lat': point['lat'],
+                    'lng': point['lng'],
+                    'stop_type': stop_type,
+                    'name': point.get('name') or WAYPOINT_NAMES[stop_type],
+                })
+            return waypoints
+
+        waypoints = [{**self._point(data['current_location']), 'stop_type': 'start',
+                      'name': WAYPOINT_NAMES['start']}]
+        if data.get('pickup_location'):
+            waypoints.append({**self._point(data['pickup_location']), 'stop_type': 'pickup',
+                              'name': WAYPOINT_NAMES['pickup']})
+        waypoints.append({**self._point(data['dropoff_location']), 'stop_type': 'dropoff',
+                          'name': WAYPOINT_NAMES['dropoff']})
+        return waypoints
+
+    def _point(self, location):
+        return {'lat': location['lat'], 'lng': location['lng']}
+
+    def fetch_legs(self, waypoints):
+        """Fetch every leg between consecutive waypoints, concurrently when there are several"""
+        pairs = list(zip(waypoints, waypoints[1:]))
+        if len(pairs) == 1:
+            return [self.get_route(*pairs[0])]
+        executor = get_leg_executor()
+        futures = [executor.submit(self.get_route, origin, destination)
+                   for origin, destination in pairs]
+        return [future.result() for future in futures]
+
+    def build_result(self, data, waypoints, legs):
+        """Assemble totals, stops and ELD logs from fetched legs.
+
+        Legs from the OSRM table service carry no geometry; a plan using
+        them has no polylines, its stops are placed on straight lines
+        between waypoints and not snapped to truck stops, and it is marked
+        with 'geometry': False.
+        """
+        routed = all(leg.get('geometry', True) for leg in legs)
+        # Legs merged into one geometry, shared by stop placement and the polylines
+        with timed('geometry'):
+            geometry = RouteGeometry.from_legs(waypoints, legs)
+            polylines = geometry.polylines() if routed else None
+
         # Generate stops and ELD logs
-        stops, eld_logs = self.generate_stops_and_logs(
-            current_loc, pickup_loc, dropoff_loc,
-            total_distance, current_cycle_used, data
-        )
-        
-        total_days = len(eld_logs)
+        with timed('schedule'):
+            stops, eld_logs = self.generate_stops_and_logs(
+                waypoints, legs, data['current_cycle_used'], data, geometry=geometry,
+                snap_stops=routed
+            )
         
-        return {
-            'origin': current_loc,
-            'destination': dropoff_loc,
-            'distance_miles': round(total_distance, 1),
-            'duration_hours': round(total_duration, 1),
-            'polyline': polyline,
-            'steps': full_route,
+        result = {
+            **self.summarize(waypoints, legs, polylines),
             'stops': stops,
             'eld_logs': eld_logs,
-            'total_days': total_days
+            'total_days': len(eld_logs)
         }
+        if not routed:
+            result['geometry'] = False
+        return result
+
+    def summarize(self, waypoints, legs, polylines):
+        """Route totals, polylines (None leaves them out) and turn-by-turn steps of a plan"""
+        total_distance = sum(leg['distance'] for leg in legs)
+        total_duration = sum(leg['duration'] for leg in legs)
+        summary = {
+            'origin': self._point(waypoints[0]),
+            'destination': self._point(waypoints[-1]),
+            'waypoints': waypoints,
+            'legs': [
+                {'distance_miles': round(leg['distance'], 1),
+                 'duration_hours': round(leg['duration'], 1)}
+                for leg in legs
+            ],
+            'distance_miles': round(total_distance, 1),
+            'duration_hours': round(total_duration, 1),
+            'steps': [step for leg in legs for step in leg['steps']]
+        }
+        if polylines is not None:
+            summary['polyline'] = polylines['full']
+            summary['polylines'] = polylines
+        return summary
+
+    def stream(self, data, resolution):
+        """Yield a plan as NDJSON records while it is being computed.
+
+        A summary record comes first, then one record per step, then stops
+        and daily logs in time order as the scheduler produces them, then an
+        end record. Only the current record is held in memory, so streamed
+        plans are not written to the plan cache; cached plans are replayed.
+        """
+        data = {**data, 'start_time': data.get('start_time') or default_start_time()}
+        cached = self.plan_cache.get(self.plan_cache.make_key(data))
+        if cached is not None:
+            yield from plan_records(select_polyline(cached, resolution))
+            return
+
+        waypoints = self.get_waypoints(data)
+        with timed('routing'):
+            legs = self.fetch_legs(waypoints)
+        with timed('geometry'):
+            geometry = RouteGeometry.from_legs(waypoints, legs)
+            polylines = geometry.polylines()
+        summary = select_polyline(self.summarize(waypoints, legs, polylines), resolution)
+        steps = summary.pop('steps')
+        yield {'type': 'summary', **summary}
+        for step in steps:
+            yield {'type': 'step', **step}
+        del steps
+
+        scheduler = self.create_scheduler(
+            waypoints, legs, data['current_cycle_used'], data, geometry=geometry
+        )
+        stops = days = 0
+        for kind, item in scheduler.events():
+            if kind == 'stop':
+                stops += 1
+            else:
+                days += 1
+            yield {'type': kind, **item}
+        yield {'type': 'end', 'stops': stops, 'total_days': days}
     
+    def get_route(self, origin, destination):
+        """Get one route leg from the configured routing backend"""
+        if self.routing_backend == 'local':
+            return self.get_local_route(origin, destination)
+        return self.get_osrm_route(origin, destination)
+
+    def get_local_route(self, origin, destination):
+        """Get route from the offline road graph, falling back to haversine off the graph"""
+        route = get_local_router().route(origin, destination)
+        if route is not None:
+            ROUTE_LEGS.inc(source='local')
+            return route
+        return self.fallback_route(origin, destination)
+
     def get_osrm_route(self, origin, destination):
         """Get route from OSRM API - Free routing service"""
+        cache_key = self.route_cache.make_key(origin, destination)
+        cached = self.route_cache.get(cache_key)
+        if cached is not None:
+            ROUTE_LEGS.inc(source='cache')
+        else:
+            # One upstream request per lane, however many callers want it
+            cached = get_single_flight('routes').do(
+                cache_key, self.fetch_osrm_route, cache_key, origin, destination
+            )
+            if cached is not None:
+                ROUTE_LEGS.inc(source='osrm')
+        if cached is not None:
+            return {**cached, 'steps': list(cached['steps'])}
+
+        # Fallback calculation (never cached, so OSRM is retried)
+        if getattr(settings, 'ROUTING_OFFLINE_FALLBACK', False):
+            return self.get_local_route(origin, destination)
+        return self.fallback_route(origin, destination)
+
+    def fetch_osrm_route(self, cache_key, origin, destination):
+        """Request one route from OSRM and cache it; returns None on failure"""
+        cached = self.route_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
         try:
-            url = f"{self.osrm_base_url}/route/v1/driving/{origin['lng']},{origin['lat']};{destination['lng']},{destination['lat']}"
-            params = {
-                'overview': 'full',
-                'geometries': 'polyline',
-                'steps': 'true'
+            data = self.osrm.route(
+                origin, destination,
+                overview='full', geometries='polyline', steps='true'
+            )
+            route = data['routes'][0]
+            result = {
+                'distance': route['distance'] * 0.000621371,  # meters to miles
+                'duration': route['duration'] / 3600,  # seconds to hours
+                'polyline': route['geometry'],
+                'steps': self.process_steps(route['legs'][0]['steps'])
             }
-            response = requests.get(url, params=params, timeout=10)
-            response.raise_for_status()
-            data = response.json()
-            
-            if data.get('code') == 'Ok':
-                route = data['routes'][0]
-                return {
-                    'distance': route['distance'] * 0.000621371,  # meters to miles
-                    'duration': route['duration'] / 3600,  # seconds to hours
-                    'polyline': route['geometry'],
-                    'steps': self.process_steps(route['legs'][0]['steps'])
-                }
-        except Exception as e:
-            pass
+        except (OSRMError, KeyError, IndexError):
+            return None
         
-        # Fallback calculation using haversine
-        return self.fallback_route(origin, destination)
+        self.route_cache.set(cache_key, result)
+        return result
     
     def fallback_route(self, origin, destination):
         """Fallback route calculation using haversine formula"""
-        R = 3959  # Earth's radius in miles
-        lat1, lon1 = math.radians(origin['lat']), math.radians(origin['lng'])
-        lat2, lon2 = math.radians(destination['lat']), math.radians(destination['lng'])
-        dlat = lat2 - lat1
-        dlon = lon2 - lon1
-        a = math.sin(dlat/2)**2 + math.cos(lat1) * math.cos(lat2) * math.sin(dlon/2)**2
-        c = 2 * math.atan2(math.sqrt(a), math.sqrt(1-a))
-        distance = R * c
-        
-        return {
-            'distance': distance,
-            'duration': distance / 55,  # Average 55 mph
-            'polyline': '',
-            'steps': [{
-                'instruction': f'Drive from origin to destination',
+        return self.fallback_routes([(origin, destination)])[0]
+
+    def fallback_routes(self, pairs):
+        """Haversine fallback for many (origin, destination) pairs in one vectorized pass"""
+        ROUTE_LEGS.inc(len(pairs), source='fallback')
+        origins = [origin for origin, _ in pairs]
+        destinations = [destination for _, destination in pairs]
+        distances = geodesic.pairwise_distances(origins, destinations)
+
+        routes = []
+        for origin, destination, distance in zip(origins, destinations, distances.tolist()):
+            # Great-circle geometry sampled every FALLBACK_SAMPLE_MILES
+            fractions = np.linspace(0, 1, max(2, int(distance / FALLBACK_SAMPLE_MILES) + 2))
+            lats, lngs = geodesic.interpolate(
+                origin['lat'], origin['lng'], destination['lat'], destination['lng'], fractions
+            )
+            routes.append({
                 'distance': distance,
-                'duration': distance / 55
-            }]
-        }
+                'duration': distance / FALLBACK_SPEED_MPH,
+                'polyline': polyline_codec.encode(zip(lats.tolist(), lngs.tolist())),
+                'fallback': True,
+                'steps': [{
+                    'instruction': f'Drive from origin to destination',
+                    'distance': distance,
+                    'duration': distance / FALLBACK_SPEED_MPH
+                }]
+            })
+        return routes
     
     def process_steps(self, steps):
         """Process OSRM route steps into simplified format"""
@@ -262,223 +718,35 @@ class RouteCalculator:
             })
         return processed
     
-    def generate_stops_and_logs(self, current_loc, pickup_loc, dropoff_loc, 
-                                total_distance, current_cycle_used, trip_data):
+    def generate_stops_and_logs(self, waypoints, legs, current_cycle_used, trip_data,
+                                geometry=None, snap_stops=True):
         """Generate planned stops and ELD logs based on DOT regulations"""
-        stops = []
-        eld_logs = []
-        
-        # Calculate number of fuel stops needed
-        num_fuel_stops = max(0, int(total_distance / FUEL_STOP_INTERVAL))
-        
-        # Generate route stops
-        all_stops = self.create_route_stops(
-            current_loc, pickup_loc, dropoff_loc, 
-            total_distance, num_fuel_stops
+        return self.create_scheduler(
+            waypoints, legs, current_cycle_used, trip_data, geometry=geometry,
+            snap_stops=snap_stops
+        ).run()
+
+    def create_scheduler(self, waypoints, legs, current_cycle_used, trip_data, geometry=None,
+                         snap_stops=True):
+        """Build the hours-of-service scheduler for a routed trip"""
+        geometry = geometry or RouteGeometry.from_legs(waypoints, legs)
+        return HOSScheduler(
+            waypoints, legs,
+            start_time=trip_data.get('start_time') or default_start_time(),
+            trip_data=trip_data,
+            current_cycle_used=current_cycle_used,
+            # Stops land on the routed polyline at the mile where they occur
+            locate=geometry.locate,
+            stop_finder=self.create_stop_finder(geometry) if snap_stops else None
+        )
+
+    def create_stop_finder(self, geometry):
+        """Truck-stop lookup along the route, or None when no dataset is configured"""
+        index = get_truck_stop_index()
+        if index is None:
+            return None
+        return RouteStopFinder(
+            index, geometry,
+            max_detour=getattr(settings, 'TRUCK_STOP_MAX_DETOUR', DEFAULT_MAX_DETOUR_MILES),
+            max_backtrack=getattr(settings, 'TRUCK_STOP_MAX_BACKTRACK', DEFAULT_MAX_BACKTRACK_MILES)
         )
-        
-        for stop in all_stops:
-            stops.append(stop)
-        
-        # Generate ELD logs
-        eld_logs = self.create_daily_logs(stops, trip_data)
-        
-        return stops, eld_logs
-    
-    def create_route_stops(self, current_loc, pickup_loc, dropoff_loc, total_distance, num_fuel_stops):
-        """Create route stops including fuel and rest stops"""
-        stops = []
-        
-        if total_distance == 0:
-            return stops
-        
-        current_position = current_loc.copy()
-        miles_so_far = 0
-        current_time = datetime.now().replace(hour=6, minute=0, second=0, microsecond=0)
-        
-        # Add pickup if exists
-        if pickup_loc:
-            stops.append({
-                'location': {'name': 'Pickup Location', **pickup_loc},
-                'stop_type': 'pickup',
-                'arrival_time': current_time.isoformat(),
-                'departure_time': (current_time + timedelta(hours=1)).isoformat(),
-                'duration': 1,
-                'miles_driven': miles_so_far,
-                'notes': 'Pickup cargo - 1 hour allowed'
-            })
-            current_position = pickup_loc
-            current_time += timedelta(hours=1)
-        
-        # Create driving segments with fuel and rest stops
-        if total_distance > 0:
-            num_segments = max(1, num_fuel_stops + 1)
-            segment_distance = total_distance / num_segments
-            
-            for i in range(num_segments):
-                # Driving segment
-                drive_end = current_time + timedelta(hours=segment_distance / 55)
-                stops.append({
-                    'location': {'name': f'Drive - Segment {i+1}', **current_position},
-                    'stop_type': 'driving',
-                    'arrival_time': current_time.isoformat(),
-                    'departure_time': drive_end.isoformat(),
-                    'duration': round(segment_distance / 55, 2),
-                    'miles_driven': round(miles_so_far + segment_distance, 1),
-                    'notes': f'Drive {segment_distance:.1f} miles'
-                })
-                
-                miles_so_far += segment_distance
-                current_time = drive_end
-                
-                # Add fuel stop (except last segment)
-                if i < num_segments - 1 and num_fuel_stops > 0:
-                    fuel_position = self.calculate_midpoint(current_position, dropoff_loc)
-                    stops.append({
-                        'location': {'name': f'Fuel Stop #{i+1}', **fuel_position},
-                        'stop_type': 'fuel',
-                        'arrival_time': current_time.isoformat(),
-                        'departure_time': (current_time + timedelta(hours=0.5)).isoformat(),
-                        'duration': 0.5,
-                        'miles_driven': round(miles_so_far, 1),
-                        'notes': 'Refuel vehicle - 30 minutes'
-                    })
-                    current_time += timedelta(hours=0.5)
-                    current_position = fuel_position
-                
-                # Add rest stop after every 11 hours driving (except last segment)
-                if i < num_segments - 1:
-                    rest_position = self.calculate_midpoint(current_position, dropoff_loc)
-                    stops.append({
-                        'location': {'name': 'Rest Stop', **rest_position},
-                        'stop_type': 'rest',
-                        'arrival_time': current_time.isoformat(),
-                        'departure_time': (current_time + timedelta(hours=10)).isoformat(),
-                        'duration': 10,
-                        'miles_driven': round(miles_so_far, 1),
-                        'notes': 'Required 10-hour rest break (DOT)'
-                    })
-                    current_time += timedelta(hours=10)
-                    current_position = rest_position
-        
-        # Add dropoff
-        stops.append({
-            'location': {'name': 'Dropoff Location', **dropoff_loc},
-            'stop_type': 'dropoff',
-            'arrival_time': current_time.isoformat(),
-            'departure_time': (current_time + timedelta(hours=1)).isoformat(),
-            'duration': 1,
-            'miles_driven': round(total_distance, 1),
-            'notes': 'Drop off cargo - 1 hour allowed'
-        })
-        
-        return stops
-    
-    def calculate_midpoint(self, current, destination):
-        """Calculate intermediate position along route"""
-        return {
-            'lat': current['lat'] + (destination['lat'] - current['lat']) * 0.5,
-            'lng': current['lng'] + (destination['lng'] - current['lng']) * 0.5
-        }
-    
-    def create_daily_logs(self, stops, trip_data):
-        """Create daily ELD logs based on DOT format"""
-        daily_logs = []
-        
-        # Group stops by day
-        day_stops = {}
-        current_day = 1
-        
-        for stop in stops:
-            if stop['stop_type'] in ['driving', 'fuel', 'rest']:
-                if current_day not in day_stops:
-                    day_stops[current_day] = []
-                day_stops[current_day].append(stop)
-                
-                # Add new day after rest
-                if stop['stop_type'] == 'rest':
-                    current_day += 1
-        
-        # Ensure at least one day
-        if not day_stops:
-            day_stops[1] = []
-        
-        total_days = len(day_stops)
-        
-        for day in range(1, total_days + 1):
-            log_date = datetime.now().date() + timedelta(days=day-1)
-            
-            entries = []
-            day_stops_list = day_stops.get(day, [])
-            total_day_miles = sum(s.get('miles_driven', 0) - (day_stops_list[0].get('miles_driven', 0) if day_stops_list else 0) for s in day_stops_list) or 0
-            
-            # Standard DOT log entries for the day
-            entries.append({
-                'time': f'{6 + (day-1)*24:02d}:00',
-                'status': 'off_duty',
-                'location': 'Start of day',
-                'miles': 0,
-                'hours_remaining': 10
-            })
-            
-            entries.append({
-                'time': f'{6 + (day-1)*24 + 0.5:.0f}:30',
-                'status': 'on_duty',
-                'location': 'Pre-trip inspection',
-                'miles': 0,
-                'hours_remaining': 10
-            })
-            
-            entries.append({
-                'time': f'{7 + (day-1)*24:02d}:00',
-                'status': 'driving',
-                'location': 'Begin driving',
-                'miles': 0,
-                'hours_remaining': 11
-            })
-            
-            # Add driving entries for the day
-            driving_hours = 0
-            for stop in day_stops_list:
-                if stop['stop_type'] == 'driving':
-                    driving_hours += stop.get('duration', 0)
-                    if driving_hours <= 11:
-                        entries.append({
-                            'time': f'{8 + (day-1)*24 + driving_hours:02d}:00',
-                            'status': 'driving',
-                            'location': stop.get('notes', 'Driving'),
-                            'miles': stop.get('miles_driven', 0),
-                            'hours_remaining': round(11 - driving_hours, 1)
-                        })
-            
-            entries.append({
-                'time': f'{17 + (day-1)*24:02d}:00',
-                'status': 'driving',
-                'location': 'End driving',
-                'miles': total_day_miles,
-                'hours_remaining': 0
-            })
-            
-            entries.append({
-                'time': f'{18 + (day-1)*24:02d}:00',
-                'status': 'sleeper',
-                'location': 'Overnight rest',
-                'miles': total_day_miles,
-                'hours_remaining': 10
-            })
-            
-            daily_log = {
-                'log_date': log_date.isoformat(),
-                'driver_id': trip_data.get('driver_id', 'DRV001'),
-                'carrier_name': trip_data.get('carrier_name', 'Test Carrier'),
-                'truck_number': trip_data.get('truck_number', 'TRK001'),
-                'total_miles': round(total_day_miles, 1),
-                'cycle_hours_used': round(driving_hours, 1),
-                'status_entries': entries,
-                'day_number': day,
-                'total_trip_days': total_days
-            }
-            
-            daily_logs.append(daily_log)
-        
-        return daily_logs
@@ -0,0 +1,250 @@
+"""Planning pipeline benchmarks against a synthetic OSRM.
+
+Run from the backend directory:
+
+    python -m perf.bench --output perf/baseline.json
+    python -m perf.bench --compare perf/baseline.json
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'api.settings')
+os.environ.setdefault('ROUTE_CACHE_DIR', tempfile.mkdtemp(prefix='eld-bench-routes-'))
+# Exercise truck-stop snapping with the bundled sample facilities
+os.environ.setdefault('TRUCK_STOPS_PATH', os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'api', 'data', 'truck_stops.csv'
+))
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.db import connection  # noqa: E402
+from django.test.utils import CaptureQueriesContext, setup_test_environment  # noqa: E402
+from rest_framework.test import APIClient  # noqa: E402
+
+from api.models import Trip  # noqa: E402
+from api.osrm import get_osrm_client  # noqa: E402
+from api.persistence import save_trip_plan  # noqa: E402
+from api.plan_cache import get_plan_cache  # noqa: E402
+from api.route_cache import get_route_cache  # noqa: E402
+from api.serializers import TripInputSerializer, TripSerializer  # noqa: E402
+from api.views import TRIP_DETAIL_PREFETCH, TRIP_LOCATION_FIELDS, RouteCalculator  # noqa: E402
+
+from .osrm_stub import StubSession, lane  # noqa: E402
+
+TRIP_MILES = (150, 800, 3200)  # Short haul, regional, cross-country
+LEG_COUNTS = (1, 3)
+DB_SIZES = (0, 500)  # Trips already in the database
+PERCENTILES = (50, 95, 99)
+START_TIME = '2024-03-04T06:00:00Z'  # Fixed so every run plans the same schedule
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    rank = (len(ordered) - 1) * pct / 100
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def trip_input(miles, legs, seed=0):
+    points = lane(miles, legs, seed)
+    body = {
+        'waypoints': [{'lat': p['lat'], 'lng': p['lng']} for p in points],
+        'current_cycle_used': 20,
+        'start_time': START_TIME,
+    }
+    serializer = TripInputSerializer(data=body)
+    serializer.is_valid(raise_exception=True)
+    return body, serializer.validated_data
+
+
+def clear_caches():
+    get_plan_cache().clear()
+    get_route_cache().clear()
+
+
+def measure(fn, repeat, setup=None):
+    """Time fn() `repeat` times, then run it once more under tracemalloc and query capture"""
+    # Warm-up run: imports, lazy singletons, connection setup
+    if setup is not None:
+        setup()
+    fn()
+    samples = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        gc.disable()
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+        gc.enable()
+
+    if setup is not None:
+        setup()
+    tracemalloc.start()
+    with CaptureQueriesContext(connection) as queries:
+        value = fn()
+    # Taken while the return value is alive, so its blocks are counted too
+    snapshot = tracemalloc.take_snapshot()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del value
+    stats = snapshot.statistics('filename')
+
+    result = {f'p{pct}_ms': round(percentile(samples, pct), 3) for pct in PERCENTILES}
+    result.update({
+        'mean_ms': round(sum(samples) / len(samples), 3),
+        'samples': len(samples),
+        'allocated_blocks': sum(stat.count for stat in stats),
+        'peak_kib': round(peak / 1024, 1),
+        'queries': len(queries.captured_queries),
+    })
+    return result
+
+
+def seed_trips(count):
+    """Grow the trips table to `count` rows with realistic child rows"""
+    missing = count - Trip.objects.count()
+    if missing <= 0:
+        return
+    clear_caches()
+    data = trip_input(800, 1, seed=99)[1]
+    result = RouteCalculator().calculate(data)
+    for _ in range(missing):
+        save_trip_plan(data, result)
+
+
+def run_suite(repeat, trip_miles=TRIP_MILES, leg_counts=LEG_COUNTS, db_sizes=DB_SIZES):
+    calculator = RouteCalculator()
+    client = APIClient()
+    results = {}
+
+    for miles in trip_miles:
+        for legs in leg_counts:
+            body, data = trip_input(miles, legs)
+            tag = f'{miles}mi-{legs}leg'
+            results[f'calculate/cold/{tag}'] = measure(
+                lambda: calculator.calculate(data), repeat, setup=clear_caches
+            )
+            results[f'calculate/cached/{tag}'] = measure(lambda: calculator.calculate(data), repeat)
+
+            waypoints = calculator.get_waypoints(data)
+            clear_caches()
+            fetched = calculator.fetch_legs(waypoints)
+            results[f'hos_schedule/{tag}'] = measure(
+                lambda: calculator.generate_stops_and_logs(
+                    waypoints, fetched, data['current_cycle_used'], data
+                ), repeat
+            )
+
+    for size in db_sizes:
+        seed_trips(size)
+        for miles in trip_miles:
+            body, data = trip_input(miles, 1)
+            results[f'create_trip/{miles}mi/db{size}'] = measure(
+                lambda: client.post('/api/trips/create_trip/', body, format='json'),
+                repeat, setup=clear_caches
+            )
+        trip = Trip.objects.order_by('-id').first()
+        results[f'serialize_trip/db{size}'] = measure(
+            lambda: TripSerializer(
+                Trip.objects.select_related(*TRIP_LOCATION_FIELDS)
+                .prefetch_related(*TRIP_DETAIL_PREFETCH).get(pk=trip.pk)
+            ).data,
+            repeat
+        )
+        results[f'list_trips/db{size}'] = measure(lambda: client.get('/api/trips/'), repeat)
+    return results
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline, threshold):
+    """Print per-case deltas against a baseline; returns the names of regressed cases"""
+    regressions = []
+    print(f"\n{'case':<40} {'p50 ms':>10} {'base':>10} {'delta':>8} {'queries':>8}")
+    for name, current in results.items():
+        previous = baseline.get('results', {}).get(name)
+        if previous is None:
+            print(f"{name:<40} {current['p50_ms']:>10.2f} {'-':>10} {'new':>8} {current['queries']:>8}")
+            continue
+        delta = (current['p50_ms'] - previous['p50_ms']) / previous['p50_ms'] if previous['p50_ms'] else 0
+        regressed = delta > threshold or current['queries'] > previous['queries']
+        if regressed:
+            regressions.append(name)
+        print(f"{name:<40} {current['p50_ms']:>10.2f} {previous['p50_ms']:>10.2f} "
+              f"{delta:>+7.0%} {current['queries']:>8}{'  REGRESSION' if regressed else ''}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=20, help='Timed runs per case (default 20)')
+    parser.add_argument('--quick', action='store_true',
+                        help='Fewer cases: short and cross-country trips, empty database only')
+    parser.add_argument('--output', help='Write results to this JSON file')
+    parser.add_argument('--compare', help='Baseline JSON file to compare against')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='p50 slowdown counted as a regression (default 0.2 = 20%%)')
+    args = parser.parse_args(argv)
+
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0)
+    client = get_osrm_client()
+    original_session, client.session = client.session, StubSession()
+    try:
+        if args.quick:
+            results = run_suite(args.repeat, trip_miles=(150, 3200), leg_counts=(1,), db_sizes=(0,))
+        else:
+            results = run_suite(args.repeat)
+    finally:
+        client.session = original_session
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    report = {
+        'meta': {
+            'revision': git_revision(),
+            'created_at': datetime.now(timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'repeat': args.repeat,
+        },
+        'results': results,
+    }
+    if not args.compare:
+        print(f"{'case':<40} {'p50 ms':>10} {'p95 ms':>10} {'p99 ms':>10} {'allocs':>9} {'queries':>8}")
+        for name, r in results.items():
+            print(f"{name:<40} {r['p50_ms']:>10.2f} {r['p95_ms']:>10.2f} {r['p99_ms']:>10.2f} "
+                  f"{r['allocated_blocks']:>9} {r['queries']:>8}")
+    if args.output:
+        with open(args.output, 'w') as handle:
+            json.dump(report, handle, indent=2)
+    if args.compare:
+        with open(args.compare) as handle:
+            regressions = compare(results, json.load(handle), args.threshold)
+        if regressions:
+            print(f'\n{len(regressions)} case(s) regressed')
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,233 @@
+"""Drive concurrent load at the planning API and report throughput, latency and errors.
+
+    python -m perf.loadtest --base-url http://127.0.0.1:8000 --rps 20 --duration 60
+    python -m perf.loadtest --replay traffic.jsonl --rps 50 --concurrency 32
+    python -m perf.loadtest --with-osrm-stub --osrm-latency 0.05 ...   # also start a stand-in OSRM
+
+Replay files hold one request per line: either {"path": ..., "body": {...}}
+or a bare trip payload, which is sent to /api/calculate-route/.
+"""
+import argparse
+import itertools
+import json
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+CALCULATE_PATH = '/api/calculate-route/'
+CREATE_PATH = '/api/trips/create_trip/'
+HUBS_PATH = os.path.join(os.path.dirname(__file__), '..', 'api', 'data', 'sample_graph.json')
+PERCENTILES = (50, 90, 95, 99)
+
+
+def load_replay(path):
+    """Requests from a JSONL traffic log, as (path, body) pairs"""
+    entries = []
+    with open(path) as handle:
+        for line in handle:
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            if 'body' in record:
+                entries.append((record.get('path', CALCULATE_PATH), record['body']))
+            else:
+                entries.append((CALCULATE_PATH, record))
+    if not entries:
+        raise SystemExit(f'No requests found in {path}')
+    return entries
+
+
+def synthesize(count, lanes, zipf, create_ratio, seed):
+    """Requests over `lanes` distinct hub-to-hub lanes with Zipf-distributed popularity.
+
+    A few hot lanes get most of the traffic, like a dispatcher's board. The
+    share create_ratio of requests go to create_trip, the rest to calculate-route.
+    """
+    with open(HUBS_PATH) as handle:
+        hubs = json.load(handle)['nodes']
+    rng = random.Random(seed)
+    pairs = [(a, b) for a in hubs for b in hubs if a is not b]
+    rng.shuffle(pairs)
+    pairs = pairs[:lanes]
+    weights = [1 / (rank + 1) ** zipf for rank in range(len(pairs))]
+
+    entries = []
+    for origin, destination in rng.choices(pairs, weights=weights, k=count):
+        body = {
+            'current_location': {'lat': origin['lat'], 'lng': origin['lng']},
+            'dropoff_location': {'lat': destination['lat'], 'lng': destination['lng']},
+            'current_cycle_used': rng.choice((0, 10, 25, 40, 55)),
+        }
+        path = CREATE_PATH if rng.random() < create_ratio else CALCULATE_PATH
+        entries.append((path, body))
+    return entries
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    rank = (len(ordered) - 1) * pct / 100
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+class LoadRunner:
+    """Open-loop load: requests are scheduled at a fixed rate, whatever the latency.
+
+    Latency is measured from each request's scheduled start, so time spent
+    queued behind busy workers is included (no coordinated omission).
+    """
+
+    def __init__(self, base_url, entries, rps, concurrency, timeout=60):
+        self.base_url = base_url.rstrip('/')
+        self.entries = entries
+        self.rps = rps
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.service = defaultdict(list)
+        self.statuses = defaultdict(Counter)
+        self.errors = Counter()
+
+    def session(self):
+        if not hasattr(self.local, 'session'):
+            self.local.session = requests.Session()
+        return self.local.session
+
+    def send(self, path, body, scheduled):
+        started = time.perf_counter()
+        try:
+            response = self.session().post(self.base_url + path, json=body, timeout=self.timeout)
+            status = response.status_code
+            error = None if status < 400 else f'HTTP {status}'
+        except requests.RequestException as exc:
+            status, error = None, type(exc).__name__
+        finished = time.perf_counter()
+        with self.lock:
+            self.latencies[path].append(finished - scheduled)
+            self.service[path].append(finished - started)
+            self.statuses[path][status or 'exception'] += 1
+            if error:
+                self.errors[error] += 1
+
+    def run(self, duration=None, total=None):
+        """Send until `duration` seconds pass or `total` requests are sent"""
+        interval = 1.0 / self.rps
+        source = itertools.cycle(self.entries)
+        sent = 0
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            while True:
+                scheduled = started + sent * interval
+                if (total is not None and sent >= total) or (
+                        duration is not None and scheduled - started >= duration):
+                    break
+                delay = scheduled - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                path, body = next(source)
+                executor.submit(self.send, path, body, scheduled)
+                sent += 1
+        self.elapsed = time.perf_counter() - started
+        return self.report()
+
+    def report(self):
+        endpoints = {}
+        for path, samples in sorted(self.latencies.items()):
+            endpoints[path] = {
+                'requests': len(samples),
+                'status_codes': {str(k): v for k, v in self.statuses[path].items()},
+                **{f'p{pct}_ms': round(percentile(samples, pct) * 1000, 1) for pct in PERCENTILES},
+                'max_ms': round(max(samples) * 1000, 1),
+                'service_p50_ms': round(percentile(self.service[path], 50) * 1000, 1),
+            }
+        everything = [s for samples in self.latencies.values() for s in samples]
+        requests_sent = len(everything)
+        failed = sum(self.errors.values())
+        return {
+            'target_rps': self.rps,
+            'concurrency': self.concurrency,
+            'elapsed_seconds': round(self.elapsed, 2),
+            'requests': requests_sent,
+            'throughput_rps': round(requests_sent / self.elapsed, 2) if self.elapsed else 0.0,
+            'error_rate': round(failed / requests_sent, 4) if requests_sent else 0.0,
+            'errors': dict(self.errors),
+            **{f'p{pct}_ms': round(percentile(everything, pct) * 1000, 1) for pct in PERCENTILES},
+            'max_ms': round(max(everything, default=0) * 1000, 1),
+            'endpoints': endpoints,
+        }
+
+
+def print_report(report):
+    print(f"\n{report['requests']} requests in {report['elapsed_seconds']} s - "
+          f"{report['throughput_rps']} req/s (target {report['target_rps']}, "
+          f"concurrency {report['concurrency']})")
+    print(f"error rate {report['error_rate']:.2%}  {report['errors'] or ''}")
+    print(f"\n{'endpoint':<28} {'reqs':>6} {'p50':>8} {'p90':>8} {'p95':>8} {'p99':>8} {'max':>8}  codes")
+    rows = list(report['endpoints'].items()) + [('all', report)]
+    for path, r in rows:
+        codes = ' '.join(f'{k}:{v}' for k, v in r.get('status_codes', {}).items())
+        print(f"{path:<28} {r['requests']:>6} {r['p50_ms']:>8} {r['p90_ms']:>8} {r['p95_ms']:>8} "
+              f"{r['p99_ms']:>8} {r['max_ms']:>8}  {codes}")
+    print('(latencies in ms, measured from each request\'s scheduled start)')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--base-url', default='http://127.0.0.1:8000')
+    parser.add_argument('--rps', type=float, default=10, help='Target request rate')
+    parser.add_argument('--concurrency', type=int, default=16, help='Requests in flight at most')
+    parser.add_argument('--duration', type=float, default=30, help='Seconds to run')
+    parser.add_argument('--requests', type=int, default=None, help='Stop after this many requests')
+    parser.add_argument('--timeout', type=float, default=60, help='Per-request timeout in seconds')
+    parser.add_argument('--replay', help='JSONL file of recorded requests to replay in order')
+    parser.add_argument('--lanes', type=int, default=50, help='Distinct synthetic lanes')
+    parser.add_argument('--zipf', type=float, default=1.1, help='Lane popularity skew (0 = uniform)')
+    parser.add_argument('--create-ratio', type=float, default=0.1,
+                        help='Share of synthetic requests sent to create_trip')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='Also write the report as JSON to this file')
+    parser.add_argument('--with-osrm-stub', action='store_true',
+                        help='Start a local OSRM stand-in (point the API at the printed URL)')
+    parser.add_argument('--osrm-port', type=int, default=5050)
+    parser.add_argument('--osrm-latency', type=float, default=0.05)
+    parser.add_argument('--osrm-jitter', type=float, default=0.05)
+    parser.add_argument('--osrm-error-rate', type=float, default=0.0)
+    args = parser.parse_args(argv)
+
+    if args.with_osrm_stub:
+        from .osrm_server import serve_in_thread
+        _, osrm_url = serve_in_thread(
+            args.osrm_port, latency=args.osrm_latency, jitter=args.osrm_jitter,
+            error_rate=args.osrm_error_rate, seed=args.seed,
+        )
+        print(f'Stub OSRM on {osrm_url} - the API must run with OSRM_BASE_URL={osrm_url}')
+
+    if args.replay:
+        entries = load_replay(args.replay)
+    else:
+        count = args.requests or max(1, int(args.rps * args.duration))
+        entries = synthesize(count, args.lanes, args.zipf, args.create_ratio, args.seed)
+
+    runner = LoadRunner(args.base_url, entries, args.rps, args.concurrency, args.timeout)
+    report = runner.run(duration=None if args.requests else args.duration, total=args.requests)
+    print_report(report)
+    if args.output:
+        with open(args.output, 'w') as handle:
+            json.dump(report, handle, indent=2)
+    return 1 if report['requests'] and report['error_rate'] == 1 else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
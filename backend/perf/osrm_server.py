@@ -0,0 +1,110 @@
+"""Local HTTP server that impersonates OSRM, for load tests.
+
+    python -m perf.osrm_server --port 5050 --latency 0.05 --jitter 0.03 --error-rate 0.01
+
+Then start Django with OSRM_BASE_URL=http://127.0.0.1:5050.
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+from .osrm_stub import handle
+
+
+class StubOSRMServer(ThreadingHTTPServer):
+    """Threaded OSRM stand-in with configurable latency and error injection"""
+    daemon_threads = True
+
+    def __init__(self, address, latency=0.0, jitter=0.0, error_rate=0.0, timeout_rate=0.0,
+                 seed=None, quiet=True):
+        super().__init__(address, _Handler)
+        self.latency = latency  # Base seconds added to every response
+        self.jitter = jitter  # Extra uniform random delay, 0..jitter seconds
+        self.error_rate = error_rate  # Fraction of requests answered with HTTP 503
+        self.timeout_rate = timeout_rate  # Fraction of requests that hang past client timeouts
+        self.quiet = quiet
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.counts = {'requests': 0, 'errors': 0, 'timeouts': 0}
+
+    def draw(self):
+        """Decide delay and fault for one request: returns (delay, fault)"""
+        with self.lock:
+            self.counts['requests'] += 1
+            delay = self.latency + self.random.uniform(0, self.jitter)
+            roll = self.random.random()
+            if roll < self.timeout_rate:
+                self.counts['timeouts'] += 1
+                return 60.0, 'timeout'
+            if roll < self.timeout_rate + self.error_rate:
+                self.counts['errors'] += 1
+                return delay, 'error'
+            return delay, None
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # Keep-alive, like the real server
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        delay, fault = self.server.draw()
+        time.sleep(delay)
+        if fault == 'error':
+            status, payload = 503, {'code': 'Unavailable', 'message': 'Injected error'}
+        else:
+            status, payload = handle(url.path, dict(parse_qsl(url.query)))
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=UTF-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        if not self.server.quiet:
+            super().log_message(format, *args)
+
+
+def serve_in_thread(port=0, **options):
+    """Start a stand-in server on a background thread; returns (server, base_url)"""
+    server = StubOSRMServer(('127.0.0.1', port), **options)
+    threading.Thread(target=server.serve_forever, name='osrm-stub', daemon=True).start()
+    host, port = server.server_address
+    return server, f'http://{host}:{port}'
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Serve synthetic OSRM route/table responses')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5050)
+    parser.add_argument('--latency', type=float, default=0.0, help='Base delay in seconds')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Extra random delay, 0..jitter s')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction answered with 503')
+    parser.add_argument('--timeout-rate', type=float, default=0.0,
+                        help='Fraction that stall for 60 s (exercises client timeouts)')
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--verbose', action='store_true', help='Log every request')
+    args = parser.parse_args(argv)
+
+    server = StubOSRMServer(
+        (args.host, args.port), latency=args.latency, jitter=args.jitter,
+        error_rate=args.error_rate, timeout_rate=args.timeout_rate, seed=args.seed,
+        quiet=not args.verbose,
+    )
+    print(f'Stub OSRM listening on http://{args.host}:{args.port}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(f"Served {server.counts['requests']} requests "
+              f"({server.counts['errors']} errors, {server.counts['timeouts']} timeouts injected)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,165 @@
+import json
+import math
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+
+import numpy as np
+
+from api import geodesic
+from api import polyline as polyline_codec
+
+ROAD_FACTOR = 1.2  # Road miles per great-circle mile
+SPEED_MPH = 55  # Average truck speed for durations
+VERTEX_SPACING_MILES = 0.1  # OSRM full overviews carry roughly 10 vertices per mile
+STEP_MILES = 40  # One maneuver every this many miles
+METERS_PER_MILE = 1609.344
+
+
+def parse_coordinates(coordinates):
+    """'lng,lat;lng,lat' path segment into a list of lat/lng dicts"""
+    points = []
+    for pair in coordinates.split(';'):
+        lng, lat = pair.split(',')
+        points.append({'lat': float(lat), 'lng': float(lng)})
+    return points
+
+
+def _miles(origin, destination):
+    return float(geodesic.haversine(
+        origin['lat'], origin['lng'], destination['lat'], destination['lng']
+    )) * ROAD_FACTOR
+
+
+def route_response(points, vertex_spacing=VERTEX_SPACING_MILES):
+    """An OSRM 'route' payload through the given points.
+
+    Legs follow the great circle with a road-distance factor and a vertex
+    every vertex_spacing miles, so geometry sizes match what the public
+    server returns for overview=full.
+    """
+    legs, coords, total_miles = [], [], 0.0
+    for origin, destination in zip(points, points[1:]):
+        miles = _miles(origin, destination)
+        fractions = np.linspace(0, 1, max(2, int(miles / vertex_spacing) + 1))
+        lats, lngs = geodesic.interpolate(
+            origin['lat'], origin['lng'], destination['lat'], destination['lng'], fractions
+        )
+        coords.extend(zip(lats.tolist()[1 if coords else 0:], lngs.tolist()[1 if coords else 0:]))
+        count = max(1, int(miles / STEP_MILES))
+        legs.append({
+            'distance': miles * METERS_PER_MILE,
+            'duration': miles / SPEED_MPH * 3600,
+            'steps': [{
+                'name': f'I-{10 + i % 90}',
+                'distance': miles / count * METERS_PER_MILE,
+                'duration': miles / count / SPEED_MPH * 3600,
+                'maneuver': {'instruction': 'Continue'},
+            } for i in range(count)],
+        })
+        total_miles += miles
+    return {
+        'code': 'Ok',
+        'routes': [{
+            'distance': total_miles * METERS_PER_MILE,
+            'duration': total_miles / SPEED_MPH * 3600,
+            'geometry': polyline_codec.encode(coords),
+            'legs': legs,
+        }],
+        'waypoints': [{'location': [p['lng'], p['lat']]} for p in points],
+    }
+
+
+def table_response(points, sources, destinations):
+    """An OSRM 'table' payload with duration and distance annotations"""
+    origins = [points[i] for i in sources]
+    targets = [points[i] for i in destinations]
+    meters = geodesic.distance_matrix(origins, targets) * ROAD_FACTOR * METERS_PER_MILE
+    return {
+        'code': 'Ok',
+        'distances': meters.tolist(),
+        'durations': (meters / METERS_PER_MILE / SPEED_MPH * 3600).tolist(),
+    }
+
+
+def _indexes(value, default):
+    if not value or value == 'all':
+        return default
+    return [int(i) for i in value.split(';')]
+
+
+def handle(path, params):
+    """Answer an OSRM request path such as /route/v1/driving/<coords>; returns (status, payload)"""
+    parts = path.strip('/').split('/')
+    if len(parts) != 4 or parts[1] != 'v1':
+        return 400, {'code': 'InvalidUrl', 'message': f'Unsupported path {path}'}
+    service, coordinates = parts[0], parts[3]
+    try:
+        points = parse_coordinates(coordinates)
+    except ValueError:
+        return 400, {'code': 'InvalidQuery', 'message': 'Bad coordinates'}
+    if service == 'route':
+        return 200, route_response(points)
+    if service == 'table':
+        everything = list(range(len(points)))
+        return 200, table_response(
+            points,
+            _indexes(params.get('sources'), everything),
+            _indexes(params.get('destinations'), everything),
+        )
+    return 400, {'code': 'InvalidService', 'message': f'Unsupported service {service}'}
+
+
+class StubResponse:
+    def __init__(self, status_code, payload):
+        self.status_code = status_code
+        self._body = json.dumps(payload)
+
+    def json(self):
+        return json.loads(self._body)
+
+
+class StubSession:
+    """Drop-in for OSRMClient.session that answers from handle() in-process.
+
+    latency adds a sleep per request (seconds, or a (low, high) range) and
+    error_rate returns HTTP 503 for that fraction of requests.
+    """
+
+    def __init__(self, latency=0.0, error_rate=0.0, seed=0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    def get(self, url, params=None, timeout=None):
+        with self._lock:
+            self.requests += 1
+            delay = self.random.uniform(*self.latency) if isinstance(self.latency, tuple) \
+                else self.latency
+            fail = self.random.random() < self.error_rate
+        if delay:
+            time.sleep(delay)
+        if fail:
+            return StubResponse(503, {'code': 'Unavailable', 'message': 'Injected error'})
+        return StubResponse(*handle(urlsplit(url).path, params or {}))
+
+    def close(self):
+        pass
+
+
+def lane(miles, legs=1, seed=0):
+    """Deterministic waypoints for a trip of roughly `miles` road miles over `legs` legs"""
+    rng = random.Random(seed)
+    lat, lng = rng.uniform(33, 45), rng.uniform(-118, -100)
+    bearing = math.radians(rng.uniform(60, 120))  # Head roughly east
+    step = miles / ROAD_FACTOR / legs / 69.0  # Degrees of latitude per leg
+    points = [{'lat': lat, 'lng': lng}]
+    for _ in range(legs):
+        lat += step * math.cos(bearing)
+        lng += step * math.sin(bearing) / math.cos(math.radians(lat))
+        points.append({'lat': round(lat, 5), 'lng': round(lng, 5)})
+    points[0] = {'lat': round(points[0]['lat'], 5), 'lng': round(points[0]['lng'], 5)}
+    return points